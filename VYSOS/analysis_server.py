@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+A long lived image analysis service.  The server imports the analysis stack
+(matplotlib, astropy, mongoengine, SIDRE) and connects to the mongo database
+once, then runs measure_image on each image path submitted to it over a local
+socket and returns the resulting Image document as a plain dict.
+
+Results and errors are sent back as standard library types (dicts, strings,
+numbers and datetimes), so clients only need this module and the standard
+library and submitting an image does not pay the import cost of the analysis
+stack.
+"""
+
+import sys
+import os
+from argparse import ArgumentParser
+import logging
+from multiprocessing.connection import Listener, Client
+
+address = ('localhost', 6000)
+authkey = b'vysos'
+
+
+##-------------------------------------------------------------------------
+## Submit an Image to the Server
+##-------------------------------------------------------------------------
+def submit_image(file, nographics=True, record=True, verbose=False,
+                 force=False):
+    '''
+    Send an image path to a running analysis server and wait for the result.
+    Returns the fields of the Image document as a dict.  Raises ConnectionRefusedError if no server
+    is running and RuntimeError if the analysis failed on the server.
+    '''
+    with Client(address, authkey=authkey) as conn:
+        conn.send({'file': os.path.abspath(os.path.expanduser(file)),
+                   'nographics': nographics,
+                   'record': record,
+                   'verbose': verbose,
+                   'force': force,
+                  })
+        result = conn.recv()
+    if isinstance(result, Exception):
+        raise RuntimeError(f'Analysis server failed on {file}: {result}')
+    return result
+
+
+def server_is_running():
+    try:
+        with Client(address, authkey=authkey) as conn:
+            conn.send({'ping': True})
+            return conn.recv() == 'pong'
+    except (ConnectionRefusedError, FileNotFoundError, EOFError):
+        return False
+
+
+##-------------------------------------------------------------------------
+## Serve Requests
+##-------------------------------------------------------------------------
+def serve(logger):
+    logger.info('Importing analysis tools')
+    import mongoengine as me
+    from VYSOS.measure_image import measure_image, result_cache_report
+    logger.info('Connecting to mongo db at 192.168.1.101')
+    me.connect('vysos', host='192.168.1.101')
+
+    logger.info(f'Listening for images on {address[0]}:{address[1]}')
+    with Listener(address, authkey=authkey) as listener:
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception as e:
+                logger.warning(f'Failed to accept connection: {e}')
+                continue
+            with conn:
+                try:
+                    request = conn.recv()
+                except EOFError:
+                    continue
+                if request.get('ping', False) is True:
+                    conn.send('pong')
+                    continue
+                file = request['file']
+                logger.info(f'Analyzing {file}')
+                try:
+                    result = measure_image(file,
+                                           nographics=request['nographics'],
+                                           record=request['record'],
+                                           verbose=request['verbose'],
+                                           force=request.get('force', False))
+                    if result is not None:
+                        result = result.to_mongo().to_dict()
+                        result.pop('_id', None)
+                except Exception as e:
+                    logger.warning(f'  MeasureImage failed on {file}')
+                    logger.error(sys.exc_info())
+                    ## The client may not be able to import the exception type
+                    result = RuntimeError(f'{type(e).__name__}: {e}')
+                logger.info(f'  {result_cache_report()}')
+                try:
+                    conn.send(result)
+                except Exception as e:
+                    logger.warning(f'  Could not return result: {e}')
+
+
+def main():
+    ##-------------------------------------------------------------------------
+    ## Parse Command Line Arguments
+    ##-------------------------------------------------------------------------
+    parser = ArgumentParser(description="Resident image analysis server")
+    ## add flags
+    parser.add_argument("-v", "--verbose",
+        action="store_true", dest="verbose",
+        default=False, help="Be verbose! (default = False)")
+    args = parser.parse_args()
+
+    ##-------------------------------------------------------------------------
+    ## Create Logger Object
+    ##-------------------------------------------------------------------------
+    logger = logging.getLogger('analysis_server')
+    logger.setLevel(logging.DEBUG)
+    ## Set up console output
+    LogConsoleHandler = logging.StreamHandler()
+    if args.verbose:
+        LogConsoleHandler.setLevel(logging.DEBUG)
+    else:
+        LogConsoleHandler.setLevel(logging.INFO)
+    LogFormat = logging.Formatter('%(asctime)23s %(levelname)8s: %(message)s')
+    LogConsoleHandler.setFormatter(LogFormat)
+    logger.addHandler(LogConsoleHandler)
+
+    serve(logger)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Cache of master calibration frames keyed by (telescope, date, type).
+
+Masters are kept on disk as .npy files and loaded as memory mapped arrays
+into a small in-process LRU cache, so a night of images stacks each master
+once and every later frame reuses it.  A cached master is rebuilt when the
+raw calibration frames it was made from change (new frames arrive).
+"""
+
+import os
+import json
+import glob
+from collections import OrderedDict
+from datetime import datetime as dt
+
+import numpy as np
+from astropy.nddata import CCDData
+
+cache_path = os.path.join('/Users/vysosuser/V20Data', 'MasterCache')
+
+## Telescopes whose raw calibration frames can be found
+telescopes = ['V5', 'V20']
+
+
+##-------------------------------------------------------------------------
+## Raw Calibration Frames
+##-------------------------------------------------------------------------
+def raw_frames(telescope, date_string, type):
+    '''
+    Return the list of raw calibration frames of the given type for a night.
+    '''
+    path = os.path.join(os.path.expanduser('~'), f'{telescope}Data', 'Images',
+                        date_string)
+    files = glob.glob(os.path.join(path, f'*{type}*.fts'))
+    files.extend(glob.glob(os.path.join(path, f'*{type}*.fts.fz')))
+    return sorted(files)
+
+
+def frames_signature(files):
+    '''
+    A cheap signature of a set of raw frames used to notice new arrivals.
+    '''
+    mtimes = [os.path.getmtime(f) for f in files if os.path.exists(f)]
+    return [len(mtimes), max(mtimes) if len(mtimes) > 0 else 0]
+
+
+##-------------------------------------------------------------------------
+## Master Cache
+##-------------------------------------------------------------------------
+class MasterCache(object):
+    def __init__(self, path=cache_path, size=4, check_interval=60):
+        self.path = path
+        self.size = size
+        self.check_interval = check_interval
+        self.masters = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def filenames(self, key):
+        telescope, date_string, type = key
+        base = os.path.join(self.path, f'{telescope}_{date_string}_{type}')
+        return f'{base}.npy', f'{base}.json'
+
+    def is_stale(self, key, entry):
+        '''
+        Rescan the raw frames at most once per check_interval.
+        '''
+        now = dt.utcnow()
+        if (now - entry['checked']).total_seconds() < self.check_interval:
+            return False
+        entry['checked'] = now
+        signature = frames_signature(raw_frames(*key))
+        return signature != entry['signature']
+
+    def load(self, key):
+        '''
+        Load a master from the on disk cache if it matches the raw frames.
+        Returns (entry, stale) where entry is None if there is no cached
+        master and stale is True if there is one but the raw frames have
+        changed since it was made.
+        '''
+        datafile, infofile = self.filenames(key)
+        if not os.path.exists(datafile) or not os.path.exists(infofile):
+            return None, False
+        with open(infofile, 'r') as f:
+            info = json.load(f)
+        if info['signature'] != frames_signature(raw_frames(*key)):
+            return None, True
+        return {'data': np.load(datafile, mmap_mode='r'),
+                'unit': info['unit'],
+                'signature': info['signature'],
+                'checked': dt.utcnow()}, False
+
+    def save(self, key, master):
+        '''
+        Write a master to the on disk cache and return it memory mapped.
+        '''
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+        datafile, infofile = self.filenames(key)
+        signature = frames_signature(raw_frames(*key))
+        unit = str(master.unit) if master.unit is not None else 'adu'
+        np.save(datafile, np.asarray(master.data))
+        with open(infofile, 'w') as f:
+            json.dump({'signature': signature, 'unit': unit}, f)
+        return {'data': np.load(datafile, mmap_mode='r'),
+                'unit': unit,
+                'signature': signature,
+                'checked': dt.utcnow()}
+
+    def get(self, telescope, date_string, type, build):
+        '''
+        Return the master for (telescope, date_string, type) as a CCDData
+        object.  Raises ValueError if telescope is not one of telescopes.
+        build(rebuild) is called to stack the master when it is not
+        cached or is stale (rebuild=True), and should return a CCDData or None.
+        '''
+        if telescope not in telescopes:
+            raise ValueError(f'No {type} master for unknown telescope {telescope}')
+        key = (telescope, date_string, type)
+        entry = self.masters.get(key, None)
+        stale = (entry is not None and self.is_stale(key, entry))
+        if stale:
+            entry = None
+        elif entry is None:
+            entry, stale = self.load(key)
+        if entry is None:
+            self.misses += 1
+            master = build(stale)
+            if not master:
+                return None
+            entry = self.save(key, master)
+        else:
+            self.hits += 1
+        self.masters[key] = entry
+        self.masters.move_to_end(key)
+        while len(self.masters) > self.size:
+            self.masters.popitem(last=False)
+        return CCDData(entry['data'], unit=entry['unit'])
+
+    def invalidate(self, telescope, date_string, type):
+        '''
+        Drop a master from memory and disk so the next get rebuilds it.
+        '''
+        key = (telescope, date_string, type)
+        self.masters.pop(key, None)
+        for file in self.filenames(key):
+            if os.path.exists(file):
+                os.remove(file)
+
+
+master_cache = MasterCache()
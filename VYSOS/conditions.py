@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Safe, warn and unsafe classification of weather values against
+VYSOS.weather_limits.  Each entry of weather_limits is [warn, unsafe]: values
+below the first limit are safe and values at or above the second are unsafe.
+Where the limits decrease (as for rain, where a higher reading is drier) the
+direction is inverted, so values above the first limit are safe and values at
+or below the second are unsafe.
+
+classify works on whole arrays and returns category codes which the plots
+color with category_colors.  describe gives the condition strings used by the
+status pages for the current values.
+"""
+
+import numpy as np
+
+from VYSOS import weather_limits
+
+## Category codes
+SAFE = 0
+WARN = 1
+UNSAFE = 2
+UNKNOWN = 3
+
+## Colors for each category code, in code order
+category_colors = ['green', 'yellow', 'red', 'red']
+
+## Condition strings (in code order) for the current value of each field
+conditions = {'cloud': ('clouds', 'Cloudiness (C)', ['Clear', 'Cloudy', 'Overcast', 'Unknown']),
+              'wind': ('wind', 'Wind (kph)', ['Calm', 'Windy', 'Very Windy', 'Unknown']),
+              'gust': ('gust', 'Wind (kph)', ['Calm', 'Windy', 'Very Windy', 'Unknown']),
+              'rain': ('rain', 'Rain', ['Dry', 'Wet', 'Wet', 'Unknown']),
+             }
+
+## The status pages show any rain as a problem
+condition_colors = {'rain': ['green', 'red', 'red', 'red']}
+
+
+def classify(values, label, limits=weather_limits):
+    '''
+    Return an integer array of category codes (SAFE, WARN, UNSAFE or UNKNOWN
+    for NaN) for values against limits[label].
+    '''
+    values = np.asarray(values, dtype=float)
+    warn, unsafe = limits[label]
+    codes = np.full(values.shape, UNKNOWN, dtype=int)
+    if warn <= unsafe:
+        codes[values < warn] = SAFE
+        codes[(values >= warn) & (values < unsafe)] = WARN
+        codes[values >= unsafe] = UNSAFE
+    else:
+        codes[values > warn] = SAFE
+        codes[(values <= warn) & (values > unsafe)] = WARN
+        codes[values <= unsafe] = UNSAFE
+    return codes
+
+
+def describe(weatherdata):
+    '''
+    Return (condition, color) dicts of the condition string and its color
+    for the cloud, wind, gust and rain values in weatherdata.
+    '''
+    condition = {}
+    color = {}
+    for name, (field, label, strings) in conditions.items():
+        try:
+            value = float(weatherdata[field])
+        except (KeyError, TypeError, ValueError):
+            value = np.nan
+        code = int(classify(value, label))
+        condition[name] = strings[code]
+        color[name] = condition_colors.get(name, category_colors)[code]
+    return condition, color
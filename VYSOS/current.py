@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Latest value store for the telemetry collections.  The most recent sample
+from each source is kept as a single document (with the source collection
+name as its _id) in currentweather or currentstatus, upserted by the
+producers on every sample, so readers get the current values with one
+lookup by _id instead of sorting the whole collection.
+"""
+
+## Latest value collection for each telemetry collection
+current_collections = {'weather': 'currentweather',
+                       'V5status': 'currentstatus',
+                       'V20status': 'currentstatus',
+                      }
+
+
+def update_current(db, source, doc):
+    '''
+    Replace the latest value document for source with doc.
+    '''
+    current = dict(doc)
+    current['_id'] = source
+    current.pop('deadband', None)
+    db[current_collections[source]].replace_one({'_id': source}, current,
+                                                upsert=True)
+
+
+def read_current(db, source):
+    '''
+    Return the latest value document for source, or None.
+    '''
+    return db[current_collections[source]].find_one({'_id': source})
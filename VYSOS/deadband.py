@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Deadband (change only) compression for telemetry documents.  A sample is only
+stored when one of its fields has moved by more than that field's threshold
+since the last stored sample, or when heartbeat seconds have passed.  Stored
+samples carry a 'deadband' entry with the heartbeat and sampling cadence so
+that readers can reconstruct the step-wise series with expand_documents.
+"""
+
+from datetime import timedelta as tdelta
+
+## Thresholds for each kind of telemetry.  Fields which are not listed (for
+## example booleans and strings) are stored whenever they change at all.
+deadbands = {'weather': {'clouds': 0.5,
+                         'temp': 0.2,
+                         'wind': 2.0,
+                         'gust': 2.0,
+                         'rain': 50,
+                         'light': 10,
+                        },
+             'status': {'alt': 0.1,
+                        'az': 0.1,
+                        'RA': 0.01,
+                        'DEC': 0.01,
+                        'focuser_temperature': 0.2,
+                        'truss_temperature': 0.2,
+                        'primary_temperature': 0.2,
+                        'secondary_temperature': 0.2,
+                        'fan_speed': 5,
+                       },
+            }
+
+## Fields which are never compared
+ignore_fields = ['_id', 'date', 'querydate', 'deadband']
+
+## Readers query this many seconds before the start of their window so that
+## a compressed sample which still holds at the start is found.  Heartbeats
+## should not be longer than this.
+max_heartbeat = 3600
+
+
+class DeadbandEncoder(object):
+    def __init__(self, thresholds, heartbeat=300, cadence=20):
+        '''
+        cadence is the nominal number of seconds between samples, used when
+        the series is reconstructed.
+        '''
+        self.thresholds = thresholds
+        self.heartbeat = heartbeat
+        self.cadence = cadence
+        self.last = None
+        self.nsamples = 0
+        self.nstored = 0
+
+    def changed(self, doc):
+        keys = set(doc.keys()) - set(ignore_fields)
+        if keys != set(self.last.keys()) - set(ignore_fields):
+            return True
+        for key in keys:
+            threshold = self.thresholds.get(key, None)
+            if threshold is not None:
+                try:
+                    if abs(float(doc[key]) - float(self.last[key])) > threshold:
+                        return True
+                    continue
+                except (TypeError, ValueError):
+                    pass
+            if doc[key] != self.last[key]:
+                return True
+        return False
+
+    def encode(self, doc):
+        '''
+        Return the document to store for this sample, or None if the sample
+        does not need to be stored.
+        '''
+        self.nsamples += 1
+        if self.last is not None\
+           and (doc['date'] - self.last['date']).total_seconds() < self.heartbeat\
+           and not self.changed(doc):
+            return None
+        doc = dict(doc)
+        doc['deadband'] = {'heartbeat': self.heartbeat, 'cadence': self.cadence}
+        self.last = doc
+        self.nstored += 1
+        return doc
+
+    def reset(self):
+        '''
+        Store the next sample regardless of the last one, for example after
+        a gap in the samples.
+        '''
+        self.last = None
+
+    def report(self):
+        return f'Stored {self.nstored:d} of {self.nsamples:d} samples'
+
+
+##-------------------------------------------------------------------------
+## Reconstruct Step-wise Series
+##-------------------------------------------------------------------------
+def hold(doc, date):
+    '''
+    Return a copy of doc dated date.
+    '''
+    held = dict(doc)
+    held['date'] = date
+    return held
+
+
+def expand_documents(docs, start=None, end=None):
+    '''
+    Reconstruct the sampled series from documents, some of which may be
+    deadband compressed.  Each compressed document is repeated at its cadence
+    until the next document, its heartbeat, or end (whichever is first) so a
+    gap longer than the heartbeat still shows as missing data.  Documents
+    without a deadband entry are returned as they are.  The result is sorted
+    by date and trimmed to start if given.
+    '''
+    docs = sorted(docs, key=lambda doc: doc['date'])
+    expanded = []
+    for i, doc in enumerate(docs):
+        expanded.append(doc)
+        if 'deadband' not in doc.keys():
+            continue
+        cadence = tdelta(0, doc['deadband']['cadence'])
+        until = doc['date'] + tdelta(0, doc['deadband']['heartbeat'])
+        if end is not None:
+            until = min(until, end)
+        following = docs[i+1]['date'] if i+1 < len(docs) else None
+        date = doc['date'] + cadence
+        while date <= until and (following is None or date < following):
+            expanded.append(hold(doc, date))
+            date += cadence
+    if start is not None:
+        expanded = [doc for doc in expanded if doc['date'] >= start]
+    return expanded
+
+
+def current_document(doc, now):
+    '''
+    Return the latest stored document as the current sample at now.  A
+    compressed document still holds its values until its heartbeat expires.
+    '''
+    if doc is None or 'deadband' not in doc.keys():
+        return doc
+    held = expand_documents([doc], end=now)
+    return held[-1]
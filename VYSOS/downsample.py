@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Min/max per pixel downsampling for time series plots.  The time range shown
+on an axes is split into one bucket per pixel column and only the samples
+with the lowest and highest value in each bucket are drawn.  At most two
+markers land in any pixel column, so the rendered plot looks the same as
+one drawn from every sample (spikes and dips are kept) while the number of
+markers, and so the render time, depends on the width of the axes rather
+than on the length of the window.
+"""
+
+import numpy as np
+from matplotlib.dates import date2num
+
+
+def pixel_width(axes):
+    '''
+    Return the width of axes in pixels at the figure dpi.
+    '''
+    return max(int(axes.get_window_extent().width), 1)
+
+
+def minmax_indices(x, y, start, end, nbuckets):
+    '''
+    Return the sorted indices of the samples with the minimum and maximum y
+    in each of nbuckets equal buckets of x between start and end.  Samples
+    outside start to end or with a non-finite y are dropped.  If there are
+    no more than two samples per bucket, all of them are returned.
+    '''
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    inside = np.flatnonzero((x >= start) & (x <= end) & np.isfinite(y))
+    if len(inside) <= 2*nbuckets:
+        return inside
+    bucket = ((x[inside] - start) / (end - start) * nbuckets).astype(int)
+    bucket = np.clip(bucket, 0, nbuckets-1)
+    ## Order by bucket then by value: the first and last of each bucket are
+    ## its minimum and maximum
+    order = np.lexsort((y[inside], bucket))
+    bucket = bucket[order]
+    firsts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    lasts = np.r_[firsts[1:] - 1, len(order) - 1]
+    return np.unique(inside[order[np.r_[firsts, lasts]]])
+
+
+def thin(axes, times, columns, rows, start, end):
+    '''
+    Return the subset of the boolean mask rows to draw on axes between the
+    datetimes start and end: the minimum and maximum of each of columns
+    (arrays aligned with times) in each pixel column.
+    '''
+    index = np.flatnonzero(rows)
+    x = date2num(list(times[index]))
+    keep = np.zeros(len(index), dtype=bool)
+    nbuckets = pixel_width(axes)
+    for column in columns:
+        y = np.asarray(column, dtype=float)[index]
+        keep[minmax_indices(x, y, date2num(start), date2num(end), nbuckets)] = True
+    mask = np.zeros(len(rows), dtype=bool)
+    mask[index[keep]] = True
+    return mask
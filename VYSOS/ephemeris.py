@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Sun and moon ephemeris for the observatory site.  Rise, set and twilight
+times are computed once per UT date and memoized in memory and in a JSON file
+on disk, so plotters and status pages which run every few seconds do not
+repeat the ephem searches.  Entries for dates more than retention days in the
+past are left out when the file is written.
+
+Nights are named by the UT date on which they end, as elsewhere in VYSOS: the
+night of 20180101UT runs from sunset at about 04:30 UT to sunrise at about
+16:00 UT on 2018-01-01.
+"""
+
+import os
+import json
+import threading
+from datetime import datetime as dt
+from datetime import timedelta as tdelta
+
+import ephem
+
+cache_file = os.path.expanduser('~/.vysos_ephemeris.json')
+retention = 30
+
+## Events computed for each UT date, in the order they occur during the night
+sun_events = [('sunset', '0.0', False, 'previous_setting'),
+              ('evening_civil_twilight', '-6.0', True, 'previous_setting'),
+              ('evening_nautical_twilight', '-12.0', True, 'previous_setting'),
+              ('evening_astronomical_twilight', '-18.0', True, 'previous_setting'),
+              ('morning_astronomical_twilight', '-18.0', True, 'next_rising'),
+              ('morning_nautical_twilight', '-12.0', True, 'next_rising'),
+              ('morning_civil_twilight', '-6.0', True, 'next_rising'),
+              ('sunrise', '0.0', False, 'next_rising'),
+             ]
+
+## Shading used for the sky after each event when overplotting twilights
+twilight_alpha = {'sunset': 0.1,
+                  'evening_civil_twilight': 0.2,
+                  'evening_nautical_twilight': 0.3,
+                  'evening_astronomical_twilight': 0.5,
+                  'morning_astronomical_twilight': 0.3,
+                  'morning_nautical_twilight': 0.2,
+                  'morning_civil_twilight': 0.1,
+                  'sunrise': 0.0,
+                 }
+
+_events = {}
+_loaded = False
+_lock = threading.Lock()
+
+
+def site():
+    '''
+    Return an ephem.Observer for the observatory.
+    '''
+    Observatory = ephem.Observer()
+    Observatory.lon = "-155:34:33.9"
+    Observatory.lat = "+19:32:09.66"
+    Observatory.elevation = 3400.0
+    Observatory.temp = 10.0
+    Observatory.pressure = 680.0
+    Observatory.horizon = '0.0'
+    return Observatory
+
+
+##-------------------------------------------------------------------------
+## Compute Events for a UT Date
+##-------------------------------------------------------------------------
+def compute_events(date_string):
+    '''
+    Return a dict of event name to datetime (UT) for the night ending on the
+    UT date date_string.  moonrise and moonset are the moon events during the
+    UT date, or None if there is none.
+    '''
+    date = dt.strptime(date_string, '%Y%m%dUT')
+    Observatory = site()
+    TheSun = ephem.Sun()
+    events = {}
+    for name, horizon, use_center, search in sun_events:
+        Observatory.horizon = horizon
+        Observatory.date = date + tdelta(0, 10*60*60)
+        events[name] = getattr(Observatory, search)(TheSun,
+                                                    use_center=use_center).datetime()
+    Observatory.horizon = '0.0'
+    TheMoon = ephem.Moon()
+    for name, search in [('moonrise', 'next_rising'), ('moonset', 'next_setting')]:
+        Observatory.date = date
+        try:
+            event = getattr(Observatory, search)(TheMoon).datetime()
+        except (ephem.AlwaysUpError, ephem.NeverUpError):
+            event = None
+        events[name] = event if event is not None and event < date + tdelta(1, 0) else None
+    Observatory.date = date + tdelta(0, 10*60*60)
+    TheMoon.compute(Observatory)
+    events['moon_phase'] = TheMoon.phase
+    return events
+
+
+##-------------------------------------------------------------------------
+## Memoization
+##-------------------------------------------------------------------------
+def _load():
+    global _loaded
+    _loaded = True
+    try:
+        with open(cache_file, 'r') as FO:
+            stored = json.load(FO)
+    except (OSError, ValueError):
+        return
+    for date_string, events in stored.items():
+        _events[date_string] = {key: dt.strptime(val, '%Y-%m-%dT%H:%M:%S.%f')
+                                     if isinstance(val, str) else val
+                                for key, val in events.items()}
+
+
+def _save():
+    '''
+    Write the events to the cache file.  Dates more than retention days in the
+    past are left out of the file but kept in memory, so historical nights
+    can still be looked up (and are recomputed by the next process).
+    '''
+    oldest = (dt.utcnow() - tdelta(retention, 0)).strftime('%Y%m%dUT')
+    stored = {date_string: {key: val.strftime('%Y-%m-%dT%H:%M:%S.%f')
+                                 if isinstance(val, dt) else val
+                            for key, val in events.items()}
+              for date_string, events in _events.items()
+              if date_string >= oldest}
+    tmp_file = f'{cache_file}.{os.getpid()}'
+    try:
+        with open(tmp_file, 'w') as FO:
+            json.dump(stored, FO)
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        pass
+
+
+def night_events(date_string):
+    '''
+    Return the (memoized) events for the night ending on UT date date_string.
+    '''
+    with _lock:
+        if not _loaded:
+            _load()
+        events = _events.get(date_string, None)
+        if events is None:
+            events = compute_events(date_string)
+            _events[date_string] = events
+            _save()
+        return events
+
+
+def events_between(start, end):
+    '''
+    Return a sorted list of (datetime, name) for the sun and moon events
+    between start and end.
+    '''
+    found = []
+    date = start - tdelta(1, 0)
+    while date <= end + tdelta(1, 0):
+        for name, when in night_events(date.strftime('%Y%m%dUT')).items():
+            if isinstance(when, dt) and when >= start and when <= end:
+                found.append((when, name))
+        date += tdelta(1, 0)
+    found.sort()
+    return found
+
+
+def next_event(name, now=None):
+    '''
+    Return the time of the next sunrise, sunset, moonrise, ... after now.
+    '''
+    if now is None:
+        now = dt.utcnow()
+    for when, event in events_between(now, now + tdelta(3, 0)):
+        if event == name:
+            return when
+    return None
+
+
+def twilight_spans(start, end):
+    '''
+    Return a list of (begin, end, alpha) covering start to end for shading
+    the night and twilights on plots.
+    '''
+    events = [(when, name) for when, name in events_between(start - tdelta(1, 0), end)
+              if name in twilight_alpha.keys()]
+    alpha = 0.0
+    for when, name in events:
+        if when <= start:
+            alpha = twilight_alpha[name]
+    spans = []
+    begin = start
+    for when, name in events:
+        if when <= start:
+            continue
+        spans.append((begin, when, alpha))
+        begin = when
+        alpha = twilight_alpha[name]
+    spans.append((begin, end, alpha))
+    return spans
+
+
+##-------------------------------------------------------------------------
+## Current Sun and Moon
+##-------------------------------------------------------------------------
+def sun_and_moon(now=None):
+    '''
+    Return the sun and moon dicts used by the status pages: altitude and
+    state now plus the next rise and set times.
+    '''
+    if now is None:
+        now = dt.utcnow()
+    Observatory = site()
+    Observatory.date = now
+    TheSun = ephem.Sun()
+    TheSun.compute(Observatory)
+    sun = {}
+    sun['alt'] = float(TheSun.alt) * 180. / ephem.pi
+    sun['set'] = next_event('sunset', now)
+    sun['rise'] = next_event('sunrise', now)
+    if sun['alt'] <= -18:
+        sun['now'] = 'night'
+    elif sun['alt'] > -18 and sun['alt'] <= -12:
+        sun['now'] = 'astronomical twilight'
+    elif sun['alt'] > -12 and sun['alt'] <= -6:
+        sun['now'] = 'nautical twilight'
+    elif sun['alt'] > -6 and sun['alt'] <= 0:
+        sun['now'] = 'civil twilight'
+    elif sun['alt'] > 0:
+        sun['now'] = 'day'
+
+    TheMoon = ephem.Moon()
+    TheMoon.compute(Observatory)
+    moon = {}
+    moon['phase'] = TheMoon.phase
+    moon['alt'] = TheMoon.alt * 180. / ephem.pi
+    moon['set'] = next_event('moonset', now)
+    moon['rise'] = next_event('moonrise', now)
+    if moon['alt'] > 0:
+        moon['now'] = 'up'
+    else:
+        moon['now'] = 'down'
+
+    return sun, moon
+
+
+def moon_altitudes(times):
+    '''
+    Return the moon altitude (degrees) and phase (percent) at each time.
+    '''
+    Observatory = site()
+    TheMoon = ephem.Moon()
+    alts = []
+    phases = []
+    for time in times:
+        Observatory.date = time
+        TheMoon.compute(Observatory)
+        alts.append(TheMoon.alt * 180. / ephem.pi)
+        phases.append(TheMoon.phase)
+    return alts, phases
@@ -10,11 +10,23 @@ import logging
 import time
 import datetime
 import re
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
 import numpy as np
-import pymongo
 
-import win32com.client
-import pywintypes
+from VYSOS.spool import TelemetrySpool
+from VYSOS.deadband import DeadbandEncoder, deadbands
+
+## The ASCOM/COM layer is only available on Windows.  Elsewhere devices can
+## be supplied through the dispatch argument of StatusCollector.
+try:
+    import win32com.client
+    import pythoncom
+    from pywintypes import com_error
+except ImportError:
+    win32com = None
+    pythoncom = None
+    com_error = Exception
 
 # import mongoengine as me
 # from VYSOS.schema import telstatus
@@ -22,10 +34,11 @@ import pywintypes
 ##-------------------------------------------------------------------------
 ## Query ASCOM ACPHub for Telescope Position and State
 ##-------------------------------------------------------------------------
-def get_telescope_info(status, logger):
+def get_telescope_info(status, logger, ACP=None):
     logger.info('Getting ACP status')
     try:
-        ACP = win32com.client.Dispatch("ACP.Telescope")
+        if ACP is None:
+            ACP = win32com.client.Dispatch("ACP.Telescope")
     except:
         logger.error('Could not connect to ACP ASCOM object.')
         return status
@@ -51,7 +64,7 @@ def get_telescope_info(status, logger):
                 logger.info('  ACP target Dec = {:.4f}'.format(status['DEC']))
             except:
                 logger.info('  Could not get target info')
-    except pywintypes.com_error as err:
+    except com_error as err:
         logger.warning('COM error:')
         logger.warning('  {}'.format(err.message))
         status['ACPerr'] = '{}'.format(err.message)
@@ -65,10 +78,11 @@ def get_telescope_info(status, logger):
 ##-------------------------------------------------------------------------
 ## Query ASCOM Focuser for Position, Temperature, Fan State
 ##-------------------------------------------------------------------------
-def get_focuser_info(status, logger):
+def get_focuser_info(status, logger, FocusMax=None):
     logger.info('Getting ASCOM focuser status')
     try:
-        FocusMax = win32com.client.Dispatch("FocusMax.Focuser")
+        if FocusMax is None:
+            FocusMax = win32com.client.Dispatch("FocusMax.Focuser")
         if not FocusMax.Link:
             try:
                 FocusMax.Link = True
@@ -107,11 +121,13 @@ def get_focuser_info(status, logger):
 ##-------------------------------------------------------------------------
 ## Query RCOS TCC
 ##-------------------------------------------------------------------------
-def get_RCOS_info(status, logger):
+def get_RCOS_info(status, logger, RCOST=None, RCOSF=None):
     logger.info('Getting RCOS TCC status')
     try:
-        RCOST = win32com.client.Dispatch("RCOS_AE.Temperature")
-        RCOSF = win32com.client.Dispatch("RCOS_AE.Focuser")
+        if RCOST is None:
+            RCOST = win32com.client.Dispatch("RCOS_AE.Temperature")
+        if RCOSF is None:
+            RCOSF = win32com.client.Dispatch("RCOS_AE.Focuser")
         logger.debug('  Connected to RCOS focuser')
     except:
         logger.error('Could not connect to RCOS ASCOM object.')
@@ -200,45 +216,170 @@ def control_by_web(status, logger):
     return status
 
 
-def get_status_and_log(telescope, logger):
-
-    ##-------------------------------------------------------------------------
-    ## Get Status Info
-    ##-------------------------------------------------------------------------
-    logger.info('#### Starting Status Queries ####')
-    status = {'telescope': telescope,
-              'date':datetime.datetime.utcnow()
-             }
-    status = get_telescope_info(status, logger)
-    status = get_focuser_info(status, logger)
-    if telescope == 'V20':
-        status = get_RCOS_info(status, logger)
-
-    ##-------------------------------------------------------------------------
-    ## Write to Mongo
-    ##-------------------------------------------------------------------------
-    done = False
-    while done is False:
+##-------------------------------------------------------------------------
+## Device Readers
+##-------------------------------------------------------------------------
+class DeviceReader(object):
+    '''
+    Reads one device on its own long lived thread.  The COM handles for the
+    device are created and used only on that thread.  Each handle is health
+    checked by reading one property before use and is only dispatched again
+    if that fails.
+
+    read(status, logger, *handles) is one of the get_*_info functions and
+    progids lists the ASCOM objects it needs, in order.
+    '''
+    ## Property read to check that each device handle still works
+    health_checks = {'ACP.Telescope': 'Connected',
+                     'FocusMax.Focuser': 'Link',
+                     'RCOS_AE.Temperature': 'AmbientTemp',
+                     'RCOS_AE.Focuser': 'Position',
+                    }
+
+    def __init__(self, name, progids, read, deadline, logger, dispatch):
+        self.name = name
+        self.progids = progids
+        self.read = read
+        self.deadline = deadline
+        self.logger = logger
+        self.dispatch = dispatch
+        self.handles = {}
+        self.future = None
+        self.last = {}
+        self.last_date = None
+        initializer = pythoncom.CoInitialize if pythoncom is not None else None
+        self.executor = ThreadPoolExecutor(max_workers=1, initializer=initializer)
+
+    def handle(self, progid):
+        handle = self.handles.get(progid, None)
+        if handle is not None:
+            try:
+                getattr(handle, self.health_checks[progid])
+                return handle
+            except:
+                self.logger.warning(f'{progid} handle failed health check, reconnecting')
+                self.handles.pop(progid)
         try:
-            logger.info('Connecting to mongo db at 192.168.1.101')
-            client = pymongo.MongoClient('192.168.1.101', 27017)
-            db = client.vysos
-            status_collection = db['{}status'.format(telescope)]
+            self.logger.info(f'Connecting to {progid}')
+            handle = self.dispatch(progid)
         except:
-            logger.error('Failed to connect to mongo')
+            self.logger.error(f'Could not connect to {progid} ASCOM object.')
+            return None
+        self.handles[progid] = handle
+        return handle
+
+    def query(self):
+        handles = [self.handle(progid) for progid in self.progids]
+        if None in handles:
+            ## Treated like a failed read, so the last values are kept and
+            ## marked stale
+            raise ConnectionError(f'{self.name} is not reachable')
+        return self.read({}, self.logger, *handles)
+
+    def start(self):
+        '''
+        Start a read unless the previous one is still running (hung).
+        '''
+        if self.future is None or self.future.done():
+            self.future = self.executor.submit(self.query)
+
+    def result(self, start):
+        '''
+        Wait until deadline seconds after start for the read.  Returns the
+        values and whether they are stale (the last good values, because the
+        read is late or failed).
+        '''
+        timeout = max(0, self.deadline - (time.time() - start))
+        try:
+            values = self.future.result(timeout=timeout)
+        except FutureTimeoutError:
+            self.logger.warning(f'{self.name} missed its {self.deadline:.0f} s deadline')
+            return self.last, True
+        except:
+            self.logger.warning(f'{self.name} query failed')
+            self.logger.warning(sys.exc_info())
+            return self.last, True
+        self.last = values
+        self.last_date = datetime.datetime.utcnow()
+        return values, False
+
+
+##-------------------------------------------------------------------------
+## Long Lived Status Collector
+##-------------------------------------------------------------------------
+class StatusCollector(object):
+    '''
+    Queries all devices for a telescope concurrently and keeps the device
+    handles open between status cycles.  Status documents are written
+    through the telemetry spool so a mongo outage does not stop sampling.  A device
+    which misses its deadline does not hold up the others: its last good
+    values are used and listed in the 'stale' entry of the status document
+    with the date they were read (or the device name is listed with None if
+    it has never been read).
+
+    If heartbeat is given, status documents are deadband compressed and only
+    stored when a value changes or heartbeat seconds have passed.
+    '''
+    def __init__(self, telescope, logger, dispatch=None, heartbeat=None,
+                 interval=20):
+        self.telescope = telescope
+        self.logger = logger
+        encoders = {}
+        if heartbeat is not None:
+            encoders[f'{telescope}status'] = DeadbandEncoder(deadbands['status'],
+                                                 heartbeat=heartbeat,
+                                                 cadence=interval)
+        self.spool = TelemetrySpool(f'{telescope}status', logger,
+                                    encoders=encoders)
+        if dispatch is None:
+            dispatch = win32com.client.Dispatch
+        self.readers = [DeviceReader('ACP', ['ACP.Telescope'],
+                                     get_telescope_info, 5, logger, dispatch),
+                        DeviceReader('FocusMax', ['FocusMax.Focuser'],
+                                     get_focuser_info, 5, logger, dispatch),
+                       ]
+        if telescope == 'V20':
+            self.readers.append(DeviceReader('RCOS',
+                                     ['RCOS_AE.Temperature', 'RCOS_AE.Focuser'],
+                                     get_RCOS_info, 10, logger, dispatch))
+
+    def get_status(self):
+        start = time.time()
+        status = {'telescope': self.telescope,
+                  'date':datetime.datetime.utcnow()
+                 }
+        for reader in self.readers:
+            reader.start()
+        stale = {}
+        for reader in self.readers:
+            values, is_stale = reader.result(start)
+            status.update(values)
+            if is_stale:
+                for key in values.keys():
+                    stale[key] = reader.last_date
+                if len(values) == 0:
+                    stale[reader.name] = None
+        if len(stale) > 0:
+            status['stale'] = stale
+        return status
+
+    def get_status_and_log(self):
+        self.logger.info('#### Starting Status Queries ####')
+        status = self.get_status()
+        spooled_id = self.spool.put('{}status'.format(self.telescope), status)
+        if spooled_id is None:
+            self.logger.info("  Status unchanged, not stored")
         else:
-            ## Save new "current" document
-            try:
-                inserted_id = status_collection.insert_one(status).inserted_id
-                logger.info("  Inserted document id: {}".format(inserted_id))
-                done = True
-            except:
-                e = sys.exc_info()[0]
-                logger.error('Failed to add new document')
-                logger.error('Will wait 10 seconds and try again')
-                logger.error(e)
-                time.sleep(10)
-            client.close()
+            self.logger.info("  Spooled document id: {}".format(spooled_id))
+
+
+def get_status_and_log(telescope, logger):
+    '''
+    Run a single status cycle with freshly opened device handles.
+    '''
+    collector = StatusCollector(telescope, logger)
+    collector.get_status_and_log()
+    collector.spool.flush()
 
 
 if __name__ == '__main__':
@@ -258,6 +399,12 @@ if __name__ == '__main__':
         type=str, dest="telescope", default='',
         choices=['V5', 'V20', ''], required=False,
         help="The telescope system we are querying.  Will query weather if not specified.")
+    parser.add_argument("-i", "--interval",
+        type=float, dest="interval", default=20,
+        help="Seconds between status cycles (default = 20)")
+    parser.add_argument("--deadband",
+        type=float, dest="heartbeat", default=None,
+        help="Only store status when it changes, or after this many seconds.")
     args = parser.parse_args()
 
     telescope = args.telescope
@@ -283,9 +430,12 @@ if __name__ == '__main__':
         logger.addHandler(LogConsoleHandler)
 
 
+    collector = StatusCollector(telescope, logger, heartbeat=args.heartbeat,
+                                interval=args.interval)
     run = True
     while run:
-        get_status_and_log(telescope, logger)
+        tick = time.time()
+        collector.get_status_and_log()
 #         run = False
         logging.shutdown()
-        time.sleep(20)
+        time.sleep(max(0, args.interval - (time.time() - tick)))
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Ingest queue for new images.  Files are only queued once they have finished
+being written, and are dispatched to a bounded pool of analysis workers,
+newest first when the queue backs up.
+"""
+
+import os
+import time
+from collections import deque
+from concurrent.futures import wait, FIRST_COMPLETED
+from datetime import datetime as dt
+
+
+##-------------------------------------------------------------------------
+## Write Completion
+##-------------------------------------------------------------------------
+class CompletionTracker(object):
+    '''
+    A file is considered complete when its size is a whole number of 2880
+    byte FITS blocks and its size and modification time have not changed for
+    settle seconds.
+    '''
+    def __init__(self, settle=1.0):
+        self.settle = settle
+        self.seen = {}
+
+    def is_complete(self, path):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            self.seen.pop(path, None)
+            return False
+        now = time.time()
+        signature = (stat.st_size, stat.st_mtime)
+        if stat.st_size == 0 or stat.st_size % 2880 != 0:
+            self.seen[path] = (signature, now)
+            return False
+        if now - stat.st_mtime >= self.settle:
+            self.seen.pop(path, None)
+            return True
+        previous = self.seen.get(path, None)
+        if previous is not None and previous[0] == signature\
+           and now - previous[1] >= self.settle:
+            self.seen.pop(path, None)
+            return True
+        if previous is None or previous[0] != signature:
+            self.seen[path] = (signature, now)
+        return False
+
+
+##-------------------------------------------------------------------------
+## Analysis Queue
+##-------------------------------------------------------------------------
+class IngestQueue(object):
+    def __init__(self, executor, analyze, workers):
+        '''
+        analyze(path) is run on executor for each queued file with at most
+        workers files in flight at once.  Files are queued in groups (one per
+        telescope) and free workers go to the group with the fewest files in
+        flight, so a busy telescope can not starve the others.
+        '''
+        self.executor = executor
+        self.analyze = analyze
+        self.workers = workers
+        self.pending = {}
+        self.running = {}
+        self.inflight = {}
+        self.waits = deque(maxlen=100)
+        self.completed = deque()
+        self.nfailed = 0
+
+    def put(self, path, filetime, group=None):
+        '''
+        Queue a file.  filetime is used to order the queue within a group
+        (newest first).
+        '''
+        if path not in self.pending.keys()\
+           and path not in [p for p, g in self.running.values()]:
+            self.pending[path] = (filetime, dt.utcnow(), group)
+
+    def dispatch(self):
+        while len(self.running) < self.workers and len(self.pending) > 0:
+            waiting = set([self.pending[p][2] for p in self.pending.keys()])
+            group = min(waiting, key=lambda g: (self.inflight.get(g, 0), str(g)))
+            path = max([p for p in self.pending.keys() if self.pending[p][2] == group],
+                       key=lambda p: self.pending[p][0])
+            filetime, queued, group = self.pending.pop(path)
+            self.waits.append((dt.utcnow()-queued).total_seconds())
+            future = self.executor.submit(self.analyze, path)
+            self.running[future] = (path, group)
+            self.inflight[group] = self.inflight.get(group, 0) + 1
+
+    def collect(self, timeout=0):
+        '''
+        Return a list of (path, result) for analyses which have finished,
+        waiting up to timeout seconds for at least one.  Failed analyses
+        have a result of None.
+        '''
+        if len(self.running) == 0:
+            return []
+        done, not_done = wait(list(self.running.keys()), timeout=timeout,
+                              return_when=FIRST_COMPLETED)
+        results = []
+        for future in done:
+            path, group = self.running.pop(future)
+            self.inflight[group] -= 1
+            try:
+                result = future.result()
+            except:
+                result = None
+                self.nfailed += 1
+            self.completed.append(dt.utcnow())
+            results.append((path, result))
+        self.dispatch()
+        return results
+
+    def busy(self):
+        return len(self.running) > 0 or len(self.pending) > 0
+
+    def stats(self):
+        '''
+        Return queue depth, number in flight, mean and max wait in the queue
+        (over the last 100 files) and throughput over the last hour.
+        '''
+        now = dt.utcnow()
+        while len(self.completed) > 0\
+              and (now - self.completed[0]).total_seconds() > 3600:
+            self.completed.popleft()
+        waits = list(self.waits)
+        return {'depth': len(self.pending),
+                'running': len(self.running),
+                'mean_wait': sum(waits)/len(waits) if len(waits) > 0 else 0.,
+                'max_wait': max(waits) if len(waits) > 0 else 0.,
+                'frames_per_hour': len(self.completed),
+                'failed': self.nfailed,
+               }
+
+    def report(self):
+        s = self.stats()
+        return (f"Queue depth {s['depth']:d}, {s['running']:d} running, "
+                f"wait {s['mean_wait']:.0f} s (max {s['max_wait']:.0f} s), "
+                f"{s['frames_per_hour']:d} frames in the last hour, "
+                f"{s['failed']:d} failed")
@@ -14,86 +14,147 @@ from matplotlib.dates import HourLocator, MinuteLocator, DateFormatter
 import pymongo
 from pymongo import MongoClient
 
-import ephem
 from astropy.io import ascii
 import astropy.units as u
 from astropy import table
 import IQMon
 from IQMon.telescope import Telescope
 
+from VYSOS.ephemeris import night_events, moon_altitudes
+from VYSOS.night_data import load_status, load_images, have, NightData
+from VYSOS.downsample import thin
 
-def make_plots(date_string, telescope, logger, recent=False):
-    logger.info("#### Making Nightly Plots for "+telescope+" on the Night of "+date_string+" ####")
-    telname = {'V20':'VYSOS-20', 'V5':'VYSOS-5'}
-    y = date_string[0:4]
-    m = date_string[4:6]
-    d = date_string[6:8]
-    date_string_yesterday = (dt.strptime(date_string, '%Y%m%dUT') - tdelta(1,0)).strftime('%Y%m%dUT')
-    
-    ##------------------------------------------------------------------------
-    ## Set up pathnames and filenames
-    ##------------------------------------------------------------------------
+
+def open_collections(telescope):
+    '''
+    Return the (images, status) collections for telescope.
+    '''
     config_file = os.path.expanduser('~/.VYSOS{}.yaml'.format(telescope[1:]))
     tel = Telescope(config_file)
-    destination_path = os.path.abspath('/var/www/nights/')
-
-    ##------------------------------------------------------------------------
-    ## Use pyephem determine sunrise and sunset times
-    ##------------------------------------------------------------------------
-    Observatory = ephem.Observer()
-    Observatory.lon = "-155:34:33.9"
-    Observatory.lat = "+19:32:09.66"
-    Observatory.elevation = 3400.0
-    Observatory.temp = 10.0
-    Observatory.pressure = 680.0
-    Observatory.date = '{}/{}/{} 10:00:00'.format(y, m, d)
-
-    Observatory.horizon = '0.0'
-    sunset  = Observatory.previous_setting(ephem.Sun()).datetime()
-    sunrise = Observatory.next_rising(ephem.Sun()).datetime()
-    Observatory.horizon = '-6.0'
-    evening_civil_twilight = Observatory.previous_setting(ephem.Sun(), use_center=True).datetime()
-    morning_civil_twilight = Observatory.next_rising(ephem.Sun(), use_center=True).datetime()
-    Observatory.horizon = '-12.0'
-    evening_nautical_twilight = Observatory.previous_setting(ephem.Sun(), use_center=True).datetime()
-    morning_nautical_twilight = Observatory.next_rising(ephem.Sun(), use_center=True).datetime()
-    Observatory.horizon = '-18.0'
-    evening_astronomical_twilight = Observatory.previous_setting(ephem.Sun(), use_center=True).datetime()
-    morning_astronomical_twilight = Observatory.next_rising(ephem.Sun(), use_center=True).datetime()
-
-    ##------------------------------------------------------------------------
-    ## Get status and IQMon results
-    ##------------------------------------------------------------------------
     client = MongoClient(tel.mongo_address, tel.mongo_port)
     db = client[tel.mongo_db]
-    images = db[tel.mongo_collection]
-    status = db['{}.status'.format(telescope)]
-
-    ##------------------------------------------------------------------------
-    ## Make Nightly Sumamry Plot (show only night time)
-    ##------------------------------------------------------------------------
-    now = dt.utcnow()
-    now_string = now.strftime("%Y%m%dUT")
-    if recent:
-        night_plot_file_name = 'recent_{}.png'.format(telescope)
-        plot_start = now-tdelta(0,7200)
-        plot_end = now+tdelta(0,300)
-        hours = HourLocator(byhour=range(24), interval=1)
-        mins = MinuteLocator(range(0,60,15))
-        hours_fmt = DateFormatter('%H:%M')
-    else:
-        night_plot_file_name = '{}_{}.png'.format(date_string, telescope)
-        plot_start = sunset-tdelta(0,5400)
-        plot_end = sunrise+tdelta(0,600)
-        hours = HourLocator(byhour=range(24), interval=1)
-        hours_fmt = DateFormatter('%H')
-
-    night_plot_file = os.path.join(destination_path, night_plot_file_name)
+    return db[tel.mongo_collection], db['{}.status'.format(telescope)]
+
+
+## Shading under a Boltwood series for each condition code: (code, color, alpha)
+condition_shading = [(1, 'green', 0.5), (2, 'yellow', 0.8), (3, 'red', 0.8)]
+
+
+class NightlyPlotter(object):
+    '''
+    Nightly plot (or, if recent is set, the plot of the last two hours) for
+    one telescope which is kept in memory between updates.  The figure, its
+    axes and an artist for each series are built once, when the plot is
+    first due.  Each update sets the data of the artists in place from the
+    status and image columns (only the condition shading is redrawn) and
+    saves the figure.  The axes limits are fixed, so nothing is rescaled.
+    '''
+    def __init__(self, date_string, telescope, logger, recent=False):
+        self.date_string = date_string
+        self.telescope = telescope
+        self.logger = logger
+        self.recent = recent
+        config_file = os.path.expanduser('~/.VYSOS{}.yaml'.format(telescope[1:]))
+        self.tel = Telescope(config_file)
+        self.events = night_events(date_string)
+        destination_path = os.path.abspath('/var/www/nights/')
+        if recent:
+            self.night_plot_file_name = 'recent_{}.png'.format(telescope)
+            self.dpi = 72
+        else:
+            self.night_plot_file_name = '{}_{}.png'.format(date_string, telescope)
+            self.dpi = 100
+        self.night_plot_file = os.path.join(destination_path, self.night_plot_file_name)
+        self.Figure = None
+        self.axes = []
+        self.updates = []
+        self.fills = {}
+
+    def window(self, now):
+        '''
+        Return the start and end of the plotted time range at now.
+        '''
+        if self.recent:
+            return now-tdelta(0,7200), now+tdelta(0,300)
+        else:
+            return self.events['sunset']-tdelta(0,5400), self.events['sunrise']+tdelta(0,600)
+
+    def due(self, now):
+        '''
+        Tonight's plot is only made once its time range has started.
+        '''
+        plot_start, plot_end = self.window(now)
+        return (self.date_string != now.strftime("%Y%m%dUT")) or (now > plot_start)
+
+    def shade(self, key, axes, time, values, condition):
+        '''
+        Replace the shading under values on axes for each condition code.
+        '''
+        for fill in self.fills.pop(key, []):
+            fill.remove()
+        if len(time) > 1:
+            self.fills[key] = [axes.fill_between(time, -140, values,
+                               where=np.array(condition)==code,
+                               color=color, alpha=alpha)
+                               for code, color, alpha in condition_shading]
+
+    def update_moon(self, plot_start, plot_end):
+        '''
+        Overplot the moon altitude.  Returns the moon phase.
+        '''
+        moon_time_list = []
+        moon_time = plot_start
+        while moon_time <= plot_end:
+            moon_time_list.append(moon_time)
+            moon_time += tdelta(0, 60*5)
+        moon_alts, moon_phases = moon_altitudes(moon_time_list)
+        moon_phase = max(moon_phases)
+        moon_fill = moon_phase/100.*0.5+0.05
+        self.moon.set_data(moon_time_list, moon_alts)
+        for fill in self.fills.pop('moon', []):
+            fill.remove()
+        self.fills['moon'] = [self.m_axes.fill_between(moon_time_list, 0, moon_alts,
+                              where=np.array(moon_alts)>0, color='yellow', alpha=moon_fill)]
+        return moon_phase
+
+    def move_window(self, now, plot_start, plot_end):
+        '''
+        Move the recent plot along to the time range at now.
+        '''
+        for axes in self.axes:
+            axes.set_xlim(plot_start, plot_end)
+        self.update_moon(plot_start, plot_end)
+        self.generated.set_text('(plot generated at {})'.format(now.strftime("%Y%m%d %H:%M:%S UT")))
 
+    ##-------------------------------------------------------------------------
+    ## Build Figure
+    ##-------------------------------------------------------------------------
+    def draw(self, now, plot_start, plot_end):
+        '''
+        Build the figure with empty artists and register the functions which
+        set their data on each update.
+        '''
+        logger = self.logger
+        telescope = self.telescope
+        date_string = self.date_string
+        recent = self.recent
+        tel = self.tel
+        sunset = self.events['sunset']
+        sunrise = self.events['sunrise']
+        evening_civil_twilight = self.events['evening_civil_twilight']
+        morning_civil_twilight = self.events['morning_civil_twilight']
+        evening_nautical_twilight = self.events['evening_nautical_twilight']
+        morning_nautical_twilight = self.events['morning_nautical_twilight']
+        evening_astronomical_twilight = self.events['evening_astronomical_twilight']
+        morning_astronomical_twilight = self.events['morning_astronomical_twilight']
+        if recent:
+            hours = HourLocator(byhour=range(24), interval=1)
+            mins = MinuteLocator(range(0,60,15))
+            hours_fmt = DateFormatter('%H:%M')
+        else:
+            hours = HourLocator(byhour=range(24), interval=1)
+            hours_fmt = DateFormatter('%H')
 
-    if (date_string != now_string) or (now > plot_start):
-        time_ticks_values = np.arange(sunset.hour,sunrise.hour+1)
-        
         if telescope == "V20":
             if recent:
                 plot_positions = [ ( [0.000, 0.600, 0.460, 0.400], None                         ),
@@ -125,19 +186,17 @@ def make_plots(date_string, telescope, logger, recent=False):
                                    ( [0.000, 0.245, 0.465, 0.240], None                         ),
                                    ( [0.000, 0.000, 0.465, 0.235], None                         ) ]
 
-
-        logger.info("Writing Output File: {}".format(night_plot_file_name))
+        logger.info("Writing Output File: {}".format(self.night_plot_file_name))
         if recent:
-            dpi=72
-            Figure = plt.figure(figsize=(12,8), dpi=dpi)
+            self.Figure = plt.figure(figsize=(12,8), dpi=self.dpi)
         else:
-            dpi=100
-            Figure = plt.figure(figsize=(13,9.5), dpi=dpi)
+            self.Figure = plt.figure(figsize=(13,9.5), dpi=self.dpi)
 
         ##------------------------------------------------------------------------
         ## Temperatures
         ##------------------------------------------------------------------------
         t_axes = plt.axes(plot_positions[0][0])
+        self.axes.append(t_axes)
         if recent:
             plt.title("Recent Weather for {}".format(telescope))
         else:
@@ -146,71 +205,37 @@ def make_plots(date_string, telescope, logger, recent=False):
 
         ##------------------------------------------------------------------------
         ## Boltwood Temperature
-        status_list = [entry for entry in\
-                       status.find({'$or':[ {'UT date':date_string_yesterday},\
-                                            {'UT date':date_string}],\
-                                    'boltwood time':{'$exists':True},\
-                                    'boltwood date':{'$exists':True},\
-                                    'boltwood ambient temp':{'$exists':True},\
-                                   }) ]
-        logger.debug("  Found {} lines for boltwood temperature".format(len(status_list)))
-        if len(status_list) > 1:
-            time = [dt.strptime('{} {}'.format(entry['boltwood date'],\
-                                               entry['boltwood time'][:-3]),\
-                                               '%Y-%m-%d %H:%M:%S') + \
-                    + tdelta(0, 10*60*60)\
-                    for entry in status_list]
-            ambient_temp = [x['boltwood ambient temp'] for x in status_list]
-            logger.debug('  Adding Boltwood ambient temp to plot')
-            t_axes.plot_date(time, ambient_temp, 'ko', \
-                             markersize=2, markeredgewidth=0, drawstyle="default", \
-                             label="Outside Temp")
+        ambient_line, = t_axes.plot_date([], [], 'ko', \
+                                         markersize=2, markeredgewidth=0, drawstyle="default", \
+                                         label="Outside Temp")
+        def update_ambient(status_data, image_data, plot_start, plot_end):
+            rows = have(status_data, 'boltwood UT', 'boltwood ambient temp')
+            logger.debug("  Found {} lines for boltwood temperature".format(rows.sum()))
+            rows = thin(t_axes, status_data['boltwood UT'], [status_data['boltwood ambient temp']],
+                        rows, plot_start, plot_end)
+            ambient_line.set_data(status_data['boltwood UT'][rows],
+                                  status_data['boltwood ambient temp'][rows])
+        self.updates.append(update_ambient)
 
         ##------------------------------------------------------------------------
         ## RCOS Temperature
-        status_list = [entry for entry in\
-                       status.find({'$or':[ {'UT date':date_string_yesterday},\
-                                            {'UT date':date_string}],\
-                                    'UT time':{'$exists':True},\
-                                    'RCOS temperature (primary)':{'$exists':True},\
-                                    'RCOS temperature (truss)':{'$exists':True},\
-                                   }) ]
-        logger.debug("  Found {} lines for RCOS temperatures".format(len(status_list)))
-        if len(status_list) > 1:
-            time = [dt.strptime('{} {}'.format(entry['UT date'],\
-                                               entry['UT time']),\
-                                               '%Y%m%dUT %H:%M:%S')
-                    for entry in status_list]
-            primary_temp = [x['RCOS temperature (primary)'] for x in status_list]
-            truss_temp = [x['RCOS temperature (truss)'] for x in status_list]
-            logger.debug('  Adding priamry mirror temp to plot')
-            t_axes.plot_date(time, primary_temp, 'ro', \
-                             markersize=2, markeredgewidth=0, drawstyle="default", \
-                             label="Mirror Temp")
-            logger.debug('  Adding truss temp to plot')
-            t_axes.plot_date(time, truss_temp, 'go', \
-                             markersize=2, markeredgewidth=0, drawstyle="default", \
-                             label="Truss Temp")
-
-        ##------------------------------------------------------------------------
-        ## FocusMax Temperature
-#         status_list = [entry for entry in\
-#                        status.find({'$or':[ {'UT date':date_string_yesterday},\
-#                                             {'UT date':date_string}],\
-#                                     'UT time':{'$exists':True},\
-#                                     'FocusMax temperature (tube)':{'$exists':True},\
-#                                    }) ]
-#         logger.debug("  Found {} lines for FocusMax temperatures".format(len(status_list)))
-#         if len(status_list) > 1:
-#             time = [dt.strptime('{} {}'.format(entry['UT date'],\
-#                                                entry['UT time']),\
-#                                                '%Y%m%dUT %H:%M:%S')
-#                     for entry in status_list]
-#             FM_temp = [x['FocusMax temperature (tube)'] for x in status_list]
-#             logger.debug('  Adding FocusMax tube temp to plot')
-#             t_axes.plot_date(time, FM_temp, 'ro', \
-#                              markersize=2, markeredgewidth=0, drawstyle="default", \
-#                              label="Tube Temp")
+        primary_line, = t_axes.plot_date([], [], 'ro', \
+                                         markersize=2, markeredgewidth=0, drawstyle="default", \
+                                         label="Mirror Temp")
+        truss_line, = t_axes.plot_date([], [], 'go', \
+                                       markersize=2, markeredgewidth=0, drawstyle="default", \
+                                       label="Truss Temp")
+        def update_RCOS(status_data, image_data, plot_start, plot_end):
+            rows = have(status_data, 'UT', 'RCOS temperature (primary)',
+                        'RCOS temperature (truss)')
+            logger.debug("  Found {} lines for RCOS temperatures".format(rows.sum()))
+            rows = thin(t_axes, status_data['UT'], [status_data['RCOS temperature (primary)'],
+                         status_data['RCOS temperature (truss)']],
+                        rows, plot_start, plot_end)
+            time = status_data['UT'][rows]
+            primary_line.set_data(time, status_data['RCOS temperature (primary)'][rows])
+            truss_line.set_data(time, status_data['RCOS temperature (truss)'][rows])
+        self.updates.append(update_RCOS)
 
         t_axes.xaxis.set_major_locator(hours)
         if recent: t_axes.xaxis.set_minor_locator(mins)
@@ -235,30 +260,16 @@ def make_plots(date_string, telescope, logger, recent=False):
             plt.xlabel("UT Time")
 
         ## Overplot Moon Up Time
-        TheMoon = ephem.Moon()
-        moon_alts = []
-        moon_phases = []
-        moon_time_list = []
-        moon_time = plot_start
-        while moon_time <= plot_end:
-            Observatory.date = moon_time
-            TheMoon.compute(Observatory)
-            moon_time_list.append(moon_time)
-            moon_alts.append(TheMoon.alt * 180. / ephem.pi)
-            moon_phases.append(TheMoon.phase)
-            moon_time += tdelta(0, 60*5)
-        moon_phase = max(moon_phases)
-        moon_fill = moon_phase/100.*0.5+0.05
-
-        m_axes = t_axes.twinx()
-        m_axes.set_ylabel('Moon Alt (%.0f%% full)' % moon_phase, color='y')
-        m_axes.plot_date(moon_time_list, moon_alts, 'y-')
-        m_axes.xaxis.set_major_locator(hours)
-        m_axes.xaxis.set_major_formatter(hours_fmt)
+        self.m_axes = t_axes.twinx()
+        self.axes.append(self.m_axes)
+        self.moon, = self.m_axes.plot_date([], [], 'y-')
+        moon_phase = self.update_moon(plot_start, plot_end)
+        self.m_axes.set_ylabel('Moon Alt (%.0f%% full)' % moon_phase, color='y')
+        self.m_axes.xaxis.set_major_locator(hours)
+        self.m_axes.xaxis.set_major_formatter(hours_fmt)
         plt.ylim(0,100)
         plt.yticks([10,30,50,70,90], color='y')
         plt.xlim(plot_start, plot_end)
-        plt.fill_between(moon_time_list, 0, moon_alts, where=np.array(moon_alts)>0, color='yellow', alpha=moon_fill)        
         plt.ylabel('')
 
         ##------------------------------------------------------------------------
@@ -267,35 +278,30 @@ def make_plots(date_string, telescope, logger, recent=False):
         if telescope == "V20" and not recent:
             logger.info('Adding temperature difference plot')
             tdiff_axes = plt.axes(plot_positions[1][0])
-            status_list = [entry for entry in\
-                           status.find({'$or':[ {'UT date':date_string_yesterday},\
-                                                {'UT date':date_string}],\
-                                        'UT time':{'$exists':True},\
-                                        'RCOS temperature (primary)':{'$exists':True},\
-                                        'RCOS temperature (truss)':{'$exists':True},\
-                                        'boltwood ambient temp':{'$exists':True},\
-                                       }) ]
-            logger.debug("  Found {} lines for temperature differences".format(len(status_list)))
-            if len(status_list) > 1:
-                time = [dt.strptime('{} {}'.format(entry['UT date'],\
-                                                   entry['UT time']),\
-                                                   '%Y%m%dUT %H:%M:%S')
-                        for entry in status_list]
-                primary_temp_diff = [float(x['RCOS temperature (primary)']) - \
-                                     float(x['boltwood ambient temp'])\
-                                     for x in status_list]
-                truss_temp_diff = [float(x['RCOS temperature (truss)']) - \
-                                   float(x['boltwood ambient temp'])\
-                                   for x in status_list]
-                logger.debug('  Adding priamry mirror temp diff to plot')
-                tdiff_axes.plot_date(time, primary_temp_diff, 'ro', \
-                                     markersize=2, markeredgewidth=0, drawstyle="default", \
-                                     label="Mirror Temp")
-                logger.debug('  Adding truss temp diff to plot')
-                tdiff_axes.plot_date(time, truss_temp_diff, 'go', \
-                                     markersize=2, markeredgewidth=0, drawstyle="default", \
-                                     label="Truss Temp")
-                tdiff_axes.plot_date([plot_start, plot_end], [0,0], 'k-')
+            self.axes.append(tdiff_axes)
+            primary_diff_line, = tdiff_axes.plot_date([], [], 'ro', \
+                                 markersize=2, markeredgewidth=0, drawstyle="default", \
+                                 label="Mirror Temp")
+            truss_diff_line, = tdiff_axes.plot_date([], [], 'go', \
+                               markersize=2, markeredgewidth=0, drawstyle="default", \
+                               label="Truss Temp")
+            tdiff_axes.plot_date([plot_start, plot_end], [0,0], 'k-')
+            def update_tdiff(status_data, image_data, plot_start, plot_end):
+                rows = have(status_data, 'UT', 'RCOS temperature (primary)',
+                            'RCOS temperature (truss)', 'boltwood ambient temp')
+                logger.debug("  Found {} lines for temperature differences".format(rows.sum()))
+                rows = thin(tdiff_axes, status_data['UT'],
+                            [status_data['RCOS temperature (primary)'] - status_data['boltwood ambient temp'],
+                             status_data['RCOS temperature (truss)'] - status_data['boltwood ambient temp']],
+                            rows, plot_start, plot_end)
+                time = status_data['UT'][rows]
+                primary_temp_diff = status_data['RCOS temperature (primary)'][rows]\
+                                    - status_data['boltwood ambient temp'][rows]
+                truss_temp_diff = status_data['RCOS temperature (truss)'][rows]\
+                                  - status_data['boltwood ambient temp'][rows]
+                primary_diff_line.set_data(time, primary_temp_diff)
+                truss_diff_line.set_data(time, truss_temp_diff)
+            self.updates.append(update_tdiff)
             tdiff_axes.xaxis.set_major_locator(hours)
             if recent: tdiff_axes.xaxis.set_minor_locator(mins)
             tdiff_axes.xaxis.set_major_formatter(hours_fmt)
@@ -313,45 +319,29 @@ def make_plots(date_string, telescope, logger, recent=False):
         if telescope == "V20":
             logger.info('Adding fan state/power plot')
             fan_axes = plt.axes(plot_positions[2][0])
-            ##------------------------------------------------------------------------
-            ## V20 Dome Fan On
-            status_list = [entry for entry in\
-                           status.find({'$or':[ {'UT date':date_string_yesterday},\
-                                                {'UT date':date_string}],\
-                                        'UT time':{'$exists':True},\
-                                        'CBW fan state':{'$exists':True},\
-                                       }) ]
-            logger.debug("  Found {} lines for dome fan state".format(len(status_list)))
-            if len(status_list) > 1:
-                time = [dt.strptime('{} {}'.format(entry['UT date'],\
-                                                   entry['UT time']),\
-                                                   '%Y%m%dUT %H:%M:%S')
-                        for entry in status_list]
-                dome_fan = [int(x['CBW fan state'])*100 for x in status_list]
-                logger.debug('  Adding dome fan state to plot')
-                fan_axes.plot_date(time, dome_fan, 'co', \
-                                     markersize=2, markeredgewidth=0, drawstyle="default", \
-                                     label="Dome Fan")
-
-            ##------------------------------------------------------------------------
-            ## RCOS Fan Power
-            status_list = [entry for entry in\
-                           status.find({'$or':[ {'UT date':date_string_yesterday},\
-                                                {'UT date':date_string}],\
-                                        'UT time':{'$exists':True},\
-                                        'RCOS fan speed':{'$exists':True},\
-                                       }) ]
-            logger.debug("  Found {} lines for RCOS fan speed".format(len(status_list)))
-            if len(status_list) > 1:
-                time = [dt.strptime('{} {}'.format(entry['UT date'],\
-                                                   entry['UT time']),\
-                                                   '%Y%m%dUT %H:%M:%S')
-                        for entry in status_list]
-                RCOS_fan = [x['RCOS fan speed'] for x in status_list]
-                logger.debug('  Adding RCOS fan speed to plot')
-                fan_axes.plot_date(time, RCOS_fan, 'bo', \
-                                     markersize=2, markeredgewidth=0, drawstyle="default", \
-                                     label="Mirror Temp")
+            self.axes.append(fan_axes)
+            dome_fan_line, = fan_axes.plot_date([], [], 'co', \
+                             markersize=2, markeredgewidth=0, drawstyle="default", \
+                             label="Dome Fan")
+            RCOS_fan_line, = fan_axes.plot_date([], [], 'bo', \
+                             markersize=2, markeredgewidth=0, drawstyle="default", \
+                             label="Mirror Temp")
+            def update_fans(status_data, image_data, plot_start, plot_end):
+                ## V20 Dome Fan On
+                rows = have(status_data, 'UT', 'CBW fan state')
+                logger.debug("  Found {} lines for dome fan state".format(rows.sum()))
+                rows = thin(fan_axes, status_data['UT'], [status_data['CBW fan state']],
+                            rows, plot_start, plot_end)
+                dome_fan_line.set_data(status_data['UT'][rows],
+                                       status_data['CBW fan state'][rows].astype(int)*100)
+                ## RCOS Fan Power
+                rows = have(status_data, 'UT', 'RCOS fan speed')
+                logger.debug("  Found {} lines for RCOS fan speed".format(rows.sum()))
+                rows = thin(fan_axes, status_data['UT'], [status_data['RCOS fan speed']],
+                            rows, plot_start, plot_end)
+                RCOS_fan_line.set_data(status_data['UT'][rows],
+                                       status_data['RCOS fan speed'][rows])
+            self.updates.append(update_fans)
             fan_axes.xaxis.set_major_locator(hours)
             if recent: fan_axes.xaxis.set_minor_locator(mins)
             fan_axes.xaxis.set_major_formatter(hours_fmt)
@@ -372,37 +362,25 @@ def make_plots(date_string, telescope, logger, recent=False):
         ##------------------------------------------------------------------------
         logger.info('Adding cloudiness plot')
         c_axes = plt.axes(plot_positions[3][0])
-        if recent: plt.title('(plot generated at {})'.format(now.strftime("%Y%m%d %H:%M:%S UT")))
-
-        status_list = [entry for entry in\
-                       status.find({'$or':[ {'UT date':date_string_yesterday},\
-                                            {'UT date':date_string}],\
-                                    'boltwood time':{'$exists':True},\
-                                    'boltwood date':{'$exists':True},\
-                                    'boltwood sky temp':{'$exists':True},\
-                                    'boltwood cloud condition':{'$exists':True},\
-                                   }) \
-                       if not 'current' in entry.keys()\
-                       or not entry['current']]
-        logger.debug("  Found {} lines for boltwood sky temperature".format(len(status_list)))
-        if len(status_list) > 1:
-            time = [dt.strptime('{} {}'.format(entry['boltwood date'],\
-                                               entry['boltwood time'][:-3]),\
-                                               '%Y-%m-%d %H:%M:%S') + \
-                    + tdelta(0, 10*60*60)\
-                    for entry in status_list]
-            sky_temp = [x['boltwood sky temp'] for x in status_list]
-            cloud_condition = [x['boltwood cloud condition'] for x in status_list]
-            logger.debug('  Adding Boltwood sky temp to plot')
-            c_axes.plot_date(time, sky_temp, 'bo', \
-                             markersize=2, markeredgewidth=0, drawstyle="default", \
-                             label="Sky Temp")
-            plt.fill_between(time, -140, sky_temp, where=np.array(cloud_condition)==1,\
-                             color='green', alpha=0.5)
-            plt.fill_between(time, -140, sky_temp, where=np.array(cloud_condition)==2,\
-                             color='yellow', alpha=0.8)
-            plt.fill_between(time, -140, sky_temp, where=np.array(cloud_condition)==3,\
-                             color='red', alpha=0.8)
+        self.axes.append(c_axes)
+        if recent: self.generated = plt.title('(plot generated at {})'.format(now.strftime("%Y%m%d %H:%M:%S UT")))
+
+        sky_temp_line, = c_axes.plot_date([], [], 'bo', \
+                                          markersize=2, markeredgewidth=0, drawstyle="default", \
+                                          label="Sky Temp")
+        def update_clouds(status_data, image_data, plot_start, plot_end):
+            rows = have(status_data, 'boltwood UT', 'boltwood sky temp',
+                        'boltwood cloud condition') & ~status_data['current']
+            logger.debug("  Found {} lines for boltwood sky temperature".format(rows.sum()))
+            rows = thin(c_axes, status_data['boltwood UT'], [status_data['boltwood sky temp'],
+                         status_data['boltwood cloud condition']],
+                        rows, plot_start, plot_end)
+            time = status_data['boltwood UT'][rows]
+            sky_temp = status_data['boltwood sky temp'][rows]
+            sky_temp_line.set_data(time, sky_temp)
+            self.shade('clouds', c_axes, time, sky_temp,
+                       status_data['boltwood cloud condition'][rows])
+        self.updates.append(update_clouds)
         c_axes.xaxis.set_major_locator(hours)
         if recent: c_axes.xaxis.set_minor_locator(mins)
         c_axes.xaxis.set_major_formatter(hours_fmt)
@@ -422,35 +400,23 @@ def make_plots(date_string, telescope, logger, recent=False):
         ##------------------------------------------------------------------------
         logger.info('Adding humidity, wetness, rain plot')
         h_axes = plt.axes(plot_positions[4][0])
-        status_list = [entry for entry in\
-                       status.find({'$or':[ {'UT date':date_string_yesterday},\
-                                            {'UT date':date_string}],\
-                                    'boltwood time':{'$exists':True},\
-                                    'boltwood date':{'$exists':True},\
-                                    'boltwood humidity':{'$exists':True},\
-                                    'boltwood rain condition':{'$exists':True},\
-                                   }) \
-                       if not 'current' in entry.keys()\
-                       or not entry['current']]
-        logger.debug("  Found {} lines for boltwood humidity".format(len(status_list)))
-        if len(status_list) > 1:
-            time = [dt.strptime('{} {}'.format(entry['boltwood date'],\
-                                               entry['boltwood time'][:-3]),\
-                                               '%Y-%m-%d %H:%M:%S') + \
-                    + tdelta(0, 10*60*60)\
-                    for entry in status_list]
-            humidity = [x['boltwood humidity'] for x in status_list]
-            rain_condition = [x['boltwood rain condition'] for x in status_list]
-            logger.debug('  Adding Boltwood humidity to plot')
-            h_axes.plot_date(time, humidity, 'bo', \
-                             markersize=2, markeredgewidth=0, drawstyle="default", \
-                             label="Sky Temp")
-            plt.fill_between(time, -140, humidity, where=np.array(rain_condition)==1,\
-                             color='green', alpha=0.5)
-            plt.fill_between(time, -140, humidity, where=np.array(rain_condition)==2,\
-                             color='yellow', alpha=0.8)
-            plt.fill_between(time, -140, humidity, where=np.array(rain_condition)==3,\
-                             color='red', alpha=0.8)
+        self.axes.append(h_axes)
+        humidity_line, = h_axes.plot_date([], [], 'bo', \
+                                          markersize=2, markeredgewidth=0, drawstyle="default", \
+                                          label="Sky Temp")
+        def update_humidity(status_data, image_data, plot_start, plot_end):
+            rows = have(status_data, 'boltwood UT', 'boltwood humidity',
+                        'boltwood rain condition') & ~status_data['current']
+            logger.debug("  Found {} lines for boltwood humidity".format(rows.sum()))
+            rows = thin(h_axes, status_data['boltwood UT'], [status_data['boltwood humidity'],
+                         status_data['boltwood rain condition']],
+                        rows, plot_start, plot_end)
+            time = status_data['boltwood UT'][rows]
+            humidity = status_data['boltwood humidity'][rows]
+            humidity_line.set_data(time, humidity)
+            self.shade('humidity', h_axes, time, humidity,
+                       status_data['boltwood rain condition'][rows])
+        self.updates.append(update_humidity)
         h_axes.xaxis.set_major_locator(hours)
         if recent: h_axes.xaxis.set_minor_locator(mins)
         h_axes.xaxis.set_major_formatter(hours_fmt)
@@ -466,36 +432,23 @@ def make_plots(date_string, telescope, logger, recent=False):
         ##------------------------------------------------------------------------
         logger.info('Adding wind speed plot')
         w_axes = plt.axes(plot_positions[5][0])
-
-        status_list = [entry for entry in\
-                       status.find({'$or':[ {'UT date':date_string_yesterday},\
-                                            {'UT date':date_string}],\
-                                    'boltwood time':{'$exists':True},\
-                                    'boltwood date':{'$exists':True},\
-                                    'boltwood wind speed':{'$exists':True},\
-                                    'boltwood wind condition':{'$exists':True},\
-                                   }) \
-                       if not 'current' in entry.keys()\
-                       or not entry['current']]
-        logger.debug("  Found {} lines for boltwood wind speed".format(len(status_list)))
-        if len(status_list) > 1:
-            time = [dt.strptime('{} {}'.format(entry['boltwood date'],\
-                                               entry['boltwood time'][:-3]),\
-                                               '%Y-%m-%d %H:%M:%S') + \
-                    + tdelta(0, 10*60*60)\
-                    for entry in status_list]
-            wind_speed = [x['boltwood wind speed'] for x in status_list]
-            wind_condition = [x['boltwood wind condition'] for x in status_list]
-            logger.debug('  Adding Boltwood wind speed to plot')
-            w_axes.plot_date(time, wind_speed, 'bo', \
-                             markersize=2, markeredgewidth=0, drawstyle="default", \
-                             label="Wind Speed")
-            plt.fill_between(time, -140, wind_speed, where=np.array(wind_condition)==1,\
-                             color='green', alpha=0.5)
-            plt.fill_between(time, -140, wind_speed, where=np.array(wind_condition)==2,\
-                             color='yellow', alpha=0.8)
-            plt.fill_between(time, -140, wind_speed, where=np.array(wind_condition)==3,\
-                             color='red', alpha=0.8)
+        self.axes.append(w_axes)
+        wind_speed_line, = w_axes.plot_date([], [], 'bo', \
+                                            markersize=2, markeredgewidth=0, drawstyle="default", \
+                                            label="Wind Speed")
+        def update_wind(status_data, image_data, plot_start, plot_end):
+            rows = have(status_data, 'boltwood UT', 'boltwood wind speed',
+                        'boltwood wind condition') & ~status_data['current']
+            logger.debug("  Found {} lines for boltwood wind speed".format(rows.sum()))
+            rows = thin(w_axes, status_data['boltwood UT'], [status_data['boltwood wind speed'],
+                         status_data['boltwood wind condition']],
+                        rows, plot_start, plot_end)
+            time = status_data['boltwood UT'][rows]
+            wind_speed = status_data['boltwood wind speed'][rows]
+            wind_speed_line.set_data(time, wind_speed)
+            self.shade('wind', w_axes, time, wind_speed,
+                       status_data['boltwood wind condition'][rows])
+        self.updates.append(update_wind)
 
         w_axes.xaxis.set_major_locator(hours)
         if recent: w_axes.xaxis.set_minor_locator(mins)
@@ -515,6 +468,7 @@ def make_plots(date_string, telescope, logger, recent=False):
             ##------------------------------------------------------------------------
             logger.info('Adding FWHM plot')
             f_axes = plt.axes(plot_positions[0][1])
+            self.axes.append(f_axes)
             plt.title("IQMon Results for {} on the Night of {}".format(telescope, date_string))
 
             if tel.config['units_for_FWHM'] == 'arcsec':
@@ -522,27 +476,23 @@ def make_plots(date_string, telescope, logger, recent=False):
             else:
                 scaling_factor = 1.0
 
-            image_list = [entry for entry in\
-                          images.find({'date':date_string,\
-                                       'exposure start':{'$exists':True},\
-                                       'FWHM pix':{'$exists':True},\
-                                      }) ]
-            logger.debug("  Found {} lines for FWHM".format(len(image_list)))
-            ymax = {'V5': 4, 'V20': 6.5}[telescope]
-            if len(image_list) > 0:
-                time = [x['exposure start'] for x in image_list]
-                fwhm = [x['FWHM pix']*scaling_factor for x in image_list]
-                time_above_plot = [x['exposure start'] for x in image_list if x['FWHM pix']*scaling_factor > ymax]
-                fwhm_above_plot = [x['FWHM pix']*scaling_factor for x in image_list if x['FWHM pix']*scaling_factor > ymax]
-                logger.debug('  Adding FWHM to plot')
-                f_axes.plot_date(time, fwhm, 'ko', \
-                                 markersize=4, markeredgewidth=0, drawstyle="default", \
-                                 label="FWHM (pix)")
-                f_axes.plot_date(time_above_plot, fwhm_above_plot, 'r^', \
-                                 markersize=5, markeredgewidth=0)
-                f_axes.plot_date([plot_start, plot_end],\
-                                 [tel.config['threshold_FWHM']*scaling_factor, tel.config['threshold_FWHM']*scaling_factor],\
-                                 'r-')
+            fwhm_ymax = {'V5': 4, 'V20': 6.5}[telescope]
+            fwhm_line, = f_axes.plot_date([], [], 'ko', \
+                                          markersize=4, markeredgewidth=0, drawstyle="default", \
+                                          label="FWHM (pix)")
+            fwhm_above_line, = f_axes.plot_date([], [], 'r^', \
+                                                markersize=5, markeredgewidth=0)
+            f_axes.plot_date([plot_start, plot_end],\
+                             [tel.config['threshold_FWHM']*scaling_factor, tel.config['threshold_FWHM']*scaling_factor],\
+                             'r-')
+            def update_fwhm(status_data, image_data, plot_start, plot_end):
+                rows = have(image_data, 'FWHM pix')
+                logger.debug("  Found {} lines for FWHM".format(rows.sum()))
+                time = image_data['exposure start'][rows]
+                fwhm = image_data['FWHM pix'][rows]*scaling_factor
+                fwhm_line.set_data(time, fwhm)
+                fwhm_above_line.set_data(time[fwhm > fwhm_ymax], fwhm[fwhm > fwhm_ymax])
+            self.updates.append(update_fwhm)
 
             ## Overplot Twilights
             plt.axvspan(sunset, evening_civil_twilight, ymin=0, ymax=1, color='blue', alpha=0.1)
@@ -559,42 +509,39 @@ def make_plots(date_string, telescope, logger, recent=False):
             plt.ylabel("FWHM ({})".format(tel.config['units_for_FWHM']))
             plt.yticks(range(0,20))
             plt.xlim(plot_start, plot_end)
-            plt.ylim(0,ymax)
+            plt.ylim(0,fwhm_ymax)
             plt.grid(which='major', color='k')
-            if recent: plt.grid(which='minor', color='k', alpha=0.8)
 
             ##------------------------------------------------------------------------
             ## Zero Point
             ##------------------------------------------------------------------------
             logger.info('Adding Zero Point plot')
             z_axes = plt.axes(plot_positions[1][1])
-
-            image_list = [entry for entry in\
-                          images.find({'date':date_string,\
-                                       'exposure start':{'$exists':True},\
-                                       'zero point':{'$exists':True},\
-                                      }) ]
-            logger.debug("  Found {} lines for zero point".format(len(image_list)))
-            ymin = {'V5': 17.25, 'V20': 18.75}[telescope]
-            ymax = {'V5': 19.25, 'V20': 20.75}[telescope]
-            if len(image_list) > 0:
-                time = [x['exposure start'] for x in image_list]
-                zero_point = [x['zero point'] for x in image_list]
-                time_below_plot = [x['exposure start'] for x in image_list if x['zero point'] < ymin]
-                zero_point_below_plot = [x['zero point'] for x in image_list if x['zero point'] < ymin]
-                time_above_plot = [x['exposure start'] for x in image_list if x['zero point'] > ymax]
-                zero_point_above_plot = [x['zero point'] for x in image_list if x['zero point'] > ymax]
-                logger.debug('  Adding zero point to plot')
-                z_axes.plot_date(time, zero_point, 'ko', \
-                                 markersize=4, markeredgewidth=0, drawstyle="default", \
-                                 label="Zero Point")
-                z_axes.plot_date(time_above_plot, zero_point_above_plot, 'r^', \
-                                 markersize=5, markeredgewidth=0)
-                z_axes.plot_date(time_below_plot, zero_point_below_plot, 'rv', \
-                                 markersize=5, markeredgewidth=0)
-                z_axes.plot_date([plot_start, plot_end],\
-                                 [tel.config['threshold_zeropoint'], tel.config['threshold_zeropoint']],\
-                                 'r-')
+            self.axes.append(z_axes)
+
+            zero_point_ymin = {'V5': 17.25, 'V20': 18.75}[telescope]
+            zero_point_ymax = {'V5': 19.25, 'V20': 20.75}[telescope]
+            zero_point_line, = z_axes.plot_date([], [], 'ko', \
+                               markersize=4, markeredgewidth=0, drawstyle="default", \
+                               label="Zero Point")
+            zero_point_above_line, = z_axes.plot_date([], [], 'r^', \
+                                     markersize=5, markeredgewidth=0)
+            zero_point_below_line, = z_axes.plot_date([], [], 'rv', \
+                                     markersize=5, markeredgewidth=0)
+            z_axes.plot_date([plot_start, plot_end],\
+                             [tel.config['threshold_zeropoint'], tel.config['threshold_zeropoint']],\
+                             'r-')
+            def update_zero_point(status_data, image_data, plot_start, plot_end):
+                rows = have(image_data, 'zero point')
+                logger.debug("  Found {} lines for zero point".format(rows.sum()))
+                time = image_data['exposure start'][rows]
+                zero_point = image_data['zero point'][rows]
+                zero_point_line.set_data(time, zero_point)
+                zero_point_above_line.set_data(time[zero_point > zero_point_ymax],
+                                               zero_point[zero_point > zero_point_ymax])
+                zero_point_below_line.set_data(time[zero_point < zero_point_ymin],
+                                               zero_point[zero_point < zero_point_ymin])
+            self.updates.append(update_zero_point)
             z_axes.xaxis.set_major_locator(hours)
             z_axes.xaxis.set_major_formatter(hours_fmt)
             z_axes.xaxis.set_ticklabels([])
@@ -602,9 +549,8 @@ def make_plots(date_string, telescope, logger, recent=False):
             plt.ylabel("Zero Point")
             plt.yticks(np.arange(10,30,0.5))
             plt.xlim(plot_start, plot_end)
-            plt.ylim(ymin,ymax)
+            plt.ylim(zero_point_ymin,zero_point_ymax)
             plt.grid(which='major', color='k')
-            if recent: plt.grid(which='minor', color='k', alpha=0.8)
 
 
             ##------------------------------------------------------------------------
@@ -612,24 +558,20 @@ def make_plots(date_string, telescope, logger, recent=False):
             ##------------------------------------------------------------------------
             logger.info('Adding Ellipticity plot')
             e_axes = plt.axes(plot_positions[2][1])
-
-            image_list = [entry for entry in\
-                          images.find({'date':date_string,\
-                                       'exposure start':{'$exists':True},\
-                                       'ellipticity':{'$exists':True},\
-                                      }) ]
-            logger.debug("  Found {} lines for ellipticity".format(len(image_list)))
-            ymax = {'V5': 4, 'V20': 6}[telescope]
-            if len(image_list) > 0:
-                time = [x['exposure start'] for x in image_list]
-                ellipticity = [x['ellipticity'] for x in image_list]
-                logger.debug('  Adding ellipticity to plot')
-                e_axes.plot_date(time, ellipticity, 'ko', \
-                                 markersize=4, markeredgewidth=0, drawstyle="default", \
-                                 label="ellipticity")
-                e_axes.plot_date([plot_start, plot_end],\
-                                 [tel.config['threshold_ellipticity'], tel.config['threshold_ellipticity']],\
-                                 'r-')
+            self.axes.append(e_axes)
+
+            ellipticity_line, = e_axes.plot_date([], [], 'ko', \
+                                markersize=4, markeredgewidth=0, drawstyle="default", \
+                                label="ellipticity")
+            e_axes.plot_date([plot_start, plot_end],\
+                             [tel.config['threshold_ellipticity'], tel.config['threshold_ellipticity']],\
+                             'r-')
+            def update_ellipticity(status_data, image_data, plot_start, plot_end):
+                rows = have(image_data, 'ellipticity')
+                logger.debug("  Found {} lines for ellipticity".format(rows.sum()))
+                ellipticity_line.set_data(image_data['exposure start'][rows],
+                                          image_data['ellipticity'][rows])
+            self.updates.append(update_ellipticity)
             e_axes.xaxis.set_major_locator(hours)
             e_axes.xaxis.set_major_formatter(hours_fmt)
             e_axes.xaxis.set_ticklabels([])
@@ -639,7 +581,6 @@ def make_plots(date_string, telescope, logger, recent=False):
             plt.xlim(plot_start, plot_end)
             plt.ylim(0,1)
             plt.grid(which='major', color='k')
-            if recent: plt.grid(which='minor', color='k', alpha=0.8)
 
 
             ##------------------------------------------------------------------------
@@ -647,45 +588,86 @@ def make_plots(date_string, telescope, logger, recent=False):
             ##------------------------------------------------------------------------
             logger.info('Adding Pointing Error plot')
             p_axes = plt.axes(plot_positions[3][1])
+            self.axes.append(p_axes)
 
-            image_list = [entry for entry in\
-                          images.find({'date':date_string,\
-                                       'exposure start':{'$exists':True},\
-                                       'pointing error arcmin':{'$exists':True},\
-                                      }) ]
-            logger.debug("  Found {} lines for pointing error".format(len(image_list)))
-            ymax = {'V5': 11, 'V20': 11}[telescope]
-            if len(image_list) > 0:
-                time = [x['exposure start'] for x in image_list]
-                pointing_err = [x['pointing error arcmin'] for x in image_list]
-                time_above_plot = [x['exposure start'] for x in image_list if x['pointing error arcmin'] > ymax]
-                pointing_err_above_plot = [x['pointing error arcmin'] for x in image_list if x['pointing error arcmin'] > ymax]
-                logger.debug('  Adding pointing error to plot')
-                p_axes.plot_date(time, pointing_err, 'ko', \
+            pointing_err_ymax = {'V5': 11, 'V20': 11}[telescope]
+            pointing_err_line, = p_axes.plot_date([], [], 'ko', \
                                  markersize=4, markeredgewidth=0, drawstyle="default", \
                                  label="ellipticity")
-                p_axes.plot_date(time_above_plot, pointing_err_above_plot, 'r^', \
-                                 markersize=5, markeredgewidth=0)
-                p_axes.plot_date([plot_start, plot_end],\
-                                 [tel.config['threshold_pointing_err'], tel.config['threshold_pointing_err']],\
-                                 'r-')
+            pointing_err_above_line, = p_axes.plot_date([], [], 'r^', \
+                                       markersize=5, markeredgewidth=0)
+            p_axes.plot_date([plot_start, plot_end],\
+                             [tel.config['threshold_pointing_err'], tel.config['threshold_pointing_err']],\
+                             'r-')
+            def update_pointing_err(status_data, image_data, plot_start, plot_end):
+                rows = have(image_data, 'pointing error arcmin')
+                logger.debug("  Found {} lines for pointing error".format(rows.sum()))
+                time = image_data['exposure start'][rows]
+                pointing_err = image_data['pointing error arcmin'][rows]
+                pointing_err_line.set_data(time, pointing_err)
+                pointing_err_above_line.set_data(time[pointing_err > pointing_err_ymax],
+                                                 pointing_err[pointing_err > pointing_err_ymax])
+            self.updates.append(update_pointing_err)
 
             plt.ylabel("Pointing Error (arcmin)")
             plt.yticks(range(0,11,2))
             plt.xlim(plot_start, plot_end)
-            plt.ylim(0,ymax)
+            plt.ylim(0,pointing_err_ymax)
             plt.grid(which='major', color='k')
-            if recent: plt.grid(which='minor', color='k', alpha=0.8)
             plt.xlabel("UT Time")
 
             p_axes.xaxis.set_major_locator(hours)
             p_axes.xaxis.set_major_formatter(hours_fmt)
 
+    ##-------------------------------------------------------------------------
+    ## Update Artists
+    ##-------------------------------------------------------------------------
+    def update(self, status_data, image_data=None):
+        '''
+        Set the artists from status_data and image_data (the columns loaded
+        by night_data, image_data is not used by the recent plot) and save
+        the figure.  Returns False without drawing if the plot is not due.
+        '''
+        now = dt.utcnow()
+        if not self.due(now):
+            return False
+        plot_start, plot_end = self.window(now)
+        if self.Figure is None:
+            self.draw(now, plot_start, plot_end)
+        elif self.recent:
+            self.move_window(now, plot_start, plot_end)
+        self.logger.debug("  Found {} status lines".format(len(status_data['UT'])))
+        if not self.recent:
+            self.logger.debug("  Found {} image lines".format(len(image_data['exposure start'])))
+        for update in self.updates:
+            update(status_data, image_data, plot_start, plot_end)
+        self.logger.info('Saving figure: {}'.format(self.night_plot_file))
+        self.Figure.savefig(self.night_plot_file, dpi=self.dpi, bbox_inches='tight', pad_inches=0.10)
+        self.logger.info('Done.')
+        return True
+
+    def close(self):
+        if self.Figure is not None:
+            plt.close(self.Figure)
+            self.Figure = None
 
-        logger.info('Saving figure: {}'.format(night_plot_file))
-        plt.savefig(night_plot_file, dpi=dpi, bbox_inches='tight', pad_inches=0.10)
-        logger.info('Done.')
 
+def make_plots(date_string, telescope, logger, recent=False):
+    '''
+    Make the nightly (or, if recent is set, the last two hours) plot for
+    telescope from the status and image results in the database.
+    '''
+    logger.info("#### Making Nightly Plots for "+telescope+" on the Night of "+date_string+" ####")
+    plotter = NightlyPlotter(date_string, telescope, logger, recent=recent)
+    if not plotter.due(dt.utcnow()):
+        return
+    images, status = open_collections(telescope)
+    status_data = load_status(status, date_string)
+    image_data = None
+    if not recent:
+        image_data = load_images(images, date_string)
+    plotter.update(status_data, image_data)
+    plotter.close()
 
 
 
@@ -741,14 +723,39 @@ def main():
 #     logger.addHandler(LogFileHandler)
 
     if args.loop:
+        ## Keep each telescope's night and plots in memory.  The nightly plot
+        ## is only updated when new status or image documents have arrived,
+        ## the recent plot moves along with the time on every pass.
+        collections = {telescope: open_collections(telescope)
+                       for telescope in ['V5', 'V20']}
+        nights = {}
+        plotters = {}
         while True:
             ## Set date to tonight
             now = dt.utcnow()
             date_string = now.strftime("%Y%m%dUT")
-            make_plots(date_string, 'V5', logger)
-            make_plots(date_string, 'V5', logger, recent=True)
-            make_plots(date_string, 'V20', logger)
-            make_plots(date_string, 'V20', logger, recent=True)
+            for telescope in ['V5', 'V20']:
+                night = nights.get(telescope, None)
+                if night is None or night.date_string != date_string:
+                    images, status = collections[telescope]
+                    night = NightData(status, images, date_string)
+                    nights[telescope] = night
+                nnew = night.refresh()
+                if nnew == 0:
+                    logger.debug('No new documents for {}'.format(telescope))
+                else:
+                    logger.debug('{:d} new documents for {}'.format(nnew, telescope))
+                for recent in [False, True]:
+                    plotter = plotters.get((telescope, recent), None)
+                    if plotter is None or plotter.date_string != date_string:
+                        if plotter is not None:
+                            plotter.close()
+                        logger.info("#### Making Nightly Plots for "+telescope+" on the Night of "+date_string+" ####")
+                        plotter = NightlyPlotter(date_string, telescope, logger, recent=recent)
+                        plotters[(telescope, recent)] = plotter
+                    elif nnew == 0 and not recent:
+                        continue
+                    plotter.update(night.status_data, night.image_data)
             time.sleep(120)
     else:
         if args.telescope:
@@ -5,22 +5,30 @@ import datetime
 from datetime import datetime as dt
 from datetime import timedelta as tdelta
 import logging
+from time import sleep
+from bisect import bisect_left
 
 import numpy as np
 import matplotlib as mpl
 mpl.use('Agg')
 import matplotlib.pyplot as plt
 plt.style.use('classic')
-from matplotlib.dates import HourLocator, MinuteLocator, DateFormatter
+from matplotlib.dates import HourLocator, MinuteLocator, DateFormatter, date2num
+from matplotlib.colors import ListedColormap
 
 import pymongo
 from VYSOS import weather_limits
+from VYSOS.conditions import classify
+from VYSOS.rollups import fetch_series, choose_resolution
+from VYSOS.deadband import expand_documents
+from VYSOS.ephemeris import twilight_spans
+from VYSOS.downsample import minmax_indices, pixel_width
 
 import astropy.units as u
 from astropy.table import Table, Column
-from astropy.time import Time
-from astropy.coordinates import EarthLocation
-from astroplan import Observer
+
+## Marker colors for the SAFE, WARN, UNSAFE and UNKNOWN category codes
+category_cmap = ListedColormap(['g', 'y', 'r', 'k'])
 
 def moving_averagexy(x, y, window_size):
     if len(x) == 0:
@@ -37,191 +45,268 @@ def moving_averagexy(x, y, window_size):
     return xma, yma
 
 
-def get_twilights(start, end):
-    """ Determine sunrise and sunset times """
-    location = EarthLocation(
-        lat=+19.53602,
-        lon=-155.57608,
-        height=3400,
-    )
-    obs = Observer(location=location, name='VYSOS',
-                   timezone='US/Hawaii')
-
-    sunset = obs.sun_set_time(Time(start), which='next').datetime
-    sunrise = obs.sun_rise_time(Time(start), which='next').datetime
-
-    # Calculate and order twilights and set plotting alpha for each
-    twilights = [(start, 'start', 0.0),
-                 (sunset, 'sunset', 0.0),
-                 (obs.twilight_evening_civil(Time(start),
-                                             which='next').datetime, 'ec', 0.1),
-                 (obs.twilight_evening_nautical(Time(start),
-                                                which='next').datetime, 'en', 0.2),
-                 (obs.twilight_evening_astronomical(Time(start),
-                                                    which='next').datetime, 'ea', 0.3),
-                 (obs.twilight_morning_astronomical(Time(start),
-                                                    which='next').datetime, 'ma', 0.5),
-                 (obs.twilight_morning_nautical(Time(start),
-                                                which='next').datetime, 'mn', 0.3),
-                 (obs.twilight_morning_civil(Time(start),
-                                             which='next').datetime, 'mc', 0.2),
-                 (sunrise, 'sunrise', 0.1),
-                 ]
-
-    twilights.sort(key=lambda x: x[0])
-    final = {'sunset': 0.1, 'ec': 0.2, 'en': 0.3, 'ea': 0.5,
-             'ma': 0.3, 'mn': 0.2, 'mc': 0.1, 'sunrise': 0.0}
-    twilights.append((end, 'end', final[twilights[-1][1]]))
-
-    return twilights
-
-
-
-
-
-def plot_weather(date=None, verbose=False):
+class WeatherPlotter(object):
     '''
-    Make plot of the last 24 hours of weather or, if keyword date is set, make
-    plot of that UT day's weather.
+    Weather plot which is kept in memory between updates.  The figure, its
+    artists and the plotted arrays are built once.  Each update fetches only
+    the weather documents newer than the last one seen, appends them, drops
+    samples which have left the window and updates the artists in place with
+    set_data.  Nothing is rendered when no new samples arrived.
+
+    Windows long enough to be drawn from the rollups are refetched whole on
+    each update (they are at most a few thousand buckets).
     '''
-    if not date:
-        end = dt.utcnow()
-    else:
-        raise NotImplementedError
-
-    start = end - tdelta(1,0)
-
-    client = pymongo.MongoClient('192.168.1.101', 27017)
-    db = client['vysos']
-    weather = client.vysos['weather']
-    data = [x for x in weather.find({'date': {'$gt': start, '$lt': end}},
-                                    sort=[('date', pymongo.DESCENDING)])]
-    time = np.array([x['date'] for x in data])
-
-
-#     me.connect('vysos', host='192.168.1.101')
-#     data = weather.objects(__raw__={'date': {'$gt': start, '$lt': end}})
-#     time = np.array([x.date for x in data])
-
-    dpi=72
-    fig = plt.figure(figsize=(20,10), dpi=dpi)
-    night_plot_file_name = 'weather.png'
-    destination_path = os.path.abspath('/var/www/')
-    night_plot_file = os.path.join(destination_path, night_plot_file_name)
+    labels = ['Outside Temp (F)', 'Cloudiness (C)', 'Wind (kph)', 'Rain', 'Safe']
     plot_positions = [ [ [0.060, 0.700, 0.600, 0.220], [0.670, 0.700, 0.320, 0.220] ],
                        [ [0.060, 0.470, 0.600, 0.220], [0.670, 0.470, 0.320, 0.220] ],
                        [ [0.060, 0.240, 0.600, 0.220], [0.670, 0.240, 0.320, 0.220] ],
                        [ [0.060, 0.090, 0.600, 0.140], [0.670, 0.090, 0.320, 0.140] ],
                        [ [0.060, 0.020, 0.600, 0.060], [0.670, 0.020, 0.320, 0.060] ],
                      ]
-    labels = ['Outside Temp (F)', 'Cloudiness (C)', 'Wind (kph)', 'Rain', 'Safe']
-    data = [ np.array([(float(x['temp'])*1.8+32.) for x in data]),
-             np.array([float(x['clouds']) for x in data]),
-             np.array([float(x['wind']) for x in data]),
-             np.array([float(x['rain']) for x in data]),
-             np.array([float(x['safe']) for x in data]),
-           ]
-
-    windlim_data = list(data[2]*1.1) # multiply by 1.1 for plot limit
-    windlim_data.append(65) # minimum limit on plot is 65
     ylims = [ (25,95),
               (-45,15),
-              (-2,max(windlim_data)),
+              (-2,65),
               (3000,0),
               (-0.25, 1.1),
             ]
 
+    def __init__(self, days=1, verbose=False,
+                 plot_file=os.path.join(os.path.abspath('/var/www/'), 'weather.png')):
+        self.days = days
+        self.verbose = verbose
+        self.plot_file = plot_file
+        self.dpi = 72
+        self.client = pymongo.MongoClient('192.168.1.101', 27017)
+        self.db = self.client['vysos']
+        self.resolution = None
+        self.last_doc = None
+        self.last_bucket = None
+        self.time = np.array([], dtype=object)
+        self.data = [np.array([]) for label in self.labels]
+        self.spans = []
+        self.spans_until = None
+        self.fills = []
+        self.make_figure()
+
     ##-------------------------------------------------------------------------
-    ## Loop Over Plots
+    ## Build Figure
     ##-------------------------------------------------------------------------
-    for i,label in enumerate(labels):
-        if verbose: print(label)
-        if label in weather_limits.keys():
-            if label == 'Rain':
-                wsafe = np.where(data[i] > weather_limits[label][0])[0]
-                wwarn = np.where(np.array(data[i] <= weather_limits[label][0])\
-                                 & np.array(data[i] > weather_limits[label][1]) )[0]
-                wunsafe = np.where(data[i] <= weather_limits[label][1])[0]
-            else:
-                wsafe = np.where(data[i] < weather_limits[label][0])[0]
-                wwarn = np.where(np.array(data[i] >= weather_limits[label][0])\
-                                 & np.array(data[i] < weather_limits[label][1]) )[0]
-                wunsafe = np.where(data[i] >= weather_limits[label][1])[0]
-            if verbose: print(len(data[i]), len(wsafe), len(wwarn), len(wunsafe))
-            assert len(data[i]) - len(wsafe) - len(wwarn) - len(wunsafe) == 0
-
-
-        for lr in range(2):
-            t_axes = plt.axes(plot_positions[i][lr])
-            if label != 'Safe':
-                ## Overplot Twilights
-                twilights = get_twilights(start, end)
-                for j in range(len(twilights)-1):
-                    plt.axvspan(twilights[j][0], twilights[j+1][0], ymin=0, ymax=1,
-                                color='blue', alpha=twilights[j+1][2])
-                ## Plot data
+    def make_figure(self):
+        self.fig = plt.figure(figsize=(20,10), dpi=self.dpi)
+        self.axes = []
+        self.lines = []
+        self.mavg = []
+        for i,label in enumerate(self.labels):
+            axes = []
+            lines = []
+            for lr in range(2):
+                t_axes = self.fig.add_axes(self.plot_positions[i][lr])
+                artists = {}
                 if label in weather_limits.keys():
-                    t_axes.plot_date(time, data[i], 'ko', label=label,
+                    ## One scatter colored by safe/warn/unsafe category
+                    t_axes.xaxis_date()
+                    artists['category'] = t_axes.scatter([], [], c=[], s=4,
+                                          marker='o', edgecolors='none',
+                                          cmap=category_cmap,
+                                          vmin=0, vmax=category_cmap.N-1,
+                                          zorder=2, label=label)
+                elif label != 'Safe':
+                    artists['all'] = t_axes.plot_date([], [], 'ko', label=label,
                                      markersize=2, markeredgewidth=0,
-                                     drawstyle="default")
-                    if len(wsafe) > 0:
-                        t_axes.plot_date(time[wsafe], data[i][wsafe], 'go',
-                                         markersize=2, markeredgewidth=0,
-                                         drawstyle="default")
-                    if len(wwarn) > 0:
-                        t_axes.plot_date(time[wwarn], data[i][wwarn], 'yo',
-                                         markersize=2, markeredgewidth=0,
-                                         drawstyle="default")
-                    if len(wunsafe) > 0:
-                        t_axes.plot_date(time[wunsafe], data[i][wunsafe], 'ro',
-                                         markersize=2, markeredgewidth=0,
-                                         drawstyle="default")
-
+                                     drawstyle="default")[0]
                 else:
-                    t_axes.plot_date(time, data[i], 'ko', label=label,
-                                     markersize=2, markeredgewidth=0,
-                                     drawstyle="default")
-            else:
-                plt.fill_between(time, -1, data[i], where=np.array(data[i])>0, facecolor='green')
-                plt.fill_between(time, -1, data[i], where=np.array(data[i])<=0, facecolor='red')
-            if label == 'Wind (kph)':
-                matime, wind_mavg = moving_averagexy(time, data[i], 9)
-                t_axes.plot_date(matime, wind_mavg, 'k-')
-            if lr==0:
-                if i==0:
-                    plt.title('VYSOS Weather (at {})'.format(end.strftime('%Y/%m/%d %H:%M:%S UT')))
-                plt.ylabel(label)
-                plt.xlim(start, end)
-                t_axes.xaxis.set_major_locator(HourLocator(byhour=range(24)))
-                if label == 'Rain':
+                    t_axes.xaxis_date()
+                if label == 'Wind (kph)':
+                    artists['mavg'] = t_axes.plot_date([], [], 'k-')[0]
+                if lr==0:
+                    if i==0:
+                        self.title = t_axes.set_title('VYSOS Weather')
+                    t_axes.set_ylabel(label)
+                    t_axes.xaxis.set_major_locator(HourLocator(byhour=range(24)))
+                    if label == 'Rain':
+                        t_axes.get_yaxis().set_ticklabels([])
+                    if i == len(self.labels)-1:
+                        t_axes.set_yticks([])
+                        t_axes.get_yaxis().set_ticklabels([])
+                        t_axes.xaxis.set_major_formatter(DateFormatter('%H'))
+                    else:
+                        t_axes.grid(which='major', color='k')
+                        t_axes.grid(which='minor', color='k', alpha=0.8)
+                        t_axes.xaxis.set_major_formatter(plt.NullFormatter())
+                elif lr==1:
+                    t_axes.get_xaxis().set_ticklabels([])
                     t_axes.get_yaxis().set_ticklabels([])
-                if i == len(labels)-1:
-                    t_axes.set_yticks([])
-                    t_axes.get_yaxis().set_ticklabels([])
-                    t_axes.xaxis.set_major_formatter(DateFormatter('%H'))
-                else:
-                    plt.grid(which='major', color='k')
-                    plt.grid(which='minor', color='k', alpha=0.8)
-                    t_axes.xaxis.set_major_formatter(plt.NullFormatter())
-            elif lr==1:
-                plt.xlim(end - tdelta(0,1.25*60*60), end)
-                t_axes.get_xaxis().set_ticklabels([])
-                t_axes.get_yaxis().set_ticklabels([])
-                t_axes.xaxis.set_major_locator(HourLocator(byhour=range(24)))
-                t_axes.xaxis.set_minor_locator(MinuteLocator(range(0,60,15)))
-                if i == len(labels)-1:
-                    t_axes.set_yticks([])
-                    t_axes.xaxis.set_major_formatter(DateFormatter('%H:%M'))
-                    t_axes.xaxis.set_minor_formatter(DateFormatter('%H:%M'))
-                else:
-                    plt.grid(which='major', color='k')
-                    plt.grid(which='minor', color='k', alpha=0.8)
-                    t_axes.xaxis.set_major_formatter(plt.NullFormatter())
-            plt.ylim(ylims[i])
-            if i == len(labels)-1:
-                plt.xlabel("UT Time")
+                    t_axes.xaxis.set_major_locator(HourLocator(byhour=range(24)))
+                    t_axes.xaxis.set_minor_locator(MinuteLocator(range(0,60,15)))
+                    if i == len(self.labels)-1:
+                        t_axes.set_yticks([])
+                        t_axes.xaxis.set_major_formatter(DateFormatter('%H:%M'))
+                        t_axes.xaxis.set_minor_formatter(DateFormatter('%H:%M'))
+                    else:
+                        t_axes.grid(which='major', color='k')
+                        t_axes.grid(which='minor', color='k', alpha=0.8)
+                        t_axes.xaxis.set_major_formatter(plt.NullFormatter())
+                t_axes.set_ylim(self.ylims[i])
+                if i == len(self.labels)-1:
+                    t_axes.set_xlabel("UT Time")
+                axes.append(t_axes)
+                lines.append(artists)
+            self.axes.append(axes)
+            self.lines.append(lines)
 
-    plt.savefig(night_plot_file, dpi=dpi, bbox_inches='tight')
+    ##-------------------------------------------------------------------------
+    ## Fetch Data
+    ##-------------------------------------------------------------------------
+    def values(self, docs):
+        return [ np.array([(float(x['temp'])*1.8+32.) for x in docs]),
+                 np.array([float(x['clouds']) for x in docs]),
+                 np.array([float(x['wind']) for x in docs]),
+                 np.array([float(x['rain']) for x in docs]),
+                 np.array([float(x.get('safe_min', x['safe'])) for x in docs]),
+               ]
+
+    def reload(self, start, end):
+        '''
+        Replace the plotted arrays with the whole window.
+        '''
+        self.resolution, docs = fetch_series(self.db, 'weather', start, end,
+                                             max_points=5000)
+        if self.verbose: print(f'Using {self.resolution} weather data')
+        if self.resolution == 'raw':
+            ## Held copies of compressed samples are not stored, so look up
+            ## the last stored document to continue from
+            self.last_doc = self.db['weather'].find_one({'date': {'$lt': end}},
+                                sort=[('date', pymongo.DESCENDING)])
+            changed = len(docs) > 0
+        else:
+            self.last_doc = None
+            changed = len(docs) > 0 and docs[-1] != self.last_bucket
+            self.last_bucket = docs[-1] if len(docs) > 0 else None
+        self.time = np.array([x['date'] for x in docs], dtype=object)
+        self.data = self.values(docs)
+        return changed
+
+    def append(self, start, end):
+        '''
+        Append the documents stored since the last one seen and drop samples
+        before start.  Return the number of samples appended.
+        '''
+        new = [doc for doc in self.db['weather'].find(
+               {'date': {'$gt': self.last_doc['date'], '$lt': end}},
+               sort=[('date', pymongo.ASCENDING)])]
+        ## Expand from the last stored document so that a compressed sample
+        ## keeps being held until the next one or its heartbeat
+        docs = expand_documents([self.last_doc] + new, end=end)
+        if len(self.time) > 0:
+            docs = [doc for doc in docs if doc['date'] > self.time[-1]]
+        if len(new) > 0:
+            self.last_doc = new[-1]
+        first = bisect_left(self.time, start)
+        self.time = np.concatenate([self.time[first:],
+                                    np.array([x['date'] for x in docs], dtype=object)])
+        self.data = [np.concatenate([old[first:], added])
+                     for old, added in zip(self.data, self.values(docs))]
+        return len(docs)
+
+    ##-------------------------------------------------------------------------
+    ## Update Artists
+    ##-------------------------------------------------------------------------
+    def update_twilights(self, start, end):
+        '''
+        Shade the twilights for the next day so they only need to be redrawn
+        once the window has moved past them.
+        '''
+        if self.spans_until is not None and end < self.spans_until:
+            return
+        for span in self.spans:
+            span.remove()
+        self.spans = []
+        self.spans_until = end + tdelta(1,0)
+        twilights = twilight_spans(start, self.spans_until)
+        for i,label in enumerate(self.labels):
+            if label == 'Safe':
+                continue
+            for lr in range(2):
+                for begin, finish, alpha in twilights:
+                    self.spans.append(self.axes[i][lr].axvspan(begin, finish,
+                                      ymin=0, ymax=1, color='blue', alpha=alpha))
+
+    def update_artists(self, start, end):
+        '''
+        Draw the samples on each axes, thinned to the minimum and maximum in
+        each pixel column so the render time does not grow with the window.
+        '''
+        time = self.time
+        x = date2num(list(time))
+        xlims = [(start, end), (end - tdelta(0,1.25*60*60), end)]
+        for fill in self.fills:
+            fill.remove()
+        self.fills = []
+        for i,label in enumerate(self.labels):
+            data = self.data[i]
+            if label in weather_limits.keys():
+                codes = classify(data, label)
+            if label == 'Wind (kph)':
+                matime, wind_mavg = moving_averagexy(time, data, 9)
+                manum = date2num(list(matime))
+            for lr in range(2):
+                t_axes = self.axes[i][lr]
+                artists = self.lines[i][lr]
+                xmin, xmax = [date2num(lim) for lim in xlims[lr]]
+                shown = minmax_indices(x, data, xmin, xmax, pixel_width(t_axes))
+                if label in weather_limits.keys():
+                    artists['category'].set_offsets(np.column_stack([x[shown], data[shown]]))
+                    artists['category'].set_array(codes[shown])
+                elif label != 'Safe':
+                    artists['all'].set_data(time[shown], data[shown])
+                else:
+                    self.fills.append(t_axes.fill_between(time[shown], -1, data[shown],
+                                      where=data[shown]>0, facecolor='green'))
+                    self.fills.append(t_axes.fill_between(time[shown], -1, data[shown],
+                                      where=data[shown]<=0, facecolor='red'))
+                if label == 'Wind (kph)':
+                    mashown = minmax_indices(manum, wind_mavg, xmin, xmax,
+                                             pixel_width(t_axes))
+                    artists['mavg'].set_data(matime[mashown], wind_mavg[mashown])
+                    windlim_data = list(data*1.1) # multiply by 1.1 for plot limit
+                    windlim_data.append(65) # minimum limit on plot is 65
+                    t_axes.set_ylim(-2, max(windlim_data))
+                t_axes.set_xlim(*xlims[lr])
+        self.title.set_text('VYSOS Weather (at {})'.format(end.strftime('%Y/%m/%d %H:%M:%S UT')))
+
+    def update(self, force=False):
+        '''
+        Bring the plot up to date and save it if anything changed (or force is
+        set).  Returns True if the plot was saved.
+        '''
+        end = dt.utcnow()
+        start = end - tdelta(self.days,0)
+        name, seconds = choose_resolution(start, end, max_points=5000)
+        if name == 'raw' and self.resolution == 'raw' and self.last_doc is not None:
+            changed = self.append(start, end) > 0
+        else:
+            changed = self.reload(start, end)
+        if self.verbose: print(f'{len(self.time):d} samples, changed = {changed}')
+        if not changed and not force:
+            return False
+        self.update_twilights(start, end)
+        self.update_artists(start, end)
+        self.fig.savefig(self.plot_file, dpi=self.dpi, bbox_inches='tight')
+        return True
+
+
+def plot_weather(date=None, verbose=False, days=1):
+    '''
+    Make plot of the last 24 hours (or number of days) of weather or, if
+    keyword date is set, make plot of that UT day's weather.  Windows longer
+    than a day are drawn from the weather rollups.
+    '''
+    if date:
+        raise NotImplementedError
+    plotter = WeatherPlotter(days=days, verbose=verbose)
+    plotter.update(force=True)
+    plt.close(plotter.fig)
+    plotter.client.close()
 
 
 def main():
@@ -241,20 +326,22 @@ def main():
     parser.add_argument("-d", dest="date",
         required=False, type=str,
         help="Date of night to plot in YYYYMMDDUT format")
+    parser.add_argument("--days", dest="days",
+        required=False, type=float, default=1,
+        help="Number of days of weather to plot (default = 1)")
     args = parser.parse_args()
 
     if not args.date:
         args.date = dt.utcnow().strftime("%Y%m%dUT")
 
     if args.loop:
+        ## Keep the plot in memory and only add the new samples each cycle
+        plotter = WeatherPlotter(days=args.days, verbose=args.verbose)
         while True:
-            ## Set date to tonight
-            now = dt.utcnow()
-            date_string = now.strftime("%Y%m%dUT")
-            plot_weather(verbose=args.verbose)
-            time.sleep(120)
+            plotter.update()
+            sleep(120)
     else:
-        plot_weather(verbose=args.verbose)
+        plot_weather(verbose=args.verbose, days=args.days)
 
 
 if __name__ == '__main__':
@@ -11,10 +11,18 @@ from argparse import ArgumentParser
 import re
 from datetime import datetime as dt
 import tempfile
+import hashlib
+import json
+import inspect
+import subprocess
+import logging
+import multiprocessing
+from contextlib import contextmanager
 
 import matplotlib as mpl
 mpl.use('Agg')
 
+import pymongo
 import mongoengine as me
 
 import numpy as np
@@ -22,10 +30,203 @@ from astropy import units as u
 from astropy import coordinates as c
 from astropy.io import fits
 from astropy.table import Table, Column, vstack
+from astropy.wcs.utils import proj_plane_pixel_scales
 
 import SIDRE
 
 from VYSOS.schema import Image as ImageDoc
+from VYSOS.schema import ImageTiming
+from VYSOS.calibration_cache import master_cache
+from VYSOS.results_sink import results_sink
+
+
+##-------------------------------------------------------------------------
+## Time Analysis Stages
+##-------------------------------------------------------------------------
+@contextmanager
+def timed(timing, stage):
+    '''
+    Record the wall time spent in the enclosed block as timing[stage] in
+    seconds.  Time is recorded even if the stage raises.
+    '''
+    tick = dt.utcnow()
+    try:
+        yield
+    finally:
+        timing[stage] = (dt.utcnow()-tick).total_seconds()
+
+
+##-------------------------------------------------------------------------
+## Result Cache
+##-------------------------------------------------------------------------
+## Parameters which change the analysis result.  Any change here (or in the
+## SIDRE version) invalidates previously recorded results.
+analysis_params = {'downsample': 2,
+                   'SIPorder': 4,
+                  }
+result_cache = {'hits': 0, 'misses': 0}
+
+def result_key(file):
+    '''
+    Key identifying an analysis result: the file size and modification time,
+    the SIDRE version, and the analysis parameters.
+    '''
+    stat = os.stat(file)
+    key = json.dumps([stat.st_size, int(stat.st_mtime), SIDRE.version.version,
+                      analysis_params], sort_keys=True)
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def connect_db():
+    '''
+    Connect mongoengine to the vysos database, once per process.
+    '''
+    try:
+        me.connection.get_connection()
+    except me.connection.ConnectionFailure:
+        me.connect('vysos', host='192.168.1.101')
+
+
+def cached_result(file, key, log):
+    '''
+    Return the recorded Image document for file if it was made with key.
+    Needs a mongoengine connection.  If there is none, or the lookup fails,
+    the file is analyzed again.
+    '''
+    try:
+        return ImageDoc.objects(filename=os.path.basename(file),
+                                result_key=key, analyzed=True).first()
+    except me.connection.ConnectionFailure:
+        log.debug('Not connected to mongo db, not using the result cache')
+    except pymongo.errors.PyMongoError as e:
+        log.warning(f'Result cache lookup failed: {e}')
+    return None
+
+
+def result_cache_report():
+    total = result_cache['hits'] + result_cache['misses']
+    rate = result_cache['hits'] / total * 100. if total > 0 else 0.
+    return f"Result cache: {result_cache['hits']:d} hits of {total:d} images ({rate:.0f}%)"
+
+
+##-------------------------------------------------------------------------
+## SIDRE Keyword Support
+##-------------------------------------------------------------------------
+def accepts(function, *names):
+    '''
+    Return True if function explicitly takes every one of the keyword
+    arguments names.  A catch all **kwargs does not count.
+    '''
+    try:
+        parameters = inspect.signature(function).parameters
+    except (TypeError, ValueError):
+        return False
+    return all([name in parameters.keys() for name in names])
+
+## Older SIDRE versions look the master bias up themselves
+bias_takes_master = accepts(SIDRE.ScienceImage.bias_correct, 'master_bias')
+
+
+##-------------------------------------------------------------------------
+## Build Master Bias
+##-------------------------------------------------------------------------
+def build_master_bias(date, rebuild=False):
+    master = None if rebuild else SIDRE.utils.get_master(date, type='Bias')
+    if not master:
+        SIDRE.calibration.make_master_bias(date)
+        master = SIDRE.utils.get_master(date, type='Bias')
+    return master
+
+
+##-------------------------------------------------------------------------
+## Astrometry with Warm Start
+##-------------------------------------------------------------------------
+## Last good solution for each (telescope, target).  Consecutive frames of a
+## target are only dithered by a few arcseconds, so the previous solution is
+## a good seed for the next one and its geometry is what the next one should
+## look like.
+last_solution = {}
+warm_start_radius = 0.25*u.degree
+## Seeding needs SIDRE's solve_astrometry to take these keywords
+seeded_solve = accepts(SIDRE.ScienceImage.solve_astrometry, 'ra', 'dec', 'radius')
+## Ways the external solver fails
+solve_failures = (OSError, RuntimeError, subprocess.SubprocessError)
+## Largest change from the previous solution accepted for a seeded solution
+verify_tolerances = {'scale': 0.01,
+                     'rotation': 0.5*u.degree,
+                     'pointing_error': 1.0*u.arcmin,
+                    }
+
+
+def solution_geometry(im):
+    '''
+    Return the pixel scale, rotation and pointing error (offset from the
+    header pointing) of the WCS solution of im, or None if it has none.
+    '''
+    if im.wcs_pointing is None or im.header_pointing is None or im.ccd.wcs is None:
+        return None
+    wcs = im.ccd.wcs.celestial
+    cd = wcs.pixel_scale_matrix
+    return {'pointing': im.wcs_pointing,
+            'scale': np.mean(proj_plane_pixel_scales(wcs)),
+            'rotation': c.Angle(np.degrees(np.arctan2(cd[0,1], cd[1,1])), unit=u.degree),
+            'pointing_error': im.wcs_pointing.separation(im.header_pointing),
+           }
+
+
+def verify_solution(solution, previous, tolerances=verify_tolerances):
+    '''
+    A seeded solve is constrained to the neighborhood of the seed, so landing
+    there proves nothing.  Instead require the plate scale, the rotation and
+    the telescope pointing error to match the previous solution of the
+    target, which a wrong match is very unlikely to reproduce.
+    '''
+    if solution is None:
+        return False
+    if abs(solution['scale']/previous['scale'] - 1) > tolerances['scale']:
+        return False
+    rotation = (solution['rotation'] - previous['rotation']).wrap_at(180*u.degree)
+    if abs(rotation) > tolerances['rotation']:
+        return False
+    pointing_error = abs(solution['pointing_error'] - previous['pointing_error'])
+    return pointing_error <= tolerances['pointing_error']
+
+
+def solve_astrometry(im, key):
+    '''
+    Try a solve constrained to the neighborhood of the last good solution for
+    this (telescope, target) and fall back to a blind solve if that fails or
+    does not verify.
+    '''
+    previous = last_solution.get(key, None) if key[1] is not None else None
+    if previous is not None and not seeded_solve:
+        im.log.debug('SIDRE solve_astrometry can not be seeded')
+        previous = None
+    if previous is not None and im.header_pointing is not None:
+        if previous['pointing'].separation(im.header_pointing) > warm_start_radius:
+            im.log.debug('Header pointing has moved, not using warm start')
+            previous = None
+    if previous is not None:
+        im.log.info(f'Trying astrometry seeded from previous {key[1]} frame')
+        seed = previous['pointing']
+        try:
+            im.solve_astrometry(**analysis_params,
+                                ra=seed.ra.deg, dec=seed.dec.deg,
+                                radius=warm_start_radius.to(u.degree).value)
+        except solve_failures as e:
+            im.log.warning(f'Seeded astrometry failed: {e}')
+        else:
+            solution = solution_geometry(im)
+            if verify_solution(solution, previous):
+                last_solution[key] = solution
+                return
+        im.log.info('Seeded solution did not verify, running blind solve')
+    im.solve_astrometry(**analysis_params)
+    solution = solution_geometry(im)
+    if solution is not None:
+        last_solution[key] = solution
+    else:
+        last_solution.pop(key, None)
 
 
 ##-------------------------------------------------------------------------
@@ -35,10 +236,26 @@ def measure_image(file,\
                  verbose=False,\
                  nographics=False,\
                  record=True,\
+                 force=False,\
                  ):
     tick = dt.utcnow()
+    timing = {}
     file = os.path.abspath(os.path.expanduser(file))
 
+    log = logging.getLogger('measure_image')
+    if record:
+        connect_db()
+
+    ## Reuse the recorded result if nothing has changed
+    key = result_key(file)
+    if not force:
+        cached = cached_result(file, key, log)
+        if cached is not None:
+            result_cache['hits'] += 1
+            log.info(f'Using cached result for {os.path.basename(file)}')
+            return cached
+    result_cache['misses'] += 1
+
     ## Try to determine which telescope
     image_info = ImageDoc(filename=os.path.basename(file))
     try:
@@ -57,8 +274,9 @@ def measure_image(file,\
         os.mkdir(os.path.join('/Users/vysosuser/V20Data/AnalysisLogs', imageUTdate))
     logfile = os.path.join('/Users/vysosuser/V20Data/AnalysisLogs', imageUTdate, logfilename)
 
-    im = SIDRE.ScienceImage(file, logfile=logfile, verbose=verbose)
-    im.get_header_pointing()
+    with timed(timing, 'read'):
+        im = SIDRE.ScienceImage(file, logfile=logfile, verbose=verbose)
+        im.get_header_pointing()
 
     # Exposure Time
     try:
@@ -71,6 +289,11 @@ def measure_image(file,\
                                             '%Y-%m-%dT%H:%M:%S')
     except:
         pass
+    # Target
+    try:
+        image_info.target = im.ccd.header.get('OBJECT')
+    except:
+        pass
     # Filter
     if image_info.telescope == 'V5':
         image_info.filter = 'PSr'
@@ -91,17 +314,29 @@ def measure_image(file,\
         pass
 
 
-    try:
-        if not SIDRE.utils.get_master(im.date, type='Bias'):
-            SIDRE.calibration.make_master_bias(im.date)
-        im.bias_correct()
-    except:
-        pass
-    im.gain_correct()
-    im.create_deviation()
-    im.make_source_mask()
-    im.subtract_background()
-    im.solve_astrometry(downsample=2, SIPorder=4)
+    with timed(timing, 'bias_correct'):
+        try:
+            if bias_takes_master:
+                master_bias = master_cache.get(image_info.telescope, imageUTdate, 'Bias',
+                                               lambda rebuild: build_master_bias(im.date, rebuild))
+                if master_bias is None:
+                    im.log.warning('No master bias, image is not bias corrected')
+                else:
+                    im.bias_correct(master_bias=master_bias)
+            else:
+                build_master_bias(im.date)
+                im.bias_correct()
+        except:
+            im.log.warning('Bias correction failed, image is not bias corrected',
+                           exc_info=True)
+    with timed(timing, 'gain_correct'):
+        im.gain_correct()
+    with timed(timing, 'background'):
+        im.create_deviation()
+        im.make_source_mask()
+        im.subtract_background()
+    with timed(timing, 'astrometry'):
+        solve_astrometry(im, (image_info.telescope, image_info.target))
     perr = im.calculate_pointing_error()
     try:
         image_info.perr_arcmin=perr.to(u.arcmin).value
@@ -117,8 +352,10 @@ def measure_image(file,\
 
 
     ## Determine Typical FWHM
-    im.extract()
-    im.determine_FWHM()
+    with timed(timing, 'extract'):
+        im.extract()
+    with timed(timing, 'fwhm'):
+        im.determine_FWHM()
     image_info.FWHM_pix = im.FWHM_pix
     image_info.ellipticity = im.ellipticity
 
@@ -148,6 +385,7 @@ def measure_image(file,\
 
     image_info.analyzed=True
     image_info.SIDREversion=SIDRE.version.version
+    image_info.result_key = key
 
     if nographics is True:
         fulljpeg = None
@@ -158,47 +396,92 @@ def measure_image(file,\
         im.render_jpeg(jpegfilename=fulljpeg,
                        overplot_assoc=False, overplot_pointing=True)
     
+    timing['total'] = (dt.utcnow()-tick).total_seconds()
+    image_info.timing = ImageTiming(**timing)
+    im.log.info('Stage times: ' + ', '.join([f'{stage} {timing[stage]:.1f} s'
+                for stage in ImageTiming.stages if stage in timing.keys()]))
+
     if record:
-        im.log.info('Connecting to mongo db at 192.168.1.101')
-        try:
-            me.connect('vysos', host='192.168.1.101')
-        except:
-            im.log.error('Could not connect to mongo db')
-            raise Error('Failed to connect to mongo')
-        else:
-            # Remove old entries for this image file
-            for entry in ImageDoc.objects(filename=os.path.basename(file)):
-                im.log.debug('Removing old image info entry for this file')
-                entry.delete()
-            # Save JPEG to MongoDB
-#             if not nographics:
-#                 if fulljpeg is not None:
-#                     with open(fulljpeg, 'rb') as imageData:
-#                         image_bytes = imageData.read()
-#                         with tempfile.TemporaryFile() as f:
-#                             f.write(bytearray(image_bytes))
-#                             f.flush()
-#                             f.seek(0)
-#                             image_info.full_field_jpeg.put(f)
-#                 if cropjpeg is not None:
-#                     with open(cropjpeg, 'rb') as imageData:
-#                         image_bytes = imageData.read()
-#                         with tempfile.TemporaryFile() as f:
-#                             f.write(bytearray(image_bytes))
-#                             f.flush()
-#                             f.seek(0)
-#                             image_info.cropped_jpeg.put(f)
-
-            # Save new entry for this image file
-            im.log.debug('Adding image info to mongo database')
-            image_info.save()
+        record_image(image_info, im.log)
     else:
-        print(image_info)
+        im.log.debug(f'Results:\n{image_info}')
 
     tock = dt.utcnow()
     elapsed = (tock-tick).total_seconds()
     im.log.info(f'Processing time = {elapsed:.1f} s')
 
+    return image_info
+
+
+##-------------------------------------------------------------------------
+## Process Pool Worker
+##-------------------------------------------------------------------------
+## Workers are started fresh rather than forked, so they do not inherit the
+## parent's mongo client (pymongo clients are not fork safe)
+worker_context = multiprocessing.get_context('spawn')
+worker_log = logging.getLogger('measure_image.worker')
+
+
+def init_worker():
+    '''
+    Import the analysis stack once in each worker process so that every
+    worker holds its own SIDRE state for the life of the pool, and connect
+    the worker to the database.
+    '''
+    import SIDRE
+    connect_db()
+
+
+def measure_in_worker(file, force=False):
+    '''
+    Analyze one file without recording it.  The parent process writes the
+    results so that the images collection is filled in time order.
+    '''
+    tick = dt.utcnow()
+    hits = result_cache['hits']
+    try:
+        image_info = measure_image(file, nographics=True, record=False,
+                                   force=force)
+    except:
+        worker_log.warning(f'MeasureImage failed on {file}', exc_info=True)
+        image_info = None
+    cached = (result_cache['hits'] > hits)
+    elapsed = (dt.utcnow()-tick).total_seconds()
+    return file, os.getpid(), elapsed, image_info, cached
+
+
+##-------------------------------------------------------------------------
+## Record Image Info
+##-------------------------------------------------------------------------
+def record_image(image_info, log):
+    '''
+    Queue image_info to replace the entry for this image file in the images
+    collection.  Results are written in bulk by the results sink.  Assumes
+    mongoengine is connected.
+    '''
+    # Save JPEG to MongoDB
+#     if not nographics:
+#         if fulljpeg is not None:
+#             with open(fulljpeg, 'rb') as imageData:
+#                 image_bytes = imageData.read()
+#                 with tempfile.TemporaryFile() as f:
+#                     f.write(bytearray(image_bytes))
+#                     f.flush()
+#                     f.seek(0)
+#                     image_info.full_field_jpeg.put(f)
+#         if cropjpeg is not None:
+#             with open(cropjpeg, 'rb') as imageData:
+#                 image_bytes = imageData.read()
+#                 with tempfile.TemporaryFile() as f:
+#                     f.write(bytearray(image_bytes))
+#                     f.flush()
+#                     f.seek(0)
+#                     image_info.cropped_jpeg.put(f)
+
+    # Queue new entry for this image file
+    log.debug('Queueing image info for mongo database')
+    results_sink.add(image_info)
+
 
 def main():
     ##-------------------------------------------------------------------------
@@ -212,6 +495,9 @@ def main():
     parser.add_argument("-p", "--print",
         action="store_true", dest="printonly",
         default=False, help="Print results only, do not record to database.")
+    parser.add_argument("-f", "--force",
+        action="store_true", dest="force",
+        default=False, help="Analyze even if an unchanged result is recorded.")
     parser.add_argument("-n", "--no-graphics",
         action="store_true", dest="nographics",
         default=False, help="Turn off generation of graphics")
@@ -221,10 +507,13 @@ def main():
         help="File Name of Input Image File")
     args = parser.parse_args()
 
-    measure_image(args.filename,
+    image_info = measure_image(args.filename,
                   nographics=True, #args.nographics,
                   record=not args.printonly,
+                  force=args.force,
                   verbose=args.verbose)
+    if args.printonly:
+        print(image_info)
 
 
 if __name__ == '__main__':
@@ -8,11 +8,71 @@ import fnmatch
 import numpy
 from datetime import datetime as dt
 import glob
+import logging
 from argparse import ArgumentParser
+from functools import partial
 import astropy.io.fits as fits
+import mongoengine as me
 
 import IQMon
-from measure_image import measure_image
+import measure_image as mi
+from measure_image import measure_image, record_image
+from measure_image import init_worker, measure_in_worker, worker_context
+from analysis_server import submit_image
+from triage import triage_image
+
+
+##-------------------------------------------------------------------------
+## Sort Files by Observation Time
+##-------------------------------------------------------------------------
+def image_time(file):
+    finddate = re.search('([0-9]{8})at([0-9]{6})', os.path.basename(file))
+    if finddate is None:
+        return dt.utcnow()
+    return dt.strptime(f"{finddate.group(1)} {finddate.group(2)}", '%Y%m%d %H%M%S')
+
+
+def measure_files(files, workers, log, force=False):
+    '''
+    Analyze files using a pool of worker processes and record the results
+    in the order the files were taken.
+    '''
+    files = sorted(files, key=image_time)
+    tick = dt.utcnow()
+    progress = {}
+    with worker_context.Pool(processes=workers, initializer=init_worker) as pool:
+        me.connect('vysos', host='192.168.1.101')
+        ## imap returns results in submission order, so records are time ordered
+        worker = partial(measure_in_worker, force=force)
+        for file, pid, elapsed, image_info, cached in pool.imap(worker, files):
+            if pid not in progress.keys():
+                progress[pid] = {'nframes': 0, 'nfailed': 0, 'ncached': 0, 'time': 0.}
+            progress[pid]['time'] += elapsed
+            if image_info is None:
+                progress[pid]['nfailed'] += 1
+                continue
+            progress[pid]['nframes'] += 1
+            if cached:
+                progress[pid]['ncached'] += 1
+            else:
+                record_image(image_info, log)
+
+    mi.results_sink.flush()
+    log.info(mi.results_sink.report())
+
+    wall = (dt.utcnow()-tick).total_seconds()
+    nframes = sum([progress[pid]['nframes'] for pid in progress.keys()])
+    log.info(f"Analyzed {nframes:d} of {len(files):d} files in {wall:.0f} s using {workers:d} workers")
+    for pid in sorted(progress.keys()):
+        p = progress[pid]
+        log.info(f"  Worker {pid}: {p['nframes']:d} frames, {p['nfailed']:d} failed, "
+                 f"{p['ncached']:d} cached, {p['time']:.0f} s analyzing")
+    if wall > 0:
+        log.info(f"  Throughput = {nframes/wall*3600.:.0f} frames/hour")
+    ncached = sum([progress[pid]['ncached'] for pid in progress.keys()])
+    if nframes > 0:
+        log.info(f"  Result cache: {ncached:d} hits of {nframes:d} images ({ncached/nframes*100.:.0f}%)")
+    return progress
 
 
 def main(argv=None):
@@ -25,6 +85,15 @@ def main(argv=None):
     parser.add_argument("-n", "--no-clobber",
         dest="clobber", action="store_false", default=True, 
         help="Delete previous logs and summary files for this night. (default = True)")
+    parser.add_argument("-w", "--workers",
+        dest="workers", required=False, default=1, type=int,
+        help="Number of worker processes to analyze images with (default = 1)")
+    parser.add_argument("-s", "--server",
+        action="store_true", dest="server", default=False,
+        help="Submit images to a running analysis_server.")
+    parser.add_argument("-f", "--force",
+        action="store_true", dest="force", default=False,
+        help="Analyze images even if an unchanged result is recorded.")
     ## add arguments
     parser.add_argument("-t", "--telescope",
         dest="telescope", required=True, type=str,
@@ -64,8 +133,36 @@ def main(argv=None):
         files = glob.glob(os.path.join(location, '*.fts'))
         files.extend(glob.glob(os.path.join(location, '*.fts.fz')))
         print(f"Found {len(files):d} files in images directory")
+        logger = logging.getLogger('measure_night')
+        logger.setLevel(logging.INFO)
+        logger.addHandler(logging.StreamHandler())
+        me.connect('vysos', host='192.168.1.101')
+        to_analyze = []
         for file in files:
-            measure_image(file, nographics=True)
+            try:
+                image_info, analyze = triage_image(file)
+            except:
+                ## Let the full analysis decide what to do with the frame
+                logger.warning(f'Triage failed on {file}, analyzing it', exc_info=True)
+                analyze = True
+            if analyze:
+                to_analyze.append(file)
+        files = to_analyze
+        print(f"Triage selected {len(files):d} files for full analysis")
+        if args.server:
+            for file in sorted(files, key=image_time):
+                try:
+                    submit_image(file, nographics=True, force=args.force)
+                except RuntimeError as e:
+                    print(e)
+        elif args.workers > 1:
+            measure_files(files, args.workers, logger, force=args.force)
+        else:
+            for file in files:
+                measure_image(file, nographics=True, force=args.force)
+            mi.results_sink.flush()
+            print(mi.result_cache_report())
+            print(mi.results_sink.report())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Column oriented loading of one night of status and image results for the
+nightly plots.  Each collection is queried once per night with a projection
+onto the fields which are plotted, and the documents are turned into a dict
+of NumPy arrays (NaN where a document lacks a field) which every panel
+selects from with have().  NightData keeps the columns in memory for the
+plotting daemon and appends only the documents inserted since it last looked,
+plus any image documents which were still waiting to be analyzed.
+"""
+
+from datetime import datetime as dt
+from datetime import timedelta as tdelta
+
+import numpy as np
+
+## Numeric status fields used by the nightly plots
+status_fields = ['boltwood ambient temp',
+                 'boltwood sky temp',
+                 'boltwood cloud condition',
+                 'boltwood humidity',
+                 'boltwood rain condition',
+                 'boltwood wind speed',
+                 'boltwood wind condition',
+                 'RCOS temperature (primary)',
+                 'RCOS temperature (truss)',
+                 'RCOS fan speed',
+                 'CBW fan state',
+                ]
+
+## Numeric image fields used by the nightly plots
+image_fields = ['FWHM pix',
+                'zero point',
+                'ellipticity',
+                'pointing error arcmin',
+               ]
+
+
+def to_columns(docs, fields):
+    '''
+    Return a dict of field to float array with NaN where the field is
+    missing or not a number.
+    '''
+    columns = {field: np.full(len(docs), np.nan) for field in fields}
+    for i, doc in enumerate(docs):
+        for field in fields:
+            try:
+                columns[field][i] = float(doc[field])
+            except (KeyError, TypeError, ValueError):
+                pass
+    return columns
+
+
+def parse_times(docs, date_key, time_key, format, trim=0, offset=tdelta(0)):
+    '''
+    Return an object array of datetimes built from the date_key and time_key
+    strings of each document (with trim characters dropped from the end of
+    the time), or None where they are missing.
+    '''
+    times = np.empty(len(docs), dtype=object)
+    for i, doc in enumerate(docs):
+        try:
+            time_string = doc[time_key][:-trim] if trim > 0 else doc[time_key]
+            times[i] = dt.strptime('{} {}'.format(doc[date_key], time_string),
+                                   format) + offset
+        except (KeyError, TypeError, ValueError):
+            times[i] = None
+    return times
+
+
+def have(columns, *fields):
+    '''
+    Return a boolean mask of the rows which have a value for every field.
+    '''
+    mask = None
+    for field in fields:
+        column = columns[field]
+        if column.dtype == object:
+            present = np.array([x is not None for x in column], dtype=bool)
+        else:
+            present = np.isfinite(column)
+        mask = present if mask is None else mask & present
+    return mask
+
+
+def append_columns(columns, new):
+    '''
+    Return columns with the rows of new appended.
+    '''
+    return {key: np.concatenate([columns[key], new[key]]) for key in columns.keys()}
+
+
+def replace_row(columns, index, new, row=0):
+    '''
+    Replace row index of columns with row of new, in place.
+    '''
+    for key in columns.keys():
+        columns[key][index] = new[key][row]
+
+
+##-------------------------------------------------------------------------
+## Load One Night
+##-------------------------------------------------------------------------
+def status_query(date_string):
+    date_string_yesterday = (dt.strptime(date_string, '%Y%m%dUT') - tdelta(1,0)).strftime('%Y%m%dUT')
+    return {'$or':[ {'UT date':date_string_yesterday},
+                    {'UT date':date_string}]}
+
+
+def status_columns(docs):
+    '''
+    Return the status columns for docs.  Adds 'UT' (from UT date and UT time)
+    and 'boltwood UT' (from the Boltwood date and time, which are HST) time
+    columns and a boolean 'current' column.
+    '''
+    columns = to_columns(docs, status_fields)
+    columns['UT'] = parse_times(docs, 'UT date', 'UT time', '%Y%m%dUT %H:%M:%S')
+    columns['boltwood UT'] = parse_times(docs, 'boltwood date', 'boltwood time',
+                                         '%Y-%m-%d %H:%M:%S', trim=3,
+                                         offset=tdelta(0, 10*60*60))
+    columns['current'] = np.array([bool(doc.get('current', False)) for doc in docs],
+                                  dtype=bool)
+    return columns
+
+
+def image_query(date_string):
+    return {'date':date_string, 'exposure start':{'$exists':True}}
+
+
+def image_columns(docs):
+    columns = to_columns(docs, image_fields)
+    columns['exposure start'] = np.empty(len(docs), dtype=object)
+    for i, doc in enumerate(docs):
+        columns['exposure start'][i] = doc['exposure start']
+    return columns
+
+
+status_projection = {field: 1 for field in status_fields + ['UT date', 'UT time',
+                     'boltwood date', 'boltwood time', 'current']}
+image_projection = {field: 1 for field in image_fields + ['exposure start']}
+## Fields NightData needs to follow image documents which are replaced in place
+image_refresh_projection = dict(image_projection, date=1, analyzed=1)
+
+
+def load_status(status, date_string):
+    '''
+    Fetch the status documents for the night of date_string in one query.
+    '''
+    projection = dict(status_projection)
+    projection['_id'] = 0
+    docs = [entry for entry in status.find(status_query(date_string), projection)]
+    return status_columns(docs)
+
+
+def load_images(images, date_string):
+    '''
+    Fetch the image results for date_string in one query.
+    '''
+    projection = dict(image_projection)
+    projection['_id'] = 0
+    docs = [entry for entry in images.find(image_query(date_string), projection)]
+    return image_columns(docs)
+
+
+##-------------------------------------------------------------------------
+## Keep One Night in Memory
+##-------------------------------------------------------------------------
+class NightData(object):
+    '''
+    The status and image columns for one night, kept in memory between
+    refreshes.  Each refresh only queries for documents with an _id greater
+    than the last one seen (ObjectIds increase with insertion time for each
+    writer) and appends them, so the cost of a refresh scales with the number
+    of new documents rather than with the length of the night.
+
+    Image documents are replaced in place (keeping their _id) when the
+    header only entry written by triage is replaced by the analysis result.
+    Documents seen with analyzed False are kept open and fetched again on
+    each refresh, and their rows are replaced when they change.
+    '''
+    def __init__(self, status, images, date_string):
+        self.status = status
+        self.images = images
+        self.date_string = date_string
+        self.status_data = status_columns([])
+        self.image_data = image_columns([])
+        self.last_status_id = None
+        self.last_image_id = None
+        ## _id to row of image_data
+        self.image_rows = {}
+        ## _id to the last version of each open image document
+        self.open_images = {}
+
+    def fetch(self, collection, query, projection, last_id, open_ids=[]):
+        if last_id is not None:
+            newer = [{'_id': {'$gt': last_id}}]
+            if len(open_ids) > 0:
+                newer.append({'_id': {'$in': open_ids}})
+            query = {'$and': [query, {'$or': newer}]}
+        return [entry for entry in collection.find(query, projection,
+                                                   sort=[('_id', 1)])]
+
+    def refresh_images(self):
+        '''
+        Append the new image documents, replace the rows of open documents
+        which have changed and return how many documents were new or changed.
+        '''
+        docs = self.fetch(self.images, {'date': self.date_string},
+                          image_refresh_projection, self.last_image_id,
+                          list(self.open_images.keys()))
+        added = []
+        nchanged = 0
+        for doc in docs:
+            if self.last_image_id is None or doc['_id'] > self.last_image_id:
+                self.last_image_id = doc['_id']
+            if self.open_images.get(doc['_id'], None) == doc:
+                continue
+            nchanged += 1
+            self.open_images.pop(doc['_id'], None)
+            if doc.get('analyzed', None) is False:
+                self.open_images[doc['_id']] = doc
+            if 'exposure start' not in doc.keys():
+                continue
+            row = self.image_rows.get(doc['_id'], None)
+            if row is None:
+                self.image_rows[doc['_id']] = len(self.image_data['exposure start']) + len(added)
+                added.append(doc)
+            else:
+                replace_row(self.image_data, row, image_columns([doc]))
+        if len(added) > 0:
+            self.image_data = append_columns(self.image_data, image_columns(added))
+        return nchanged
+
+    def refresh(self):
+        '''
+        Append the documents inserted since the last refresh, update the
+        image documents which changed and return how many there were.
+        '''
+        docs = self.fetch(self.status, status_query(self.date_string),
+                          status_projection, self.last_status_id)
+        if len(docs) > 0:
+            self.last_status_id = docs[-1]['_id']
+            self.status_data = append_columns(self.status_data, status_columns(docs))
+        return len(docs) + self.refresh_images()
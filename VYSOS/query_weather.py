@@ -1,72 +1,308 @@
 import sys
 import logging
 import argparse
+import asyncio
+import random
 from datetime import datetime as dt
-from time import sleep
+from datetime import timedelta as tdelta
+from bisect import bisect_right
+import csv
+from functools import partial
 import pymongo
 import requests
 
+## aiohttp is optional, without it each source is fetched with a keep-alive
+## requests.Session on a worker thread.
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from VYSOS.spool import TelemetrySpool
+from VYSOS.deadband import DeadbandEncoder, deadbands, max_heartbeat
+from VYSOS.rollups import rebuild_rollups
+
 # import mongoengine as me
 # from VYSOS.schema import weather, currentweather
 
+## Weather stations polled by the collector.  Documents from each source are
+## written to its collection.
+weather_sources = [{'name': 'aagsolo',
+                    'address': 'http://192.168.1.105/cgi-bin/cgiLastData',
+                    'history': 'http://192.168.1.105/cgi-bin/cgiHistData',
+                    'collection': 'weather'},
+                  ]
+
+
+##-------------------------------------------------------------------------
+## Parse AAG Solo Output
+##-------------------------------------------------------------------------
+def weather_document(result, querydate):
+    return {"date": dt.strptime(result['dataGMTTime'], '%Y/%m/%d %H:%M:%S'),
+            "querydate": querydate,
+            "clouds": float(result['clouds']),
+            "temp": float(result['temp']),
+            "wind": float(result['wind']),
+            "gust": float(result['gust']),
+            "rain": int(result['rain']),
+            "light": int(result['light']),
+            "switch": int(result['switch']),
+            "safe": {'1': True, '0': False}[result['safe']],
+           }
+
+
+def parse_weather(text, querydate, logger):
+    result = {}
+    for line in text.splitlines():
+        key, val = line.split('=')
+        result[str(key)] = str(val)
+        logger.debug('  {} = {}'.format(key, val))
+
+    weatherdoc = weather_document(result, querydate)
+
+    threshold = 30
+    age = (weatherdoc["querydate"] - weatherdoc["date"]).total_seconds()
+    logger.debug('Data age = {:.1f} seconds'.format(age))
+    if age > threshold:
+        logger.warning('Age of weather data ({:.1f}) is greater than {:.0f} seconds'.format(
+                       age, threshold))
+    return weatherdoc
+
+
 ##-------------------------------------------------------------------------
 ## Query AAG Solo for Weather Data
 ##-------------------------------------------------------------------------
-def get_weather(logger, robust=True):
+def get_weather(logger, robust=True, spool=None, timeout=10):
+    '''
+    Query the AAG Solo and write the weather document through spool (a new
+    TelemetrySpool which is flushed before returning if none is given).
+    '''
     logger.info('Getting Weather status')
     
     # http://aagsolo/cgi-bin/cgiLastData
     # http://aagsolo/cgi-bin/cgiHistData
     querydate = dt.utcnow()
-    address = 'http://192.168.1.105/cgi-bin/cgiLastData'
+    address = weather_sources[0]['address']
 
     try:
-        r = requests.get(address)
+        r = requests.get(address, timeout=timeout)
     except:
         logger.error('Failed to connect to AAG Solo')
     else:
-        lines = r.text.splitlines()
-        result = {}
-        for line in lines:
-            key, val = line.split('=')
-            result[str(key)] = str(val)
-            logger.debug('  {} = {}'.format(key, val))
+        weatherdoc = parse_weather(r.text, querydate, logger)
         logger.info('  Done.')
 
-        weatherdoc = {"date": dt.strptime(result['dataGMTTime'], '%Y/%m/%d %H:%M:%S'),
-                      "querydate": querydate,
-                      "clouds": float(result['clouds']),
-                      "temp": float(result['temp']),
-                      "wind": float(result['wind']),
-                      "gust": float(result['gust']),
-                      "rain": int(result['rain']),
-                      "light": int(result['light']),
-                      "switch": int(result['switch']),
-                      "safe": {'1': True, '0': False}[result['safe']],
-                     }
-
-        threshold = 30
-        age = (weatherdoc["querydate"] - weatherdoc["date"]).total_seconds()
-        logger.debug('Data age = {:.1f} seconds'.format(age))
-        if age > threshold:
-            logger.warning('Age of weather data ({:.1f}) is greater than {:.0f} seconds'.format(
-                           age, threshold))
-
         logger.info('Saving weather document')
-        logger.info('Connecting to mongoDB')
-        client = pymongo.MongoClient('192.168.1.101', 27017)
-        db = client.vysos
-        weather = db.weather
+        oneshot = spool is None
+        if oneshot:
+            spool = TelemetrySpool('weather', logger)
+        spooled_id = spool.put('weather', weatherdoc)
+        logger.info("  Spooled document with id: {}".format(spooled_id))
+        if oneshot:
+            spool.flush()
+
 
+##-------------------------------------------------------------------------
+## Backfill from the AAG Solo History
+##-------------------------------------------------------------------------
+def parse_history(lines, querydate, logger):
+    '''
+    Generator of weather documents from the lines of a cgiHistData response.
+    The history is expected to be comma separated with a header line naming
+    the same fields as cgiLastData.  Lines which do not parse are skipped.
+    '''
+    reader = csv.DictReader(line for line in lines if line.strip() != '')
+    for row in reader:
         try:
-            inserted_id = weather.insert_one(weatherdoc).inserted_id
-            logger.info("  Inserted document with id: {}".format(inserted_id))
+            yield weather_document({key.strip(): val.strip()
+                                    for key, val in row.items()}, querydate)
         except:
-            e = sys.exc_info()[0]
-            logger.error('Failed to add new document')
-            logger.error(e)
+            logger.debug('  Skipping history line: {}'.format(row))
+
+
+def stored_coverage(collection, start, end):
+    '''
+    Return (dates, until) for the documents in collection which may hold
+    between start and end, sorted by date.  A deadband compressed document
+    stands for the samples from its date until its heartbeat expires, any
+    other document only for its own date.
+    '''
+    dates = []
+    until = []
+    for entry in collection.find({'date': {'$gte': start - tdelta(0, max_heartbeat),
+                                           '$lte': end}},
+                                 {'date': 1, 'deadband': 1, '_id': 0},
+                                 sort=[('date', pymongo.ASCENDING)]):
+        dates.append(entry['date'])
+        heartbeat = entry.get('deadband', {}).get('heartbeat', 0)
+        until.append(entry['date'] + tdelta(0, heartbeat))
+    return dates, until
+
+
+def is_covered(date, dates, until):
+    i = bisect_right(dates, date) - 1
+    return i >= 0 and date <= until[i]
+
+
+def insert_missing(collection, docs, encoder=None):
+    '''
+    Insert the documents in docs whose date is not covered by a document
+    already in collection (one with the same date, or a compressed one which
+    still holds at that date).  If encoder is given, the uncovered documents
+    are deadband compressed as they would have been when sampled.  The same
+    encoder is used for every batch of a stream, so a gap which spans batches
+    is compressed as one, and it starts afresh after any covered document.
+    Returns the documents inserted.
+    '''
+    dates = [doc['date'] for doc in docs]
+    stored, until = stored_coverage(collection, min(dates), max(dates))
+    missing = []
+    for doc in sorted(docs, key=lambda doc: doc['date']):
+        if is_covered(doc['date'], stored, until):
+            if encoder is not None:
+                encoder.reset()
+            continue
+        if encoder is not None:
+            doc = encoder.encode(doc)
+        if doc is not None:
+            missing.append(doc)
+    if len(missing) > 0:
+        collection.insert_many(missing, ordered=False)
+    return missing
+
+
+def backfill_weather(logger, source=weather_sources[0], timeout=60,
+                     batch_size=1000, mongo_address='192.168.1.101',
+                     heartbeat=None, cadence=20):
+    '''
+    Fetch the history held by the AAG Solo in one streamed request and insert
+    any samples which are missing from the source's collection.  If heartbeat
+    is given the inserted samples are deadband compressed like those from the
+    poller.  The rollups of the backfilled range are then rebuilt.
+    '''
+    logger.info('Backfilling weather history from {}'.format(source['history']))
+    client = pymongo.MongoClient(mongo_address, 27017)
+    collection = client.vysos[source['collection']]
+    collection.create_index('date')
+    encoder = None
+    if heartbeat is not None:
+        encoder = DeadbandEncoder(deadbands['weather'], heartbeat=heartbeat,
+                                  cadence=cadence)
+    querydate = dt.utcnow()
+    nread = 0
+    inserted = []
+    with requests.get(source['history'], stream=True, timeout=timeout) as r:
+        r.raise_for_status()
+        batch = []
+        for weatherdoc in parse_history(r.iter_lines(decode_unicode=True),
+                                        querydate, logger):
+            batch.append(weatherdoc)
+            if len(batch) >= batch_size:
+                inserted.extend([doc['date'] for doc in insert_missing(collection, batch, encoder)])
+                nread += len(batch)
+                batch = []
+        if len(batch) > 0:
+            inserted.extend([doc['date'] for doc in insert_missing(collection, batch, encoder)])
+            nread += len(batch)
+    logger.info('  Inserted {:d} documents for {:d} history samples'.format(len(inserted), nread))
+    if len(inserted) > 0:
+        rebuild_rollups(client.vysos, collection.name, min(inserted), max(inserted), logger)
+    client.close()
+    return len(inserted)
+
+
+##-------------------------------------------------------------------------
+## Asynchronous Weather Collector
+##-------------------------------------------------------------------------
+class WeatherPoller(object):
+    '''
+    Polls every source in sources concurrently every interval seconds.  Each
+    source is given a fixed random phase of up to jitter seconds so the
+    sources are not all queried at the same instant, and its ticks are
+    scheduled from a fixed start time so the period does not drift by the
+    time taken to query and save.  A query which takes longer than timeout
+    seconds is abandoned and any ticks it overran are skipped.
+
+    If heartbeat is given, weather documents are deadband compressed and only
+    stored when a value changes or heartbeat seconds have passed.
+    '''
+    def __init__(self, sources, logger, interval=20, timeout=5, jitter=2,
+                 spool=None, heartbeat=None):
+        self.sources = sources
+        self.logger = logger
+        self.interval = interval
+        self.timeout = timeout
+        self.jitter = min(jitter, interval)
+        if spool is None:
+            encoders = {}
+            if heartbeat is not None:
+                encoders = {source['collection']:
+                            DeadbandEncoder(deadbands['weather'],
+                                            heartbeat=heartbeat,
+                                            cadence=interval)
+                            for source in sources}
+            spool = TelemetrySpool('weather', logger, encoders=encoders)
+        self.spool = spool
+        self.sessions = {}
+
+    async def fetch(self, session, source):
+        if aiohttp is not None:
+            async with session.get(source['address']) as r:
+                r.raise_for_status()
+                return await r.text()
+        else:
+            loop = asyncio.get_running_loop()
+            get = partial(self.sessions[source['name']].get, source['address'],
+                          timeout=self.timeout)
+            r = await loop.run_in_executor(None, get)
+            r.raise_for_status()
+            return r.text
+
+    async def poll(self, session, source, start):
+        loop = asyncio.get_running_loop()
+        phase = random.uniform(0, self.jitter)
+        tick = 0
+        while True:
+            next_tick = start + phase + tick*self.interval
+            await asyncio.sleep(max(0, next_tick - loop.time()))
+            querydate = dt.utcnow()
+            try:
+                text = await asyncio.wait_for(self.fetch(session, source),
+                                              timeout=self.timeout)
+                weatherdoc = parse_weather(text, querydate, self.logger)
+                spooled_id = await loop.run_in_executor(None, self.spool.put,
+                                     source['collection'], weatherdoc)
+                if spooled_id is None:
+                    self.logger.info('{}: weather unchanged, not stored'.format(
+                                     source['name']))
+                else:
+                    self.logger.info('{}: spooled document with id: {}'.format(
+                                     source['name'], spooled_id))
+            except asyncio.TimeoutError:
+                self.logger.error('{}: no response in {:.0f} s'.format(
+                                  source['name'], self.timeout))
+            except:
+                self.logger.error('{}: failed to get weather'.format(source['name']))
+                self.logger.error(sys.exc_info()[0])
+            ## Skip any ticks which have already passed
+            elapsed = loop.time() - (start + phase)
+            tick = max(tick + 1, int(elapsed // self.interval) + 1)
+
+    async def run(self):
+        start = asyncio.get_running_loop().time()
+        if aiohttp is not None:
+            connector = aiohttp.TCPConnector(limit_per_host=1, keepalive_timeout=60)
+            timeout = aiohttp.ClientTimeout(total=self.timeout)
+            async with aiohttp.ClientSession(connector=connector,
+                                             timeout=timeout) as session:
+                await asyncio.gather(*[self.poll(session, source, start)
+                                       for source in self.sources])
+        else:
+            self.sessions = {source['name']: requests.Session()
+                             for source in self.sources}
+            await asyncio.gather(*[self.poll(None, source, start)
+                                   for source in self.sources])
 
-        client.close()
 
 if __name__ == '__main__':
 
@@ -84,6 +320,19 @@ if __name__ == '__main__':
         action="store_true", dest="notrobust",
         default=False, help="Use try except to catch errors.")
     ## add arguments
+    parser.add_argument("-i", "--interval",
+        type=float, dest="interval", default=20,
+        help="Seconds between weather queries (default = 20)")
+    parser.add_argument("--timeout",
+        type=float, dest="timeout", default=5,
+        help="Seconds to wait for a weather station to respond (default = 5)")
+    parser.add_argument("--backfill",
+        nargs='?', type=str, dest="backfill", default=None,
+        const=weather_sources[0]['history'],
+        help="Insert the samples missing from the weather station history and exit.")
+    parser.add_argument("--deadband",
+        type=float, dest="heartbeat", default=None,
+        help="Only store weather when it changes, or after this many seconds.")
     args = parser.parse_args()
 
 
@@ -107,7 +356,13 @@ if __name__ == '__main__':
         LogConsoleHandler.setFormatter(LogFormat)
         logger.addHandler(LogConsoleHandler)
 
-    while True:
-        get_weather(logger, robust=not args.notrobust)
-        logging.shutdown()
-        sleep(20)
+    if args.backfill is not None:
+        source = dict(weather_sources[0])
+        source['history'] = args.backfill
+        backfill_weather(logger, source=source, heartbeat=args.heartbeat,
+                         cadence=args.interval)
+        sys.exit(0)
+
+    poller = WeatherPoller(weather_sources, logger, interval=args.interval,
+                           timeout=args.timeout, heartbeat=args.heartbeat)
+    asyncio.run(poller.run())
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Batch image analysis results and write them to the images collection as
+ordered bulk upserts keyed on filename.  Entries are written in the order
+they were queued, so results recorded in time order land in time order.
+Re-running the analysis of a file replaces its entry, so repeated runs stay
+idempotent.  Header only entries
+from triage go through the same batches but never replace a fully analyzed
+entry.
+"""
+
+import sys
+import atexit
+import logging
+import threading
+
+from pymongo import ReplaceOne
+
+from VYSOS.schema import Image as ImageDoc
+
+
+class ResultsSink(object):
+    def __init__(self, flush_size=50, flush_interval=30, logger=None):
+        '''
+        Results are written when flush_size of them are queued or when the
+        oldest queued result has waited flush_interval seconds.  A batch which
+        fails to write is put back at the front of the queue and retried.
+        '''
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.logger = logger if logger is not None else logging.getLogger('results_sink')
+        self.queue = {}
+        self.nwrites = 0
+        self.nresults = 0
+        self.lock = threading.Lock()
+        self.timer = None
+        atexit.register(self.flush)
+
+    def _queue(self, filename, entry):
+        '''
+        Queue entry (image_info, header_only) for filename, with the lock held.
+        A header only entry never replaces a queued one.  A replaced entry
+        keeps its place in the queue.
+        '''
+        queued = self.queue.get(filename, None)
+        if queued is not None and entry[1]:
+            return
+        self.queue[filename] = entry
+        if self.timer is None:
+            self.timer = threading.Timer(self.flush_interval, self._timed_flush)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def add(self, image_info, header_only=False):
+        '''
+        Queue an Image document for writing.  If header_only is set (for the
+        entries written by triage) the document is not written if the file
+        already has an analyzed entry.  Assumes mongoengine is connected by
+        the time the queue is flushed.
+        '''
+        image_info.validate()
+        with self.lock:
+            self._queue(image_info.filename, (image_info, header_only))
+            full = len(self.queue) >= self.flush_size
+        if full:
+            self.flush()
+
+    def write(self, queue):
+        collection = ImageDoc._get_collection()
+        header_only = [filename for filename, (image_info, header) in queue.items()
+                       if header]
+        analyzed = set()
+        if len(header_only) > 0:
+            analyzed = set([x['filename'] for x in
+                            collection.find({'filename': {'$in': header_only},
+                                             'analyzed': True},
+                                            projection={'filename': True, '_id': False})])
+        requests = []
+        for filename, (image_info, header) in queue.items():
+            if header and filename in analyzed:
+                continue
+            doc = image_info.to_mongo()
+            doc.pop('_id', None)
+            requests.append(ReplaceOne({'filename': filename}, doc, upsert=True))
+        if len(requests) > 0:
+            collection.bulk_write(requests, ordered=True)
+        self.nwrites += 1
+        self.nresults += len(requests)
+
+    def flush(self):
+        with self.lock:
+            if len(self.queue) == 0:
+                return
+            queue = self.queue
+            self.queue = {}
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+        try:
+            self.write(queue)
+        except:
+            ## Keep the batch (the upserts are idempotent) ahead of anything
+            ## queued since, so the write order is kept
+            with self.lock:
+                newer = self.queue
+                self.queue = {}
+                for filename, entry in queue.items():
+                    self._queue(filename, entry)
+                for filename, entry in newer.items():
+                    self._queue(filename, entry)
+            self.logger.error(f'Failed to write {len(queue):d} results, will retry')
+            self.logger.error(sys.exc_info()[0])
+            raise
+
+    def _timed_flush(self):
+        try:
+            self.flush()
+        except:
+            pass
+
+    def report(self):
+        return f'Wrote {self.nresults:d} results in {self.nwrites:d} bulk writes'
+
+
+results_sink = ResultsSink()
@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Pre-aggregated rollups of the telemetry collections.  For every numeric field
+of weather and the telescope status collections, the min, max, sum and count
+of the samples in 1 minute, 10 minute and 1 hour buckets are kept in
+<collection>_<resolution> (for example weather_10min).  Buckets are always
+recomputed from the raw documents a whole hour at a time and replaced, so
+updating them as the telemetry spool inserts new documents, replaying a
+spool run and rebuilding any time range all give the same result.  Deadband compressed documents are
+expanded first, so every sample a stored document stands for is counted and
+the means are not biased towards times when the values were changing.
+
+Readers use fetch_series, which returns the raw documents for short windows
+and the coarser rollups as the window grows.
+"""
+
+import sys
+import argparse
+import logging
+from datetime import datetime as dt
+from datetime import timedelta as tdelta
+
+import pymongo
+from pymongo import ReplaceOne, DeleteMany
+
+from VYSOS.deadband import expand_documents, max_heartbeat
+
+## Bucket sizes in seconds, finest first
+resolutions = [('1min', 60), ('10min', 600), ('1hour', 3600)]
+
+## Collections which are rolled up
+rollup_sources = ['weather', 'V5status', 'V20status']
+
+## Nominal seconds between raw samples
+raw_cadence = 20
+
+
+## Rollup collections whose index has been created by this process
+_indexed = set()
+
+
+def create_rollup_indexes(db, collection):
+    '''
+    Create the unique date index on each rollup of collection, once per
+    process.
+    '''
+    if (db.name, collection) in _indexed:
+        return
+    for name, seconds in resolutions:
+        db[f'{collection}_{name}'].create_index('date', unique=True)
+    _indexed.add((db.name, collection))
+
+
+def bucket_start(date, seconds):
+    epoch = dt(1970, 1, 1)
+    offset = int((date - epoch).total_seconds()) // seconds * seconds
+    return epoch + tdelta(0, offset)
+
+
+def numeric_fields(doc):
+    '''
+    Return a dict of the numeric (including boolean) top level fields of doc.
+    '''
+    values = {}
+    for key, val in doc.items():
+        if key in ['_id', 'date', 'querydate']:
+            continue
+        if isinstance(val, bool):
+            values[key] = int(val)
+        elif isinstance(val, (int, float)) and val == val:
+            values[key] = val
+    return values
+
+
+def aggregate(docs, seconds):
+    '''
+    Return {bucket start: {field: [min, max, sum, count]}} for docs.
+    '''
+    buckets = {}
+    for doc in docs:
+        bucket = buckets.setdefault(bucket_start(doc['date'], seconds), {})
+        for key, val in numeric_fields(doc).items():
+            if key not in bucket.keys():
+                bucket[key] = [val, val, val, 1]
+            else:
+                entry = bucket[key]
+                entry[0] = min(entry[0], val)
+                entry[1] = max(entry[1], val)
+                entry[2] += val
+                entry[3] += 1
+    return buckets
+
+
+##-------------------------------------------------------------------------
+## Maintain Rollups
+##-------------------------------------------------------------------------
+def recompute_rollups(db, collection, start, end):
+    '''
+    Recompute the rollup buckets of collection between start and end (whole
+    hours) from the raw documents and replace them.  Buckets which no longer
+    have any samples are removed.
+
+    A compressed document stands for the samples it holds until the next
+    stored document.  The samples held by the newest stored document are not
+    counted until a later document arrives, whose update recomputes the hour.
+    '''
+    docs = [doc for doc in db[collection].find(
+            {'date': {'$gte': start-tdelta(0, max_heartbeat), '$lt': end}},
+            sort=[('date', pymongo.ASCENDING)])]
+    following = db[collection].find_one({'date': {'$gte': end}})
+    if following is not None:
+        until = end
+    elif len(docs) > 0:
+        until = docs[-1]['date']
+    else:
+        until = start
+    samples = [doc for doc in expand_documents(docs, start=start, end=until)
+               if doc['date'] < end]
+    for name, seconds in resolutions:
+        buckets = aggregate(samples, seconds)
+        requests = [DeleteMany({'date': {'$gte': start, '$lt': end,
+                                         '$nin': list(buckets.keys())}})]
+        for bucket, fields in buckets.items():
+            doc = {'date': bucket}
+            for key, (fmin, fmax, fsum, fcount) in fields.items():
+                doc[key] = {'min': fmin, 'max': fmax, 'sum': fsum, 'count': fcount}
+            requests.append(ReplaceOne({'date': bucket}, doc, upsert=True))
+        db[f'{collection}_{name}'].bulk_write(requests, ordered=True)
+
+
+def update_rollups(db, collection, docs):
+    '''
+    Bring the rollups of collection up to date after docs were inserted (or
+    found to be inserted already, when a spool run is replayed).  The hours
+    from the stored document before docs, whose held samples end at the first
+    of docs, to the last sample held by docs are recomputed.
+    '''
+    if collection not in rollup_sources or len(docs) == 0:
+        return
+    create_rollup_indexes(db, collection)
+    first = min([doc['date'] for doc in docs])
+    last = max([doc['date'] for doc in docs])
+    previous = db[collection].find_one({'date': {'$lt': first}},
+                                       sort=[('date', pymongo.DESCENDING)])
+    if previous is not None:
+        first = previous['date']
+    following = db[collection].find_one({'date': {'$gt': last}},
+                                        sort=[('date', pymongo.ASCENDING)])
+    if following is not None:
+        last = min(following['date'], last + tdelta(0, max_heartbeat))
+    recompute_rollups(db, collection, bucket_start(first, 3600),
+                      bucket_start(last, 3600) + tdelta(0, 3600))
+
+
+def rebuild_rollups(db, collection, start, end, logger):
+    '''
+    Recompute the rollups of collection between start and end from the raw
+    documents.  start and end are rounded out to whole hours.  The hour of
+    the newest stored document is left to the spool drainer, which is still
+    updating it.
+    '''
+    start = bucket_start(start, 3600)
+    end = bucket_start(end, 3600) + tdelta(0, 3600)
+    newest = db[collection].find_one(sort=[('date', pymongo.DESCENDING)])
+    if newest is not None and end > bucket_start(newest['date'], 3600):
+        end = bucket_start(newest['date'], 3600)
+        logger.info(f'Leaving {collection} rollups after {end} to the spool drainer')
+    if end <= start:
+        return
+    logger.info(f'Rebuilding {collection} rollups from {start} to {end}')
+    create_rollup_indexes(db, collection)
+    chunk = tdelta(1, 0)
+    chunk_start = start
+    while chunk_start < end:
+        chunk_end = min(chunk_start + chunk, end)
+        logger.info(f'  {chunk_start}')
+        recompute_rollups(db, collection, chunk_start, chunk_end)
+        chunk_start = chunk_end
+
+
+##-------------------------------------------------------------------------
+## Read Rollups
+##-------------------------------------------------------------------------
+def choose_resolution(start, end, max_points=2000):
+    '''
+    Return (name, seconds) of the finest resolution which gives no more than
+    max_points samples between start and end, or ('raw', raw_cadence) if the
+    raw documents fit.  The coarsest rollup is used for very long windows.
+    '''
+    span = (end - start).total_seconds()
+    if span / raw_cadence <= max_points:
+        return ('raw', raw_cadence)
+    for name, seconds in resolutions:
+        if span / seconds <= max_points:
+            return (name, seconds)
+    return resolutions[-1]
+
+
+def fetch_series(db, collection, start, end, max_points=2000):
+    '''
+    Return (resolution, docs) for collection between start and end, sorted by
+    date.  Raw documents are returned with any deadband compressed samples
+    expanded.  Rollup buckets are returned as documents with the mean of each
+    field under the field name, its range under <field>_min and <field>_max
+    and the number of samples under <field>_count, so they can be used in
+    place of raw documents.
+    '''
+    name, seconds = choose_resolution(start, end, max_points=max_points)
+    if name == 'raw':
+        docs = [doc for doc in db[collection].find(
+                {'date': {'$gt': start-tdelta(0, max_heartbeat), '$lt': end}})]
+        return name, expand_documents(docs, start=start, end=end)
+    buckets = db[f'{collection}_{name}'].find(
+              {'date': {'$gte': bucket_start(start, seconds), '$lt': end}},
+              sort=[('date', pymongo.ASCENDING)])
+    docs = []
+    for bucket in buckets:
+        doc = {'date': bucket['date']}
+        for key, val in bucket.items():
+            if isinstance(val, dict) and val.get('count', 0) > 0:
+                doc[key] = val['sum'] / val['count']
+                doc[f'{key}_min'] = val['min']
+                doc[f'{key}_max'] = val['max']
+                doc[f'{key}_count'] = val['count']
+        docs.append(doc)
+    return name, docs
+
+
+def main():
+    ##-------------------------------------------------------------------------
+    ## Parse Command Line Arguments
+    ##-------------------------------------------------------------------------
+    parser = argparse.ArgumentParser(
+             description="Rebuild telemetry rollups from the raw documents.")
+    parser.add_argument("-v", "--verbose",
+        action="store_true", dest="verbose",
+        default=False, help="Be verbose! (default = False)")
+    parser.add_argument("-c", "--collection",
+        type=str, dest="collection", nargs='+', default=rollup_sources,
+        choices=rollup_sources,
+        help="Collections to rebuild (default = all)")
+    parser.add_argument("-s", "--start",
+        type=str, dest="start", required=True,
+        help="Start date in YYYYMMDDUT format")
+    parser.add_argument("-e", "--end",
+        type=str, dest="end", default=None,
+        help="End date in YYYYMMDDUT format (default = now)")
+    args = parser.parse_args()
+
+    ##-------------------------------------------------------------------------
+    ## Create logger object
+    ##-------------------------------------------------------------------------
+    logger = logging.getLogger('rollups')
+    logger.setLevel(logging.DEBUG)
+    LogConsoleHandler = logging.StreamHandler()
+    if args.verbose:
+        LogConsoleHandler.setLevel(logging.DEBUG)
+    else:
+        LogConsoleHandler.setLevel(logging.INFO)
+    LogFormat = logging.Formatter('%(asctime)s %(levelname)8s: %(message)s',
+                                  datefmt='%Y%m%d %H:%M:%S')
+    LogConsoleHandler.setFormatter(LogFormat)
+    logger.addHandler(LogConsoleHandler)
+
+    start = dt.strptime(args.start, '%Y%m%dUT')
+    end = dt.strptime(args.end, '%Y%m%dUT') if args.end is not None else dt.utcnow()
+    client = pymongo.MongoClient('192.168.1.101', 27017)
+    for collection in args.collection:
+        rebuild_rollups(client.vysos, collection, start, end, logger)
+    client.close()
+
+
+if __name__ == '__main__':
+    main()
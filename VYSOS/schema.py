@@ -116,6 +116,27 @@ class telstatus(me.Document):
         return self.__str__()
 
 
+class ImageTiming(me.EmbeddedDocument):
+    read = me.FloatField(min_value=0)
+    bias_correct = me.FloatField(min_value=0)
+    gain_correct = me.FloatField(min_value=0)
+    background = me.FloatField(min_value=0)
+    astrometry = me.FloatField(min_value=0)
+    extract = me.FloatField(min_value=0)
+    fwhm = me.FloatField(min_value=0)
+    total = me.FloatField(min_value=0)
+
+    stages = ['read', 'bias_correct', 'gain_correct', 'background',
+              'astrometry', 'extract', 'fwhm', 'total']
+
+    def __str__(self):
+        output = ''
+        for stage in self.stages:
+            if self[stage] is not None:
+                output += '    {}: {:.2f} s\n'.format(stage, self[stage])
+        return output
+
+
 class Image(me.Document):
     # Basics
     filename = me.StringField(max_length=128, required=True)
@@ -136,13 +157,16 @@ class Image(me.Document):
     moon_illumination = me.DecimalField(min_value=0, max_value=100, precision=1)
     moon_separation = me.DecimalField(min_value=0, max_value=180, precision=1)
     # Analysis Results
+    triage = me.StringField(max_length=64)
     analyzed = me.BooleanField()
     SIDREversion = me.StringField(max_length=12)
+    result_key = me.StringField(max_length=40)
     FWHM_pix = me.DecimalField(min_value=0, precision=1)
     ellipticity = me.DecimalField(min_value=0, precision=2)
     RA = me.DecimalField(min_value=0, max_value=360, precision=4)
     DEC = me.DecimalField(min_value=-90, max_value=90, precision=4)
     perr_arcmin = me.DecimalField(min_value=0, precision=2)
+    timing = me.EmbeddedDocumentField(ImageTiming)
     # JPEGs
     full_field_jpeg = me.ImageField(thumbnail_size=(128,128,True))
     cropped_jpeg = me.ImageField(thumbnail_size=(128,128,True))
@@ -171,6 +195,7 @@ class Image(me.Document):
         if self.RA: output += '  WCS RA: {:.4f}\n'.format(self.RA)
         if self.DEC: output += '  WCS DEC: {:.4f}\n'.format(self.DEC)
         if self.perr_arcmin: output += '  Pointing Error: {:.1f} arcmin\n'.format(self.perr_arcmin)
+        if self.timing: output += '  Timing:\n{}'.format(self.timing)
         return output
 
     def __repr__(self):
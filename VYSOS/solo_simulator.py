@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+A local stand-in for the AAG Solo web interface serving cgiLastData and
+cgiHistData with synthetic samples, so the weather poller and the history
+backfill can be run without the weather station.  For example:
+
+    python -m VYSOS.solo_simulator -p 8080 &
+    python VYSOS/query_weather.py --backfill http://localhost:8080/cgi-bin/cgiHistData
+"""
+
+import sys
+import argparse
+import math
+import random
+from datetime import datetime as dt
+from datetime import timedelta as tdelta
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+history_fields = ['dataGMTTime', 'clouds', 'temp', 'wind', 'gust', 'rain',
+                  'light', 'switch', 'safe']
+
+
+def sample(date):
+    '''
+    Return a synthetic weather sample for date as a dict of strings.
+    '''
+    phase = 2*math.pi*(date.hour*3600 + date.minute*60 + date.second)/86400.
+    wind = max(0., 10. + 8.*math.sin(phase) + random.gauss(0, 2))
+    clouds = -30. + 10.*math.cos(phase/3.) + random.gauss(0, 1)
+    return {'dataGMTTime': date.strftime('%Y/%m/%d %H:%M:%S'),
+            'clouds': f'{clouds:.2f}',
+            'temp': f'{12. + 5.*math.sin(phase):.2f}',
+            'wind': f'{wind:.1f}',
+            'gust': f'{wind + abs(random.gauss(0, 3)):.1f}',
+            'rain': '2900',
+            'light': f'{int(1000*max(0., math.sin(phase))):d}',
+            'switch': '0',
+            'safe': '1' if clouds < -20 and wind < 20 else '0',
+           }
+
+
+class SoloHandler(BaseHTTPRequestHandler):
+    hours = 24
+    cadence = 20
+
+    def do_GET(self):
+        now = dt.utcnow().replace(microsecond=0)
+        if self.path.startswith('/cgi-bin/cgiLastData'):
+            lines = [f'{key}={val}' for key, val in sample(now).items()]
+        elif self.path.startswith('/cgi-bin/cgiHistData'):
+            lines = [','.join(history_fields)]
+            nsamples = int(self.hours*3600/self.cadence)
+            for i in range(nsamples, 0, -1):
+                values = sample(now - tdelta(0, i*self.cadence))
+                lines.append(','.join([values[key] for key in history_fields]))
+        else:
+            self.send_error(404)
+            return
+        body = '\n'.join(lines).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+             description="Serve synthetic AAG Solo weather data.")
+    parser.add_argument("-p", "--port",
+        type=int, dest="port", default=8080,
+        help="Port to listen on (default = 8080)")
+    parser.add_argument("--hours",
+        type=float, dest="hours", default=24,
+        help="Hours of history served by cgiHistData (default = 24)")
+    parser.add_argument("--cadence",
+        type=float, dest="cadence", default=20,
+        help="Seconds between history samples (default = 20)")
+    args = parser.parse_args()
+
+    SoloHandler.hours = args.hours
+    SoloHandler.cadence = args.cadence
+    server = HTTPServer(('localhost', args.port), SoloHandler)
+    print(f'Serving synthetic AAG Solo data on http://localhost:{args.port}/cgi-bin/')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
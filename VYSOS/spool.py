@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Local append-only spool for telemetry documents.  Producers write every
+document to a SQLite file and return immediately.  A background drainer
+inserts the spooled documents into mongo in order and removes them once they
+are stored, so a database outage neither loses samples nor stalls sampling.
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import threading
+
+import pymongo
+from bson import ObjectId
+from bson import json_util
+from bson.json_util import JSONOptions
+
+from VYSOS.rollups import update_rollups
+from VYSOS.current import current_collections, update_current
+
+## Dates are read back naive (UTC) like the rest of VYSOS, rather than with
+## the UTC tzinfo json_util attaches by default
+json_options = JSONOptions(tz_aware=False)
+
+
+class TelemetrySpool(object):
+    def __init__(self, name, logger, path=None, batch_size=500, interval=5,
+                 mongo_address='192.168.1.101', mongo_port=27017,
+                 mongo_db='vysos', encoders=None):
+        '''
+        encoders optionally maps collection names to a DeadbandEncoder which
+        decides which documents for that collection are stored.
+        '''
+        if path is None:
+            path = os.path.join(os.path.expanduser('~'), f'.vysos_spool_{name}.sqlite')
+        self.path = path
+        self.logger = logger
+        self.batch_size = batch_size
+        self.interval = interval
+        self.mongo_address = mongo_address
+        self.mongo_port = mongo_port
+        self.mongo_db = mongo_db
+        self.encoders = encoders if encoders is not None else {}
+        self.latest = {}
+        self.latest_lock = threading.Lock()
+        self.client = None
+        self.wake = threading.Event()
+        self.lock = threading.Lock()
+        with self.connect() as db:
+            db.execute('CREATE TABLE IF NOT EXISTS spool '
+                       '(id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                       'collection TEXT NOT NULL, doc TEXT NOT NULL)')
+        self.drainer = threading.Thread(target=self.run, daemon=True)
+        self.drainer.start()
+
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def put(self, collection, doc):
+        '''
+        Append a document for collection to the spool.  The document is given
+        its _id here so that a batch which is inserted twice (for example if
+        the spool could not be trimmed after an insert) is not duplicated.
+        Returns the _id, or None if the encoder for collection dropped it.
+        Every sample, stored or not, becomes the latest value for collection.
+        '''
+        if collection in current_collections.keys():
+            with self.latest_lock:
+                self.latest[collection] = dict(doc)
+        encoder = self.encoders.get(collection, None)
+        if encoder is not None:
+            doc = encoder.encode(doc)
+            if doc is None:
+                return None
+        doc = dict(doc)
+        doc.setdefault('_id', ObjectId())
+        with self.connect() as db:
+            db.execute('INSERT INTO spool (collection, doc) VALUES (?, ?)',
+                       (collection, json_util.dumps(doc)))
+        self.wake.set()
+        return doc['_id']
+
+    def backlog(self):
+        with self.connect() as db:
+            return db.execute('SELECT COUNT(*) FROM spool').fetchone()[0]
+
+    ##-------------------------------------------------------------------------
+    ## Drain to Mongo
+    ##-------------------------------------------------------------------------
+    def drain(self):
+        '''
+        Insert spooled documents into mongo in the order they were spooled.
+        Returns the number of documents drained.
+        '''
+        with self.lock:
+            return self._drain()
+
+    def _drain(self):
+        with self.connect() as db:
+            rows = db.execute('SELECT id, collection, doc FROM spool ORDER BY id LIMIT ?',
+                              (self.batch_size,)).fetchall()
+        if len(rows) == 0:
+            return 0
+        if self.client is None:
+            self.client = pymongo.MongoClient(self.mongo_address, self.mongo_port)
+        ## Insert runs of documents for the same collection together
+        ndrained = 0
+        while len(rows) > 0:
+            collection = rows[0][1]
+            run = []
+            while len(rows) > 0 and rows[0][1] == collection:
+                run.append(rows.pop(0))
+            docs = [json_util.loads(row[2], json_options=json_options) for row in run]
+            try:
+                ## Unordered so that one document which was already inserted
+                ## does not stop the rest of the run from being inserted.  Runs
+                ## are still drained in the order they were spooled.
+                self.client[self.mongo_db][collection].insert_many(docs, ordered=False)
+            except pymongo.errors.BulkWriteError as e:
+                ## Documents which were already inserted are fine
+                errors = [err for err in e.details['writeErrors'] if err['code'] != 11000]
+                if len(errors) > 0:
+                    raise
+            try:
+                ## Rollups are recomputed from the stored documents, so a
+                ## replayed run is counted once
+                update_rollups(self.client[self.mongo_db], collection, docs)
+            except:
+                self.logger.warning(f'Failed to update {collection} rollups')
+                self.logger.warning(sys.exc_info()[0])
+            with self.connect() as db:
+                db.execute('DELETE FROM spool WHERE id <= ?', (run[-1][0],))
+            ndrained += len(run)
+        return ndrained
+
+    def publish_latest(self):
+        '''
+        Write the latest sample for each collection to the latest value store.
+        '''
+        with self.latest_lock:
+            latest = self.latest
+            self.latest = {}
+        if len(latest) == 0:
+            return
+        try:
+            if self.client is None:
+                self.client = pymongo.MongoClient(self.mongo_address, self.mongo_port)
+            for collection in list(latest.keys()):
+                update_current(self.client[self.mongo_db], collection, latest[collection])
+                latest.pop(collection)
+        except:
+            ## Keep anything not yet written unless a newer sample has arrived
+            with self.latest_lock:
+                for collection, doc in latest.items():
+                    self.latest.setdefault(collection, doc)
+            raise
+
+    def flush(self):
+        '''
+        Try once to drain the whole spool from the calling thread, for short
+        lived producers which exit before the drainer gets to run.  Anything
+        left over is inserted by the next producer to use the spool.
+        '''
+        try:
+            self.publish_latest()
+            while self.drain() > 0:
+                pass
+        except:
+            self.logger.warning(f'Could not drain telemetry spool, {self.backlog():d} documents left in {self.path}')
+
+    def run(self):
+        while True:
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            try:
+                self.publish_latest()
+                ndrained = self.drain()
+                while ndrained > 0:
+                    self.logger.info(f'  Inserted {ndrained} spooled documents')
+                    ndrained = self.drain()
+            except:
+                self.logger.error('Failed to drain telemetry spool')
+                self.logger.error(sys.exc_info()[0])
+                if self.client is not None:
+                    self.client.close()
+                self.client = None
+                time.sleep(self.interval)
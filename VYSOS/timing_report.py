@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Summarize the per stage analysis times recorded by measure_image over a range
+of dates for one telescope.
+"""
+
+from argparse import ArgumentParser
+from datetime import datetime as dt
+from datetime import timedelta as tdelta
+
+import numpy as np
+import pymongo
+
+from VYSOS.schema import ImageTiming
+
+
+def timing_report(telescope, start, end):
+    '''
+    Return a dict of stage: (n, p50, p95) for images taken between start and
+    end by the telescope.
+    '''
+    client = pymongo.MongoClient('192.168.1.101', 27017)
+    images = client.vysos['images']
+    data = [x['timing'] for x in
+            images.find({'telescope': telescope,
+                         'date': {'$gte': start, '$lt': end},
+                         'timing': {'$exists': True}},
+                        projection={'timing': True, '_id': False})]
+    client.close()
+
+    report = {}
+    for stage in ImageTiming.stages:
+        values = np.array([x[stage] for x in data if x.get(stage, None) is not None])
+        if len(values) > 0:
+            report[stage] = (len(values),
+                             np.percentile(values, 50),
+                             np.percentile(values, 95))
+    return report
+
+
+def main():
+    ##-------------------------------------------------------------------------
+    ## Parse Command Line Arguments
+    ##-------------------------------------------------------------------------
+    parser = ArgumentParser(description="Report analysis time per stage")
+    ## add arguments
+    parser.add_argument("-t", "--telescope",
+        dest="telescope", required=True, type=str,
+        choices=["V5", "V20"],
+        help="Telescope which took the data ('V5' or 'V20')")
+    parser.add_argument("-s", "--start",
+        dest="start", required=True, type=str,
+        help="UT date of first night to include. (i.e. '20130805UT')")
+    parser.add_argument("-e", "--end",
+        dest="end", required=False, type=str,
+        help="UT date of last night to include (default = start)")
+    args = parser.parse_args()
+
+    start = dt.strptime(args.start, '%Y%m%dUT')
+    end = dt.strptime(args.end, '%Y%m%dUT') if args.end else start
+    end += tdelta(1,0)
+
+    report = timing_report(args.telescope, start, end)
+    print(f"Analysis times for {args.telescope} from {args.start} to {args.end or args.start}")
+    print(f"  {'Stage':>14s} {'N':>6s} {'p50 (s)':>8s} {'p95 (s)':>8s}")
+    for stage in ImageTiming.stages:
+        if stage in report.keys():
+            n, p50, p95 = report[stage]
+            print(f"  {stage:>14s} {n:6d} {p50:8.1f} {p95:8.1f}")
+
+
+if __name__ == '__main__':
+    main()
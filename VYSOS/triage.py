@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Fast triage of new images using only the FITS header.  The cheap Image fields
+are filled from the header and recorded immediately, then a set of rules
+decides whether the frame needs the full SIDRE analysis.
+"""
+
+import os
+import re
+from datetime import datetime as dt
+
+import numpy as np
+from astropy import units as u
+from astropy import coordinates as c
+from astropy.io import fits
+
+from VYSOS.schema import Image as ImageDoc
+from VYSOS.results_sink import results_sink
+
+## Rules used to decide whether a frame gets the full analysis.  Frames with
+## an IMAGETYP or OBJECT matching one of the skip patterns, or which are too
+## short or too low, only get the header entry.
+triage_rules = {'skip_imagetyp': ['bias', 'dark', 'flat'],
+                'skip_object': ['empty', 'autoflat', 'focus'],
+                'min_exptime': 1.0,
+                'min_alt': 10.0,
+               }
+
+
+##-------------------------------------------------------------------------
+## Read Primary Header
+##-------------------------------------------------------------------------
+def read_header(file):
+    '''
+    Return the image header without reading any image data.  For fpack
+    compressed files the image header lives in the first extension.
+    '''
+    with fits.open(file, 'readonly') as hdul:
+        if os.path.splitext(file)[1] == '.fz':
+            return hdul[1].header.copy()
+        else:
+            return hdul[0].header.copy()
+
+
+##-------------------------------------------------------------------------
+## Fill Image Fields from the Header
+##-------------------------------------------------------------------------
+def header_info(file, header):
+    image_info = ImageDoc(filename=os.path.basename(file))
+    try:
+        image_info.telescope = re.match('(V[25]0?)_.+', image_info.filename).group(1)
+    except:
+        pass
+    image_info.compressed = (os.path.splitext(image_info.filename)[1] == '.fz')
+    # Exposure Time
+    try:
+        image_info.exptime = float(header.get('EXPTIME'))
+    except:
+        pass
+    # Exposure Start Time
+    try:
+        image_info.date = dt.strptime(header.get('DATE-OBS'), '%Y-%m-%dT%H:%M:%S')
+    except:
+        pass
+    # Target
+    image_info.target = header.get('OBJECT', None)
+    # Filter
+    if image_info.telescope == 'V5':
+        image_info.filter = 'PSr'
+    else:
+        image_info.filter = header.get('FILTER', None)
+    # Header Pointing
+    try:
+        header_pointing = c.SkyCoord(header.get('RA'), header.get('DEC'),
+                                     unit=(u.hourangle, u.deg))
+        image_info.header_RA = header_pointing.ra.deg
+        image_info.header_DEC = header_pointing.dec.deg
+    except:
+        pass
+    # Alt, Az, Airmass
+    try:
+        image_info.alt = float(header.get('OBJCTALT'))
+        image_info.az = float(header.get('OBJCTAZ'))
+        image_info.airmass = 1./np.cos( (90.-image_info.alt)*np.pi/180. )
+    except:
+        pass
+    try:
+        image_info.airmass = float(header.get('AIRMASS'))
+    except:
+        pass
+    image_info.analyzed = False
+    return image_info
+
+
+def fit_to_schema(image_info):
+    '''
+    Drop header values outside the range allowed by the Image schema (for
+    example the negative OBJCTALT of a parked frame) and truncate strings to
+    their maximum length, so a header entry always validates.
+    '''
+    for name, field in ImageDoc._fields.items():
+        value = image_info[name]
+        if value is None:
+            continue
+        max_length = getattr(field, 'max_length', None)
+        if isinstance(value, str) and max_length is not None:
+            image_info[name] = value[:max_length]
+            continue
+        min_value = getattr(field, 'min_value', None)
+        max_value = getattr(field, 'max_value', None)
+        try:
+            if (min_value is not None and float(value) < min_value)\
+               or (max_value is not None and float(value) > max_value):
+                image_info[name] = None
+        except (TypeError, ValueError):
+            pass
+    return image_info
+
+
+##-------------------------------------------------------------------------
+## Decide Whether to Run the Full Analysis
+##-------------------------------------------------------------------------
+def needs_analysis(image_info, header, rules=triage_rules):
+    '''
+    Return (True, 'analyze') if the frame should get the full analysis or
+    (False, reason) if the header entry is enough.
+    '''
+    imagetyp = str(header.get('IMAGETYP', '')).lower()
+    for pattern in rules['skip_imagetyp']:
+        if pattern in imagetyp:
+            return False, f'IMAGETYP {imagetyp}'
+    target = str(image_info.target or '').lower()
+    for pattern in rules['skip_object']:
+        if pattern in target:
+            return False, f'OBJECT {target}'
+    if image_info.exptime is not None\
+       and float(image_info.exptime) < rules['min_exptime']:
+        return False, f'EXPTIME {image_info.exptime}'
+    if image_info.alt is not None\
+       and float(image_info.alt) < rules['min_alt']:
+        return False, f'ALT {image_info.alt}'
+    return True, 'analyze'
+
+
+def triage_image(file, record=True, rules=triage_rules):
+    '''
+    Read the header of file, record the header fields, and return
+    (image_info, needs_analysis).  Header values which the schema does not
+    allow are dropped after the triage rules have seen them.  The header entry is batched with the
+    analysis results, and an existing fully analyzed entry for the file is
+    left in place so it can be reused by measure_image.  Assumes mongoengine
+    is connected by the time the results are flushed if record is True.
+    '''
+    header = read_header(file)
+    image_info = header_info(file, header)
+    analyze, reason = needs_analysis(image_info, header, rules=rules)
+    image_info.triage = reason
+    fit_to_schema(image_info)
+    if record:
+        results_sink.add(image_info, header_only=True)
+    return image_info, analyze
@@ -12,14 +12,31 @@ import os
 from argparse import ArgumentParser
 import re
 import time
+import threading
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime as dt
+from datetime import timedelta as tdelta
 import pymongo
 from pymongo import MongoClient
+import mongoengine as me
 import logging
 
 from astropy import units as u
 
-from measure_image import measure_image
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+from measure_image import record_image, init_worker, measure_in_worker
+from measure_image import worker_context
+from analysis_server import submit_image, server_is_running
+from triage import triage_image
+from ingest import CompletionTracker, IngestQueue
+from VYSOS.results_sink import results_sink
 
 class Telescope(object):
     def __init__(self, name):
@@ -29,8 +46,24 @@ class Telescope(object):
         self.mongo_db = 'vysos'
         self.mongo_collection = 'images'
         self.units_for_FWHM = u.pix
+        self.images_path = os.path.join(os.path.expanduser("~"), f"{name}Data", "Images")
+        self.analyzed = {}
+        self.queued = {}
         self.get_pixel_scale()
         self.get_limits()
+
+    def data_paths(self, now, grace=tdelta(0, 15*60)):
+        '''
+        Return (date_string, path) for the nightly directories to scan.  For
+        a while after 00:00 UT the previous night's directory is still
+        scanned so that frames written around the rollover are not missed.
+        '''
+        paths = []
+        for date in [now - grace, now]:
+            date_string = date.strftime("%Y%m%dUT")
+            if date_string not in [p[0] for p in paths]:
+                paths.append((date_string, os.path.join(self.images_path, date_string)))
+        return paths
     
     def get_pixel_scale(self):
         if self.name == 'V20':
@@ -58,6 +91,126 @@ class Telescope(object):
             self.pointing_error_limit = None
 
 
+##-------------------------------------------------------------------------
+## File System Events
+##-------------------------------------------------------------------------
+class NewImageHandler(FileSystemEventHandler):
+    '''
+    Set new_image when an image file matching match is written or renamed
+    into a watched directory.
+    '''
+    def __init__(self, match):
+        self.match = match
+        self.new_image = threading.Event()
+
+    def check(self, path):
+        if self.match.match(os.path.basename(path)):
+            self.new_image.set()
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.check(event.src_path)
+
+    def on_closed(self, event):
+        if not event.is_directory:
+            self.check(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.check(event.dest_path)
+
+    def clear(self):
+        '''
+        Forget the new images seen so far.  Called before each scan, so an
+        image which arrives during the scan still ends the next wait.
+        '''
+        self.new_image.clear()
+
+    def wait(self, timeout):
+        '''
+        Wait up to timeout seconds for a new image.
+        '''
+        self.new_image.wait(timeout)
+
+
+##-------------------------------------------------------------------------
+## Scan a Telescope's Nightly Directories
+##-------------------------------------------------------------------------
+MatchFilename = re.compile("(.*)\-([0-9]{8})at([0-9]{6})\.fts")
+MatchEmpty = re.compile(".*\-Empty\-.*\.fts")
+
+def scan_telescope(tel, now, images, tracker, queue, logger):
+    '''
+    Triage new, completely written files in the telescope's nightly
+    directories and queue those which need the full analysis.  Returns the
+    number of files which are still being written.
+    '''
+    nwriting = 0
+    for date_string, DataPath in tel.data_paths(now):
+        logger.debug('Examining directory {}'.format(DataPath))
+        ## Look for files
+        if os.path.exists(DataPath):
+            files = os.listdir(DataPath)
+        else:
+            files = []
+        logger.debug('  Found {} files'.format(len(files)))
+        ## Seed the set of analyzed files once per night with a single query.
+        ## Header only entries of frames which still need the full analysis
+        ## (queued, in flight or failed before a restart) do not count.
+        if date_string not in tel.analyzed.keys():
+            candidates = [f for f in files if MatchFilename.match(f)]
+            tel.analyzed[date_string] = set([x['filename'] for x in
+                            images.find({'filename': {'$in': candidates},
+                                         '$or': [{'analyzed': True},
+                                                 {'triage': {'$ne': 'analyze'}}]},
+                                        projection={'filename': True, '_id': False})])
+            logger.debug('  {} files already analyzed'.format(len(tel.analyzed[date_string])))
+        analyzed = tel.analyzed[date_string]
+        ## Triage new files once they are completely written, then queue
+        ## those which need the full analysis
+        for file in files:
+            IsMatch = MatchFilename.match(file)
+            IsEmpty = MatchEmpty.match(file)
+            path = os.path.join(DataPath, file)
+            if IsMatch and not IsEmpty and file not in analyzed\
+               and path not in tel.queued.keys():
+                if not tracker.is_complete(path):
+                    nwriting += 1
+                    continue
+                try:
+                    image_info, needs_analysis = triage_image(path)
+                except:
+                    ## Let the full analysis decide what to do with the frame
+                    logger.warning('  Triage failed on {}, analyzing it'.format(file))
+                    logger.error(sys.exc_info())
+                    image_info, needs_analysis = None, True
+                if needs_analysis:
+                    logger.info('  Queueing {}'.format(file))
+                    tel.queued[path] = date_string
+                    queue.put(path, IsMatch.group(2)+IsMatch.group(3), group=tel.name)
+                else:
+                    analyzed.add(file)
+                    logger.info('  Skipping analysis of {} ({})'.format(file, image_info.triage))
+    ## Forget nights which are no longer being scanned
+    current = [date_string for date_string, DataPath in tel.data_paths(now)]
+    for date_string in list(tel.analyzed.keys()):
+        if date_string not in current:
+            tel.analyzed.pop(date_string)
+    return nwriting
+
+
+def finish_analysis(tels, path):
+    '''
+    Move a file whose analysis has finished from the queued files to the
+    analyzed files of its night.  Failed files are moved too so they are not
+    retried until the watcher is restarted.
+    '''
+    for tel in tels:
+        date_string = tel.queued.pop(path, None)
+        if date_string is not None and date_string in tel.analyzed.keys():
+            tel.analyzed[date_string].add(os.path.basename(path))
+
+
 def main():
     ##-------------------------------------------------------------------------
     ## Parse Command Line Arguments
@@ -68,13 +221,21 @@ def main():
     parser.add_argument("-v", "--verbose",
         action="store_true", dest="verbose",
         default=False, help="Be verbose! (default = False)")
+    parser.add_argument("-s", "--server",
+        action="store_true", dest="server",
+        default=False, help="Submit images to a running analysis_server.")
+    parser.add_argument("-p", "--poll",
+        action="store_true", dest="poll",
+        default=False, help="Poll the directory instead of using file system events.")
+    parser.add_argument("-w", "--workers",
+        dest="workers", required=False, default=2, type=int,
+        help="Number of images to analyze at once (default = 2)")
     ## add arguments
     parser.add_argument("-t", "--telescope",
-        dest="telescope", required=True, type=str,
-        choices=["V5", "V20"],
-        help="Telescope which took the data ('V5' or 'V20')")
+        dest="telescopes", required=False, type=str, nargs='+',
+        choices=["V5", "V20"], default=["V5", "V20"],
+        help="Telescopes to watch ('V5' and/or 'V20', default = both)")
     args = parser.parse_args()
-    telescope = args.telescope
 
     ##-------------------------------------------------------------------------
     ## Create Logger Object
@@ -90,63 +251,103 @@ def main():
     LogFormat = logging.Formatter('%(asctime)23s %(levelname)8s: %(message)s')
     LogConsoleHandler.setFormatter(LogFormat)
     logger.addHandler(LogConsoleHandler)
-    ## Set up file output
+    ## Set up file output, one log file (and child logger) per telescope
     LogFileName = 'watch_directory.txt'
-    LogFile = os.path.join('/', 'var', 'www', 'logs', telescope, LogFileName)
-    LogFileHandler = logging.FileHandler(LogFile)
-    LogFileHandler.setLevel(logging.DEBUG)
-    LogFileHandler.setFormatter(LogFormat)
-    logger.addHandler(LogFileHandler)
+    tel_loggers = {}
+    for telescope in args.telescopes:
+        tel_logger = logging.getLogger(f'watch_directory.{telescope}')
+        tel_logger.setLevel(logging.DEBUG)
+        LogFile = os.path.join('/', 'var', 'www', 'logs', telescope, LogFileName)
+        LogFileHandler = logging.FileHandler(LogFile)
+        LogFileHandler.setLevel(logging.DEBUG)
+        LogFileHandler.setFormatter(LogFormat)
+        tel_logger.addHandler(LogFileHandler)
+        tel_loggers[telescope] = tel_logger
 
     ##-------------------------------------------------------------------------
     ## Telescope Configuration
     ##-------------------------------------------------------------------------
-    tel = Telescope(telescope)
-    client = MongoClient(tel.mongo_address, tel.mongo_port)
-    db = client[tel.mongo_db]
-    images = db[tel.mongo_collection]
+    ## All telescopes share one database connection and one worker pool
+    tels = [Telescope(telescope) for telescope in args.telescopes]
+    client = MongoClient(tels[0].mongo_address, tels[0].mongo_port)
+    db = client[tels[0].mongo_db]
+    images = db[tels[0].mongo_collection]
+    me.connect(tels[0].mongo_db, host=tels[0].mongo_address, port=tels[0].mongo_port)
+    if args.server and not server_is_running():
+        logger.warning('No analysis_server is running, submissions will fail')
 
     ##-------------------------------------------------------------------------
     ## Operation Loop
     ##-------------------------------------------------------------------------
     Operate = True
-    MatchFilename = re.compile("(.*)\-([0-9]{8})at([0-9]{6})\.fts")
-    MatchEmpty = re.compile(".*\-Empty\-.*\.fts")
+
+    ## Watch each Images directory (and the nightly directories created in
+    ## it) for new files.  Without file system events fall back to polling.
+    handler = None
+    if not args.poll and Observer is not None:
+        handler = NewImageHandler(MatchFilename)
+        observer = Observer()
+        for tel in tels:
+            if os.path.exists(tel.images_path):
+                observer.schedule(handler, tel.images_path, recursive=True)
+                logger.info('Watching {} for new files'.format(tel.images_path))
+        observer.start()
+    else:
+        logger.info('File system events unavailable, polling every 30 s')
+
+    tracker = CompletionTracker()
+    if args.server:
+        executor = ThreadPoolExecutor(max_workers=args.workers)
+        analyze = partial(submit_image, nographics=True)
+    else:
+        executor = ProcessPoolExecutor(max_workers=args.workers,
+                                       mp_context=worker_context,
+                                       initializer=init_worker)
+        analyze = measure_in_worker
+    queue = IngestQueue(executor, analyze, args.workers)
     while Operate:
-        ## Set date to tonight
+        if handler is not None:
+            handler.clear()
         now = dt.utcnow()
-        date_string = now.strftime("%Y%m%dUT")
-        DataPath = os.path.join(os.path.expanduser("~"), f"{args.telescope}Data", "Images", date_string)
-        
-        logger.info('Examining directory {}'.format(DataPath))
-        ## Look for files
-        if os.path.exists(DataPath):
-            files = os.listdir(DataPath)
+        nwriting = 0
+        for tel in tels:
+            nwriting += scan_telescope(tel, now, images, tracker, queue,
+                                       tel_loggers[tel.name])
+        queue.dispatch()
+
+        ## Record finished analyses
+        for path, result in queue.collect():
+            tel_logger = logger
+            for tel in tels:
+                if path in tel.queued.keys():
+                    tel_logger = tel_loggers[tel.name]
+            if result is None:
+                tel_logger.warning('  MeasureImage failed on {}.'.format(path))
+            elif not args.server:
+                file, pid, elapsed, image_info, cached = result
+                if image_info is None:
+                    tel_logger.warning('  MeasureImage failed on {}.'.format(path))
+                elif not cached:
+                    record_image(image_info, tel_logger)
+            finish_analysis(tels, path)
+        try:
+            results_sink.flush()
+        except:
+            logger.warning('  Failed to write results, will retry')
+            logger.error(sys.exc_info())
+        if queue.busy():
+            logger.info('  {}'.format(queue.report()))
         else:
-            files = []
-        logger.info('  Found {} files'.format(len(files)))
-        time.sleep(1)
-        images_to_analyze = {}
-        for file in files:
-            IsMatch = MatchFilename.match(file)
-            IsEmpty = MatchEmpty.match(file)
-            if IsMatch and not IsEmpty:
-                analyzed = [x for x in images.find( {"filename" : file} )]
-                if (len(analyzed) == 0):
-                    target = IsMatch.group(1)
-                    filetime = IsMatch.group(3)
-                    images_to_analyze[filetime] = file
-        logger.debug('  Found {} files to analyze'.format(len(images_to_analyze)))
-        for filetime in sorted(images_to_analyze.keys()):
-            file = images_to_analyze[filetime]
-            try:
-                measure_image(os.path.join(DataPath, file), nographics=True)
-            except:
-                logger.warning('  MeasureImage failed on {}.'.format(file))
-                logger.error(sys.exc_info())
-
-        time.sleep(30)
+            logger.debug('  {}'.format(queue.report()))
 
+        if nwriting > 0 or queue.busy():
+            ## Check back soon for files being written and finished analyses
+            time.sleep(2)
+        elif handler is not None:
+            ## Rescan on each new image, or every 10 minutes regardless
+            handler.wait(600)
+        else:
+            time.sleep(30)
 
 if __name__ == "__main__":
     main()
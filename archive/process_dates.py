@@ -14,10 +14,12 @@ from pymongo import MongoClient
 
 import measure_image
 import make_nightly_plots
+from analysis_server import submit_image
 
 import IQMon
 
-def main(startdate, enddate, logger, nice=False, skip=False):
+def main(startdate, enddate, logger, nice=False, skip=False, server=False,
+         force=False):
     if startdate > enddate:
         oneday = tdelta(-1, 0)
     else:
@@ -136,18 +138,17 @@ def main(startdate, enddate, logger, nice=False, skip=False):
                     sunrise = Observatory.next_rising(ephem.Sun()).datetime()
                     logger.info('Resuming processing ...')
                     logger.info('  Next sunset at {}'.format(sunset.strftime('%Y/%m/%d %H:%M:%S')))
-            if MatchFilename.match(image) and not MatchEmpty.match(image):
+            if server and MatchFilename.match(image) and not MatchEmpty.match(image):
                 try:
-                    measure_image.MeasureImage(image,\
-                                 clobber_logs=True,\
-                                 zero_point=True,\
-                                 analyze_image=True)
+                    submit_image(image, nographics=True, force=force)
+                except RuntimeError:
+                    logger.warning('MeasureImage failed on {}'.format(image))
+            elif MatchFilename.match(image) and not MatchEmpty.match(image):
+                try:
+                    measure_image.measure_image(image, nographics=True,
+                                                force=force)
                 except:
                     logger.warning('MeasureImage failed on {}'.format(image))
-                    measure_image.MeasureImage(image,\
-                                 clobber_logs=False,\
-                                 zero_point=True,\
-                                 analyze_image=False)
         make_nightly_plots.make_plots(date_string, 'V5', logger)
         make_nightly_plots.make_plots(date_string, 'V20', logger)
         if date == enddate:
@@ -173,6 +174,12 @@ if __name__ == "__main__":
     parser.add_argument("--skip",
         action="store_true", dest="skip",
         default=False, help="Skip images already in mongo db.")
+    parser.add_argument("--server",
+        action="store_true", dest="server",
+        default=False, help="Submit images to a running analysis_server.")
+    parser.add_argument("--force",
+        action="store_true", dest="force",
+        default=False, help="Reanalyze images even if an unchanged result is recorded.")
 #     parser.add_argument("--revise",
 #         action="store_true", dest="revise",
 #         default=False, help="Reprocess images if IQMon version is newer.")
@@ -212,4 +219,5 @@ if __name__ == "__main__":
     startdate = dt.strptime(args.start, '%Y%m%dUT')
     enddate = dt.strptime(args.end, '%Y%m%dUT')
 
-    main(startdate, enddate, logger, nice=args.nice, skip=args.skip)
+    main(startdate, enddate, logger, nice=args.nice, skip=args.skip,
+         server=args.server, force=args.force)
@@ -10,8 +10,11 @@ from datetime import datetime as dt
 from datetime import timedelta as tdelta
 
 from astropy import units as u
-import ephem
-from VYSOS import weather_limits, styles
+from VYSOS import styles
+from VYSOS.conditions import describe
+from VYSOS.rollups import fetch_series
+from VYSOS.current import read_current
+from VYSOS.ephemeris import sun_and_moon
 
 ##-------------------------------------------------------------------------
 ## Define App
@@ -61,10 +64,17 @@ def free_space(path):
 ##-------------------------------------------------------------------------
 def retrieve_weather(lookbackdays=0):
     delta_time = tdelta(lookbackdays, 120)
+    now = dt.utcnow()
     client = pymongo.MongoClient('192.168.1.101', 27017)
     db = client.vysos
-    weather = db.weather
-    weatherdata = [x for x in weather.find( {"date": {"$gt": dt.utcnow()-delta_time} } )]
+    resolution, weatherdata = fetch_series(db, 'weather', now-delta_time, now)
+    client.close()
+    return weatherdata
+
+
+def retrieve_current_weather():
+    client = pymongo.MongoClient('192.168.1.101', 27017)
+    weatherdata = read_current(client.vysos, 'weather')
     client.close()
     return weatherdata
 
@@ -72,66 +82,18 @@ def retrieve_weather(lookbackdays=0):
 ## Determine Conditions from Weather Data
 ##-------------------------------------------------------------------------
 def get_conditions(weatherdata):
-    condition = {}
-    color = {}
-
-    # Determine Cloud Condition String
-    if weatherdata['clouds'] < weather_limits['Cloudiness (C)'][0]:
-        condition['cloud'] = 'Clear'
-        color['cloud'] = 'green'
-    elif weatherdata['clouds'] >= weather_limits['Cloudiness (C)'][0]\
-     and weatherdata['clouds'] < weather_limits['Cloudiness (C)'][1]:
-        condition['cloud'] = 'Cloudy'
-        color['cloud'] = 'yellow'
-    elif weatherdata['clouds'] >= weather_limits['Cloudiness (C)'][1]:
-        condition['cloud'] = 'Overcast'
-        color['cloud'] = 'red'
-    else:
-        condition['cloud'] = 'Unknown'
-        color['cloud'] = 'red'
-
-    # Determine Wind Condition String
-    if weatherdata['wind'] < weather_limits['Wind (kph)'][0]:
-        condition['wind'] = 'Calm'
-        color['wind'] = 'green'
-    elif weatherdata['wind'] >= weather_limits['Wind (kph)'][0]\
-     and weatherdata['wind'] < weather_limits['Wind (kph)'][1]:
-        condition['wind'] = 'Windy'
-        color['wind'] = 'yellow'
-    elif weatherdata['wind'] >= weather_limits['Wind (kph)'][1]:
-        condition['wind'] = 'Very Windy'
-        color['wind'] = 'red'
-    else:
-        condition['wind'] = 'Unknown'
-        color['wind'] = 'red'
-
-    # Determine Gust Condition String
-    if weatherdata['gust'] < weather_limits['Wind (kph)'][0]:
-        condition['gust'] = 'Calm'
-        color['gust'] = 'green'
-    elif weatherdata['gust'] >= weather_limits['Wind (kph)'][0]\
-     and weatherdata['gust'] < weather_limits['Wind (kph)'][1]:
-        condition['gust'] = 'Windy'
-        color['gust'] = 'yellow'
-    elif weatherdata['gust'] >= weather_limits['Wind (kph)'][1]:
-        condition['gust'] = 'Very Windy'
-        color['gust'] = 'red'
-    else:
-        condition['gust'] = 'Unknown'
-        color['gust'] = 'red'
-
-    # Determine Rain Condition String
-    if weatherdata['rain'] > weather_limits['Rain'][0]:
-        condition['rain'] = 'Dry'
-        color['rain'] = 'green'
-    elif weatherdata['rain'] <= weather_limits['Rain'][0]:
-        condition['rain'] = 'Wet'
-        color['rain'] = 'red'
-    else:
-        condition['rain'] = 'Unknown'
-        color['rain'] = 'red'
+    return describe(weatherdata)
+
 
-    return condition, color
+def format_weather(weatherdata, field, format):
+    '''
+    Return format(value) for the value of field, or 'no data' if there is no
+    current value.
+    '''
+    try:
+        return format(float(weatherdata[field]))
+    except (KeyError, TypeError, ValueError):
+        return 'no data'
 
 
 ##-------------------------------------------------------------------------
@@ -143,9 +105,9 @@ def retrieve_telstatus(telescope):
 
     telstatus = {}
     for telescope in ['V20', 'V5']:
-        results = db[f'{telescope}status'].find(limit=1, sort=[('date', pymongo.DESCENDING)])
-        if results.count() > 0:
-            telstatus[telescope] = results.next()
+        current = read_current(db, f'{telescope}status')
+        if current is not None:
+            telstatus[telescope] = current
             try:
                 if telstatus[telescope]['slewing'] is True:
                     telstatus[telescope]['status'] = 'Slewing'
@@ -190,50 +152,10 @@ def retrieve_telstatus(telescope):
 
 
 ##------------------------------------------------------------------------
-## Use pyephem determine sunrise and sunset times
+## Get sun and moon status
 ##------------------------------------------------------------------------
 def update_astronomy():
-    nowut = dt.utcnow()
-    Observatory = ephem.Observer()
-    Observatory.lon = "-155:34:33.9"
-    Observatory.lat = "+19:32:09.66"
-    Observatory.elevation = 3400.0
-    Observatory.temp = 10.0
-    Observatory.pressure = 680.0
-    Observatory.horizon = '0.0'
-
-    Observatory.date = nowut
-    TheSun = ephem.Sun()
-    TheSun.compute(Observatory)
-    sun = {}
-    sun['alt'] = float(TheSun.alt) * 180. / ephem.pi
-    sun['set'] = Observatory.next_setting(TheSun).datetime()
-    sun['rise'] = Observatory.next_rising(TheSun).datetime()
-    if sun['alt'] <= -18:
-        sun['now'] = 'night'
-    elif sun['alt'] > -18 and sun['alt'] <= -12:
-        sun['now'] = 'astronomical twilight'
-    elif sun['alt'] > -12 and sun['alt'] <= -6:
-        sun['now'] = 'nautical twilight'
-    elif sun['alt'] > -6 and sun['alt'] <= 0:
-        sun['now'] = 'civil twilight'
-    elif sun['alt'] > 0:
-        sun['now'] = 'day'
-
-    TheMoon = ephem.Moon()
-    Observatory.date = nowut
-    TheMoon.compute(Observatory)
-    moon = {}
-    moon['phase'] = TheMoon.phase
-    moon['alt'] = TheMoon.alt * 180. / ephem.pi
-    moon['set'] = Observatory.next_setting(TheMoon).datetime()
-    moon['rise'] = Observatory.next_rising(TheMoon).datetime()
-    if moon['alt'] > 0:
-        moon['now'] = 'up'
-    else:
-        moon['now'] = 'down'
-
-    return sun, moon
+    return sun_and_moon()
 
 
 ##-------------------------------------------------------------------------
@@ -247,12 +169,20 @@ def update_astronomy():
 def generate_weather_table():
     now = dt.now()
     nowut = now + tdelta(0, 10*60*60)
-    weatherdata = retrieve_weather(lookbackdays=0)[-1]
+    weatherdata = retrieve_current_weather()
+    if weatherdata is None:
+        ## No current weather, the table shows no data
+        weatherdata = {}
     condition, color = get_conditions(weatherdata)
-    weather_data_age = (nowut - weatherdata['date']).total_seconds()
-    if weather_data_age < 60:
-        weather_str = {True: 'Safe', False: 'Unsafe'}[weatherdata['safe']]
-        if weatherdata['safe'] is True:
+    if 'date' in weatherdata.keys():
+        weather_data_age = (nowut - weatherdata['date']).total_seconds()
+        weather_age_str = '{:.1f}s'.format(weather_data_age)
+    else:
+        weather_data_age = None
+        weather_age_str = 'no data'
+    if weather_data_age is not None and weather_data_age < 60:
+        weather_str = {True: 'Safe', False: 'Unsafe'}[weatherdata.get('safe', False) is True]
+        if weatherdata.get('safe', False) is True:
             weather_status = html.Span(weather_str, style={'color': 'green'})
         else:
             weather_status = html.Span(weather_str, style={'color': 'red'})
@@ -302,7 +232,7 @@ def generate_weather_table():
                     html.Tr([
                              html.Td(now.strftime('%Y/%m/%d %H:%M:%S HST'), style=styles['tdl']),
                              html.Td('Ambient Temperature', style=styles['tdr']),
-                             html.Td(f"{weatherdata['temp']:.1f} C, {weatherdata['temp']*1.8+32.:.1f} F", style=styles['tdl']),
+                             html.Td(format_weather(weatherdata, 'temp', lambda x: f"{x:.1f} C, {x*1.8+32.:.1f} F"), style=styles['tdl']),
                              html.Td([html.Span('MLOData', style={'font-family': 'Courier, monospace'}),
                                       f": {disks['DroboPro'][1]:.0f}GB free ({disks['DroboPro'][2]:.0f}% full)"],  style=styles['tdr']),
                             ]),
@@ -310,7 +240,7 @@ def generate_weather_table():
                              html.Td(nowut.strftime('%Y/%m/%d %H:%M:%S UT'), style=styles['tdl']),
                              html.Td('Cloudiness', style=styles['tdr']),
                              html.Td([html.Span(condition['cloud'], style={'color': color['cloud']}),
-                                      html.Span(' ({0:.1f} F)'.format(weatherdata['clouds']*1.8+32.), style=styles['p']),
+                                      html.Span(format_weather(weatherdata, 'clouds', lambda x: ' ({0:.1f} F)'.format(x*1.8+32.)), style=styles['p']),
                                      ], style=styles['tdl']),
                              html.Td([html.Span('DataCopy', style={'font-family': 'Courier, monospace'}),
                                       f": {disks['Drobo'][1]:.0f}GB free ({disks['Drobo'][2]:.0f}% full)"],  style=styles['tdr']),
@@ -319,7 +249,7 @@ def generate_weather_table():
                              html.Td(f"It is currently {sun['now']} (Sun alt = {sun['alt']:.0f})", style=styles['tdl']),
                              html.Td('Wind Speed', style=styles['tdr']),
                              html.Td([html.Span(condition['wind'], style={'color': color['wind']}),
-                                      html.Span(' ({0:.1f} kph)'.format(weatherdata['wind']), style=styles['p']),
+                                      html.Span(format_weather(weatherdata, 'wind', lambda x: ' ({0:.1f} kph)'.format(x)), style=styles['p']),
                                      ], style=styles['tdl']),
                              html.Td([html.Span('macOS', style={'font-family': 'Courier, monospace'}),
                                       f": {disks['macOS'][1]:.0f}GB free ({disks['macOS'][2]:.0f}% full)"],  style=styles['tdr']),
@@ -328,7 +258,7 @@ def generate_weather_table():
                              html.Td(f"A {moon['phase']:.0f}% illuminated moon is {moon['now']}", style=styles['tdl']),
                              html.Td('Gusts', style=styles['tdr']),
                              html.Td([html.Span(condition['gust'], style={'color': color['gust']}),
-                                      html.Span(' ({0:.1f} kph)'.format(weatherdata['gust']), style=styles['p']),
+                                      html.Span(format_weather(weatherdata, 'gust', lambda x: ' ({0:.1f} kph)'.format(x)), style=styles['p']),
                                      ], style=styles['tdl']),
                              html.Td('',  style=styles['tdr']),
                             ]),
@@ -336,14 +266,14 @@ def generate_weather_table():
                              html.Td(sunstrings[0], style=styles['tdl']),
                              html.Td('Rain', style=styles['tdr']),
                              html.Td([html.Span(condition['rain'], style={'color': color['rain']}),
-                                      html.Span(' ({0:.0f})'.format(weatherdata['rain']), style=styles['p']),
+                                      html.Span(format_weather(weatherdata, 'rain', lambda x: ' ({0:.0f})'.format(x)), style=styles['p']),
                                      ], style=styles['tdl']),
                              html.Td('',  style=styles['tdr']),
                             ]),
                     html.Tr([
                              html.Td(sunstrings[1], style=styles['tdl']),
                              html.Td('Weather Data Age', style=styles['tdr']),
-                             html.Td('{:.1f}s'.format(weather_data_age), style=styles['tdl']),
+                             html.Td(weather_age_str, style=styles['tdl']),
                              html.Td('',  style=styles['tdr']),
                             ]),
                     html.Tr([
@@ -0,0 +1,100 @@
+'''
+Tests of the status collector using fake devices in place of the ASCOM
+objects, so they run without Windows or a database.
+'''
+
+import time
+import logging
+
+import pytest
+
+from VYSOS.get_status import StatusCollector
+
+
+class FakeTelescope(object):
+    Connected = True
+    AtPark = False
+    Slewing = False
+    Tracking = True
+    Altitude = 45.0
+    Azimuth = 180.0
+    TargetRightAscension = 1.0
+    TargetDeclination = 20.0
+
+
+class FakeFocuser(object):
+    Link = True
+    Position = 1000
+
+    @property
+    def Temperature(self):
+        return 12.0
+
+
+class SlowFocuser(FakeFocuser):
+    @property
+    def Temperature(self):
+        time.sleep(0.5)
+        return 12.0
+
+
+def make_collector(monkeypatch, tmp_path, devices, deadline=0.2):
+    '''
+    Return a V5 StatusCollector whose dispatch returns devices[progid], or
+    fails if devices[progid] is None.
+    '''
+    monkeypatch.setenv('HOME', str(tmp_path))
+    def dispatch(progid):
+        if devices[progid] is None:
+            raise OSError(f'{progid} unavailable')
+        return devices[progid]
+    collector = StatusCollector('V5', logging.getLogger('test_get_status'),
+                                dispatch=dispatch)
+    for reader in collector.readers:
+        reader.deadline = deadline
+    return collector
+
+
+def test_all_devices_respond(monkeypatch, tmp_path):
+    collector = make_collector(monkeypatch, tmp_path,
+                               {'ACP.Telescope': FakeTelescope(),
+                                'FocusMax.Focuser': FakeFocuser()})
+    status = collector.get_status()
+    assert status['alt'] == 45.0
+    assert status['focuser_position'] == 1000
+    assert 'stale' not in status.keys()
+
+
+def test_slow_device_is_stale(monkeypatch, tmp_path):
+    collector = make_collector(monkeypatch, tmp_path,
+                               {'ACP.Telescope': FakeTelescope(),
+                                'FocusMax.Focuser': SlowFocuser()})
+    start = time.time()
+    status = collector.get_status()
+    assert time.time() - start < 0.45
+    assert status['alt'] == 45.0
+    assert status['stale'] == {'FocusMax': None}
+
+
+def test_unreachable_device_keeps_last_values(monkeypatch, tmp_path):
+    devices = {'ACP.Telescope': FakeTelescope(),
+               'FocusMax.Focuser': None}
+    collector = make_collector(monkeypatch, tmp_path, devices)
+    status = collector.get_status()
+    assert status['stale'] == {'FocusMax': None}
+
+    devices['FocusMax.Focuser'] = FakeFocuser()
+    status = collector.get_status()
+    assert status['focuser_position'] == 1000
+    assert 'stale' not in status.keys()
+
+    ## The handle fails its health check and can not be dispatched again
+    del FakeFocuser.Link
+    try:
+        devices['FocusMax.Focuser'] = None
+        status = collector.get_status()
+    finally:
+        FakeFocuser.Link = True
+    assert status['focuser_position'] == 1000
+    assert 'FocusMax' not in status['stale'].keys()
+    assert status['stale']['focuser_position'] is not None
@@ -18,10 +18,11 @@ import tornado.log as tlog
 
 from astropy import units as u
 from astropy.coordinates import SkyCoord
-import ephem
 
 import IQMon
 from VYSOS import weather_limits
+from VYSOS.current import read_current
+from VYSOS.ephemeris import sun_and_moon
 
 
 ##-------------------------------------------------------------------------
@@ -97,46 +98,9 @@ class Status(RequestHandler):
         db = client['vysos']
 
         ##------------------------------------------------------------------------
-        ## Use pyephem determine sunrise and sunset times
+        ## Get sun and moon status
         ##------------------------------------------------------------------------
-        Observatory = ephem.Observer()
-        Observatory.lon = "-155:34:33.9"
-        Observatory.lat = "+19:32:09.66"
-        Observatory.elevation = 3400.0
-        Observatory.temp = 10.0
-        Observatory.pressure = 680.0
-        Observatory.horizon = '0.0'
-
-        Observatory.date = nowut
-        TheSun = ephem.Sun()
-        TheSun.compute(Observatory)
-        sun = {}
-        sun['alt'] = float(TheSun.alt) * 180. / ephem.pi
-        sun['set'] = Observatory.next_setting(TheSun).datetime()
-        sun['rise'] = Observatory.next_rising(TheSun).datetime()
-        if sun['alt'] <= -18:
-            sun['now'] = 'night'
-        elif sun['alt'] > -18 and sun['alt'] <= -12:
-            sun['now'] = 'astronomical twilight'
-        elif sun['alt'] > -12 and sun['alt'] <= -6:
-            sun['now'] = 'nautical twilight'
-        elif sun['alt'] > -6 and sun['alt'] <= 0:
-            sun['now'] = 'civil twilight'
-        elif sun['alt'] > 0:
-            sun['now'] = 'day'
-
-        TheMoon = ephem.Moon()
-        Observatory.date = nowut
-        TheMoon.compute(Observatory)
-        moon = {}
-        moon['phase'] = TheMoon.phase
-        moon['alt'] = TheMoon.alt * 180. / ephem.pi
-        moon['set'] = Observatory.next_setting(TheMoon).datetime()
-        moon['rise'] = Observatory.next_rising(TheMoon).datetime()
-        if moon['alt'] > 0:
-            moon['now'] = 'up'
-        else:
-            moon['now'] = 'down'
+        sun, moon = sun_and_moon(nowut)
 
         tlog.app_log.info('  Ephem data calculated')
 
@@ -161,10 +125,9 @@ class Status(RequestHandler):
         ##---------------------------------------------------------------------
         telstatus = {}
         for telescope in ['V20', 'V5']:
-            results = db[f'{telescope}status'].find(limit=1, sort=[('date', pymongo.DESCENDING)])
-            tlog.app_log.info(results.count())
-            if results.count() > 0:
-                telstatus[telescope] = results.next()
+            current = read_current(db, f'{telescope}status')
+            if current is not None:
+                telstatus[telescope] = current
                 
                 if 'RA' in telstatus[telescope] and 'DEC' in telstatus[telescope]:
                     coord = SkyCoord(telstatus[telescope]['RA'],
@@ -179,11 +142,7 @@ class Status(RequestHandler):
         ##---------------------------------------------------------------------
         ## Get Current Weather
         ##---------------------------------------------------------------------
-        weather = client.vysos['weather']
-        if weather.count() > 0:
-            cw = weather.find(limit=1, sort=[('date', pymongo.DESCENDING)]).next()
-        else:
-            cw = None
+        cw = read_current(db, 'weather')
         
         
         ##---------------------------------------------------------------------